@@ -0,0 +1,56 @@
+# Copyright 2011-2017 Kwant authors.
+#
+# This file is part of Kwant.  It is subject to the license terms in the file
+# LICENSE.rst found in the top-level directory of this distribution and at
+# http://kwant-project.org/license.  A list of Kwant authors can be found in
+# the file AUTHORS.rst at the top-level directory of this distribution and at
+# http://kwant-project.org/authors.
+
+"""Compare the RGF solver with the default solver for growing wire lengths.
+
+Usage: python rgf_vs_default.py [width]
+
+For each length, the time to compute the scattering matrix of a
+two-dimensional wire is printed for both solvers.  The RGF solver scales
+linearly with the length, and its memory usage does not depend on it.  The
+default solver (MUMPS, if available) is faster for short and wide systems.
+"""
+
+import sys
+import time
+import kwant
+from kwant.solvers import default, rgf
+
+
+def make_wire(width, length):
+    lat = kwant.lattice.square()
+    syst = kwant.Builder()
+    syst[(lat(x, y) for x in range(length) for y in range(width))] = 4
+    syst[lat.neighbors()] = -1
+    lead = kwant.Builder(kwant.TranslationalSymmetry((-1, 0)))
+    lead[(lat(0, y) for y in range(width))] = 4
+    lead[lat.neighbors()] = -1
+    syst.attach_lead(lead)
+    syst.attach_lead(lead.reversed())
+    return syst.finalized()
+
+
+def timed(smatrix, syst, repeat=3):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        smatrix(syst, 0.5)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main(width=20):
+    print('{:>8} {:>12} {:>12}'.format('length', 'default [s]', 'rgf [s]'))
+    for length in [10, 30, 100, 300, 1000, 3000]:
+        syst = make_wire(width, length)
+        print('{:8d} {:12.4f} {:12.4f}'.format(
+            length, timed(default.smatrix, syst), timed(rgf.smatrix, syst)))
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
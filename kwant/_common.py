@@ -11,6 +11,7 @@ import os
 import numpy as np
 import numbers
 import inspect
+from collections import OrderedDict, namedtuple
 
 __all__ = ['version', 'KwantDeprecationWarning', 'UserCodeError']
 
@@ -178,3 +179,73 @@ def get_parameters(func):
     takes_kwargs = any(i.kind is inspect.Parameter.VAR_KEYWORD
                        for i in pars.values())
     return names, takes_kwargs
+
+
+CacheInfo = namedtuple('CacheInfo', ['hits', 'misses', 'maxsize', 'currsize'])
+
+
+class LRUCache:
+    """Mapping that keeps a limited number of the most recently used items.
+
+    Unlike `functools.lru_cache`, instances are independent of any function,
+    can be resized, and are pickled empty.
+
+    Parameters
+    ----------
+    maxsize : int
+        Maximal number of items that are kept.  0 disables caching.
+    """
+
+    def __init__(self, maxsize=16):
+        self._data = OrderedDict()
+        self.hits = self.misses = 0
+        self.resize(maxsize)
+
+    def __getstate__(self):
+        return self.maxsize
+
+    def __setstate__(self, maxsize):
+        self.__init__(maxsize)
+
+    def __len__(self):
+        return len(self._data)
+
+    def resize(self, maxsize):
+        maxsize = int(maxsize)
+        if maxsize < 0:
+            raise ValueError("Cache size must be non-negative.")
+        self.maxsize = maxsize
+        while len(self._data) > maxsize:
+            self._data.popitem(last=False)
+
+    def clear(self):
+        """Remove all items and reset the statistics."""
+        self._data.clear()
+        self.hits = self.misses = 0
+
+    def info(self):
+        """Return a `CacheInfo` with the statistics of the cache."""
+        return CacheInfo(self.hits, self.misses, self.maxsize,
+                         len(self._data))
+
+    def get(self, key, compute):
+        """Return the value for `key`, calling `compute()` if it is missing.
+
+        If `key` is ``None``, the value is computed but not cached.
+        """
+        if key is not None:
+            try:
+                value = self._data[key]
+            except KeyError:
+                pass
+            else:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return value
+        self.misses += 1
+        value = compute()
+        if key is not None and self.maxsize:
+            self._data[key] = value
+            if len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+        return value
@@ -286,6 +286,17 @@ def hamiltonian_submatrix(self, args=(), to_sites=None, from_sites=None,
     n = self.graph.num_nodes
     matrix = ta.matrix
 
+    # Systems may keep the evaluated full Hamiltonian and only update the
+    # parts that have changed.
+    cached = None
+    if to_sites is from_sites is None:
+        cached = getattr(self, '_cached_hamiltonian', None)
+    if cached is not None:
+        mat, norb = cached(args, params=params)
+        if not sparse:
+            mat = mat.toarray()
+        return (mat, norb, norb) if return_norb else mat
+
     if from_sites is None:
         diag = n * [None]
         from_norb = np.empty(n, gint_dtype)
@@ -7,7 +7,8 @@
 # http://kwant-project.org/authors.
 
 __all__ = ['Builder', 'Site', 'SiteFamily', 'SimpleSiteFamily', 'Symmetry',
-           'HoppingKind', 'Lead', 'BuilderLead', 'SelfEnergyLead', 'ModesLead']
+           'HoppingKind', 'Lead', 'BuilderLead', 'SelfEnergyLead', 'ModesLead',
+           'SiteArray', 'vectorized']
 
 import abc
 import warnings
@@ -22,7 +23,7 @@ from scipy import sparse
 from . import system, graph, KwantDeprecationWarning, UserCodeError
 from .operator import Density
 from .physics import DiscreteSymmetry
-from ._common import ensure_isinstance, get_parameters
+from ._common import ensure_isinstance, get_parameters, LRUCache
 
 
 
@@ -223,6 +224,49 @@ class SimpleSiteFamily(SiteFamily):
         return tag
 
 
+class SiteArray:
+    """An array of sites belonging to the same site family.
+
+    Instances of this class are passed to vectorized value functions (see
+    `vectorized`) instead of individual `Site` instances.
+
+    Parameters
+    ----------
+    family : an instance of `SiteFamily`
+        The site family to which all the sites belong.
+    tags : sequence of tags
+        The tags of the sites.  They must already be normalized by ``family``.
+
+    Attributes
+    ----------
+    family : `SiteFamily`
+    tags : numpy.ndarray
+        Array of site tags, the first axis runs over the sites.
+    positions : numpy.ndarray
+        Array of real space site positions, the first axis runs over the
+        sites.  This relies on ``family`` having a ``pos`` method.
+    """
+
+    def __init__(self, family, tags):
+        self.family = family
+        self.tags = np.array(tags)
+        self._positions = None
+
+    def __len__(self):
+        return len(self.tags)
+
+    def __repr__(self):
+        return 'SiteArray({0}, {1})'.format(repr(self.family), repr(self.tags))
+
+    @property
+    def positions(self):
+        # Site positions never change, so they are computed only once.
+        if self._positions is None:
+            pos = self.family.pos
+            self._positions = np.array([pos(tag) for tag in self.tags], float)
+        return self._positions
+
+
 def validate_hopping(hopping):
     """Verify that the argument is a valid hopping."""
 
@@ -494,6 +538,67 @@ class HermConjOfFunc:
     def __call__(self, i, j, *args, **kwargs):
         return herm_conj(self.function(j, i, *args, **kwargs))
 
+
+################ Vectorized value functions
+
+def vectorized(func):
+    """Mark a value function as vectorized.
+
+    A vectorized onsite value function receives a `SiteArray` instead of a
+    single site, and a vectorized hopping value function receives two
+    `SiteArray` instances (the sites the hoppings point to, and the sites
+    the hoppings originate from).  All the sites in one array belong to the
+    same site family.  The remaining arguments are the same as for ordinary
+    value functions.
+
+    The function must return either an array of shape ``(N,)`` (one
+    number per site or hopping) or an array of shape ``(N, n, m)`` (one
+    ``n`` by ``m`` matrix per site or hopping), where ``N`` is the length
+    of the site arrays.
+
+    When the full Hamiltonian of a finalized system is requested (i.e.
+    `~kwant.system.System.hamiltonian_submatrix` is called without
+    ``to_sites`` and ``from_sites``), each vectorized value function is
+    called once per group of sites or hoppings with the same site families,
+    instead of once per site or hopping.  This can be much faster for large
+    systems.
+
+    Examples
+    --------
+    >>> @kwant.builder.vectorized
+    ... def onsite(sites, V):
+    ...     return 4 + V * sites.positions[:, 0]
+    """
+    func.vectorized = True
+    return func
+
+
+def _is_vectorized(value):
+    return getattr(value, 'vectorized', False) is True
+
+
+def _stacked(value, n):
+    """Return the result of a vectorized value function as a stack of
+    ``n`` complex matrices."""
+    value = np.asarray(value, complex)
+    if value.ndim < 2:
+        value = np.broadcast_to(value, (n,)).reshape(n, 1, 1)
+    elif value.ndim != 3 or value.shape[0] != n:
+        raise ValueError('A vectorized value function must return an array '
+                         'of shape (N,) or (N, n, m), where N is the number '
+                         'of sites or hoppings.')
+    return value
+
+
+def _unstacked(value):
+    """Return the single matrix of a vectorized value function result."""
+    return _stacked(value, 1)[0]
+
+
+def _site_array(site):
+    return SiteArray(site.family, [site.tag])
+
+
 
 ################ Leads
 
@@ -1514,6 +1619,40 @@ class Builder:
                 params = params[skip:]  # remove site argument(s)
                 _ham_param_map[ham] = (params, takes_kwargs)
 
+        #### Group the sites and hoppings with vectorized value functions
+        #### by value function and site families.
+        onsite_groups = collections.OrderedDict()
+        for site_id, ham in enumerate(onsite_hamiltonians):
+            if _is_vectorized(ham):
+                key = (ham, sites[site_id].family)
+                onsite_groups.setdefault(key, []).append(site_id)
+        hopping_groups = collections.OrderedDict()
+        for edge_id, (tail, head) in enumerate(g):
+            ham = hoppings[edge_id]
+            if _is_vectorized(ham):
+                key = (ham, sites[tail].family, sites[head].family)
+                hopping_groups.setdefault(key, []).append((tail, head))
+
+        if onsite_groups or hopping_groups:
+            vectorized_sites = np.zeros(g.num_nodes, bool)
+            vectorized_edges = np.zeros(g.num_edges, bool)
+            vectorized_terms = []
+            for (ham, fam), ids in onsite_groups.items():
+                ids = np.array(ids, int)
+                vectorized_sites[ids] = True
+                site_array = SiteArray(fam, [sites[i].tag for i in ids])
+                vectorized_terms.append((ham, (site_array,), ids, ids))
+            for (ham, fam_a, fam_b), hops in hopping_groups.items():
+                tails, heads = np.array(hops, int).T
+                for tail, head in hops:
+                    vectorized_edges[g.first_edge_id(tail, head)] = True
+                    vectorized_edges[g.first_edge_id(head, tail)] = True
+                site_arrays = (SiteArray(fam_a, [sites[i].tag for i in tails]),
+                               SiteArray(fam_b, [sites[i].tag for i in heads]))
+                vectorized_terms.append((ham, site_arrays, tails, heads))
+        else:
+            vectorized_sites = vectorized_edges = vectorized_terms = None
+
         #### Assemble and return result.
         result = FiniteSystem()
         result.graph = g
@@ -1524,6 +1663,11 @@ class Builder:
         result.hoppings = hoppings
         result.onsite_hamiltonians = onsite_hamiltonians
         result._ham_param_map = _ham_param_map
+        result._vectorized_terms = vectorized_terms
+        result._vectorized_sites = vectorized_sites
+        result._vectorized_edges = vectorized_edges
+        result._ham_cache = None
+        result._cache_hamiltonian = False
         result.lead_interfaces = lead_interfaces
         result.symmetry = self.symmetry
         return result
@@ -1671,11 +1815,283 @@ class Builder:
         result.onsite_hamiltonians = onsite_hamiltonians
         result._ham_param_map = _ham_param_map
         result.symmetry = self.symmetry
+        result._cache = LRUCache(0)
         return result
 
 
 ################ Finalized systems
 
+def _hashable(value):
+    """Return a hashable equivalent of `value` or raise `TypeError`."""
+    if isinstance(value, np.ndarray):
+        return (value.dtype.str, value.shape, value.tobytes())
+    hash(value)
+    return value
+
+
+def _read_only(value):
+    """Make the arrays of `value` read-only and return it.
+
+    `value` is an array, a tuple, or an object with attributes, like the
+    results of `InfiniteSystem.modes` and `InfiniteSystem.selfenergy`.
+    """
+    if isinstance(value, np.ndarray):
+        value.flags.writeable = False
+    elif isinstance(value, tuple):
+        for v in value:
+            _read_only(v)
+    elif hasattr(value, '__dict__'):
+        for v in vars(value).values():
+            _read_only(v)
+    return value
+
+
+def _snapshot(kwargs):
+    """Return a comparable copy of the parameter values in `kwargs`.
+
+    Returns ``None`` if some value is not hashable (and hence possibly
+    mutable).
+    """
+    try:
+        return tuple(sorted((name, _hashable(value))
+                            for name, value in kwargs.items()))
+    except TypeError:
+        return None
+
+
+def _unique_shapes(shapes):
+    n_max = np.max(shapes[:, 1]) + 1 if len(shapes) else 1
+    return [divmod(code, n_max)
+            for code in np.unique(shapes[:, 0] * n_max + shapes[:, 1])]
+
+
+def _flattened(values):
+    """Flatten a sequence of matrix elements.
+
+    Return the concatenated flattened matrices and their shapes.
+    """
+    try:
+        # Fast path: all the values are scalars or matrices of equal shape.
+        stacked = np.array(values, complex)
+    except (ValueError, TypeError):
+        stacked = None
+    if stacked is not None and stacked.ndim in (1, 3):
+        shapes = np.empty((len(values), 2), int)
+        shapes[:] = stacked.shape[1:] or (1, 1)
+        return stacked.ravel(), shapes
+    blocks = [ta.matrix(value, complex) for value in values]
+    shapes = np.array([block.shape for block in blocks], int)
+    return (np.concatenate([np.asarray(block).ravel()
+                            for block in blocks]), shapes)
+
+
+def _coo_indices(to_offs, from_offs, shapes):
+    """Return rows and columns of the concatenated flattened blocks.
+
+    The blocks have the shapes given by the rows of `shapes` and are located
+    at the rows and columns `to_offs` and `from_offs` of the matrix.
+    """
+    sizes = shapes[:, 0] * shapes[:, 1]
+    starts = np.cumsum(sizes) - sizes
+    rows = np.empty(np.sum(sizes), graph.gint_dtype)
+    cols = np.empty_like(rows)
+    for n, m in _unique_shapes(shapes):
+        which = (shapes[:, 0] == n) & (shapes[:, 1] == m)
+        pos = (starts[which, None] + np.arange(n * m)).ravel()
+        block = np.empty((np.count_nonzero(which), n, m), graph.gint_dtype)
+        block[...] = to_offs[which, None, None] + np.arange(n)[:, None]
+        rows[pos] = block.ravel()
+        block[...] = from_offs[which, None, None] + np.arange(m)
+        cols[pos] = block.ravel()
+    return rows, cols
+
+
+class _ValueGroup:
+    """Matrix elements of a `FiniteSystem` that are given by the same value.
+
+    `value` is the value function, or ``None`` for constant values.  `items`
+    is a sequence of pairs of site ids ``(i, j)`` of the matrix elements, for
+    hoppings only one direction is included.  For vectorized value functions
+    `items` is instead a tuple ``(site_arrays, to_ids, from_ids)``.
+    """
+
+    def __init__(self, value, items, hopping, vectorized=False):
+        self.value = value
+        self.items = items
+        self.hopping = hopping
+        self.vectorized = vectorized
+        self.snapshot = None
+
+    def kwargs(self, syst, params):
+        """Return the keyword arguments of the value function and a snapshot
+        of them (see `_snapshot`).
+
+        The snapshot is ``None`` if the value function takes no parameters:
+        such functions (e.g. random disorder) are evaluated every time.
+        """
+        if not params:
+            return {}, None
+        param_names, takes_kwargs = syst._ham_param_map[self.value]
+        if not takes_kwargs:
+            params = {pn: params[pn] for pn in param_names}
+        return params, (_snapshot(params) if params else None)
+
+    def evaluate(self, syst, args=(), kwargs={}):
+        """Return the flattened values and the shapes of the blocks."""
+        value = self.value
+        if value is None:
+            return _flattened([syst.hamiltonian(i, j) for i, j in self.items])
+
+        if self.vectorized:
+            site_arrays, to_ids, _ = self.items
+            try:
+                values = value(*(site_arrays + tuple(args)), **kwargs)
+            except Exception as exc:
+                _raise_user_error(exc, value)
+            values = _stacked(values, len(to_ids))
+            shapes = np.empty((len(to_ids), 2), int)
+            shapes[:] = values.shape[1:]
+            return values.ravel(), shapes
+
+        sites = syst.sites
+        try:
+            if self.hopping:
+                values = [value(sites[i], sites[j], *args, **kwargs)
+                          for i, j in self.items]
+            else:
+                values = [value(sites[i], *args, **kwargs)
+                          for i, _ in self.items]
+        except Exception as exc:
+            _raise_user_error(exc, value)
+        return _flattened(values)
+
+
+class _HamiltonianCache:
+    """Evaluated Hamiltonian of a `FiniteSystem` in COO format.
+
+    The row and column indices, and the values of constant matrix elements
+    are computed only once.  The entries of each `_ValueGroup` are contiguous
+    in `data`.  For hoppings they are followed by the entries of the
+    Hermitian conjugate in the same order, such that the latter are simply
+    the complex conjugate of the former.
+    """
+
+    def __init__(self, syst, args=(), params=None):
+        msg = ('Hopping from site {0} to site {1} does not match the '
+               'dimensions of onsite Hamiltonians of these sites.')
+        vec_sites = syst._vectorized_sites
+        vec_edges = syst._vectorized_edges
+
+        groups = collections.OrderedDict()
+        for site, value in enumerate(syst.onsite_hamiltonians):
+            if vec_sites is not None and vec_sites[site]:
+                continue
+            key = (value if callable(value) else None, False)
+            groups.setdefault(key, []).append((site, site))
+        for edge_id, (tail, head) in enumerate(syst.graph):
+            value = syst.hoppings[edge_id]
+            if value is Other or (vec_edges is not None and
+                                  vec_edges[edge_id]):
+                continue
+            key = (value if callable(value) else None, True)
+            groups.setdefault(key, []).append((tail, head))
+        self.groups = [_ValueGroup(value, np.array(items, int), hopping)
+                       for (value, hopping), items in groups.items()]
+        for ham, site_arrays, to_ids, from_ids in (syst._vectorized_terms
+                                                   or ()):
+            self.groups.append(_ValueGroup(
+                ham, (site_arrays, to_ids, from_ids),
+                to_ids is not from_ids, True))
+
+        values = []
+        for group in self.groups:
+            if group.value is None:
+                values.append(group.evaluate(syst))
+            else:
+                kwargs, group.snapshot = group.kwargs(syst, params)
+                values.append(group.evaluate(syst, args, kwargs))
+
+        # Determine the number of orbitals from the onsite blocks.
+        norb = np.empty(syst.graph.num_nodes, graph.gint_dtype)
+        for group, (_, shapes) in zip(self.groups, values):
+            if group.hopping:
+                continue
+            to_ids = (group.items[1] if group.vectorized
+                      else group.items[:, 0])
+            wrong = shapes[:, 0] != shapes[:, 1]
+            if np.any(wrong):
+                site = to_ids[np.argmax(wrong)]
+                raise ValueError(msg.format(site, site))
+            norb[to_ids] = shapes[:, 0]
+        offsets = np.zeros(len(norb) + 1, graph.gint_dtype)
+        np.cumsum(norb, out=offsets[1:])
+
+        data, rows, cols = [], [], []
+        start = 0
+        for group, (flat, shapes) in zip(self.groups, values):
+            if group.vectorized:
+                to_ids, from_ids = group.items[1:]
+            else:
+                to_ids, from_ids = group.items.T
+            if group.hopping:
+                wrong = ((shapes[:, 0] != norb[to_ids]) |
+                         (shapes[:, 1] != norb[from_ids]))
+                if np.any(wrong):
+                    k = np.argmax(wrong)
+                    raise ValueError(msg.format(from_ids[k], to_ids[k]))
+            r, c = _coo_indices(offsets[to_ids], offsets[from_ids], shapes)
+            data.append(flat)
+            rows.append(r)
+            cols.append(c)
+            if group.hopping:
+                data.append(flat.conj())
+                rows.append(c)
+                cols.append(r)
+            group.start = start
+            group.shapes = shapes
+            start += len(flat) * (2 if group.hopping else 1)
+
+        self.data = np.concatenate(data) if data else np.empty(0, complex)
+        self.rows = (np.concatenate(rows) if rows
+                     else np.empty(0, graph.gint_dtype))
+        self.cols = (np.concatenate(cols) if cols
+                     else np.empty(0, graph.gint_dtype))
+        self.norb = norb
+
+    def update(self, syst, args=(), params=None):
+        """Re-evaluate the value functions.
+
+        When evaluating with `params`, only the value functions whose
+        parameters have changed are evaluated again.  Return ``False`` if the
+        structure of the Hamiltonian has changed and the cache is hence
+        invalid.
+        """
+        for group in self.groups:
+            if group.value is None:
+                continue
+            kwargs, snapshot = group.kwargs(syst, params)
+            if snapshot is not None and snapshot == group.snapshot:
+                continue
+            flat, shapes = group.evaluate(syst, args, kwargs)
+            if not np.array_equal(shapes, group.shapes):
+                return False
+            start, end = group.start, group.start + len(flat)
+            self.data[start:end] = flat
+            if group.hopping:
+                self.data[end:end + len(flat)] = flat.conj()
+            group.snapshot = snapshot
+        return True
+
+    def matrix(self):
+        """Return a copy of the Hamiltonian in COO format, without zero
+        entries."""
+        nonzero = self.data != 0
+        n = self.norb.sum()
+        return sparse.coo_matrix((self.data[nonzero],
+                                  (self.rows[nonzero], self.cols[nonzero])),
+                                 shape=(n, n))
+
+
 def _raise_user_error(exc, func):
     msg = ('Error occurred in user-supplied value function "{0}".\n'
            'See the upper part of the above backtrace for more information.')
@@ -1772,27 +2188,68 @@ class FiniteSystem(system.FiniteSystem):
         are ordered first by their family and then by their tag.
     id_by_site : dict
         The inverse of ``sites``; maps from ``i`` to ``sites[i]``.
+
+    Notes
+    -----
+    If ``cache_hamiltonian`` is set to ``True``, the values of all the matrix
+    elements of the full Hamiltonian are kept between evaluations, such that
+    constant values are processed only once.  When the Hamiltonian is
+    evaluated with ``params``, subsequent evaluations only call the value
+    functions that take parameters whose values have changed; value functions
+    without parameters are always called.  Parameter values are compared by
+    value for arrays and by equality for other hashable objects; unhashable
+    values always count as changed.  The kept values become stale if a value
+    function with parameters depends on anything else than its arguments
+    (e.g. global variables, or objects that are modified in place between
+    calls), which is why the cache is disabled by default.  The cache is not
+    pickled.
     """
 
+    @property
+    def cache_hamiltonian(self):
+        """Whether the evaluated Hamiltonian is kept between evaluations.
+
+        Setting it to ``False`` frees the kept values; all value functions
+        are then called at every evaluation.  Defaults to ``False``.
+        """
+        return self._cache_hamiltonian
+
+    @cache_hamiltonian.setter
+    def cache_hamiltonian(self, value):
+        self._cache_hamiltonian = bool(value)
+        if not value:
+            self._ham_cache = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_ham_cache'] = None
+        return state
+
     def hamiltonian(self, i, j, *args, params=None):
         if args and params:
             raise TypeError("'args' and 'params' are mutually exclusive.")
         if i == j:
             value = self.onsite_hamiltonians[i]
             if callable(value):
+                site = self.sites[i]
+                vectorized = _is_vectorized(value)
+                if vectorized:
+                    site = _site_array(site)
                 if params:
                     param_names, takes_kwargs = self._ham_param_map[value]
                     if not takes_kwargs:
                         params = {pn: params[pn] for pn in param_names}
                     try:
-                            value = value(self.sites[i], **params)
+                            value = value(site, **params)
                     except Exception as exc:
                         _raise_user_error(exc, value)
                 else:
                     try:
-                        value = value(self.sites[i], *args)
+                        value = value(site, *args)
                     except Exception as exc:
                         _raise_user_error(exc, value)
+                if vectorized:
+                    value = _unstacked(value)
         else:
             edge_id = self.graph.first_edge_id(i, j)
             value = self.hoppings[edge_id]
@@ -1802,24 +2259,52 @@ class FiniteSystem(system.FiniteSystem):
                 edge_id = self.graph.first_edge_id(i, j)
                 value = self.hoppings[edge_id]
             if callable(value):
-                sites = self.sites
+                site_i, site_j = self.sites[i], self.sites[j]
+                vectorized = _is_vectorized(value)
+                if vectorized:
+                    site_i, site_j = _site_array(site_i), _site_array(site_j)
                 if params:
                     param_names, takes_kwargs = self._ham_param_map[value]
                     if not takes_kwargs:
                         params = {pn: params[pn] for pn in param_names}
                     try:
-                        value = value(sites[i], sites[j], **params)
+                        value = value(site_i, site_j, **params)
                     except Exception as exc:
                         _raise_user_error(exc, value)
                 else:
                     try:
-                        value = value(sites[i], sites[j], *args)
+                        value = value(site_i, site_j, *args)
                     except Exception as exc:
                         _raise_user_error(exc, value)
+                if vectorized:
+                    value = _unstacked(value)
             if conj:
                 value = herm_conj(value)
         return value
 
+    def _cached_hamiltonian(self, args=(), *, params=None):
+        """Evaluate the full Hamiltonian, reusing previously evaluated values.
+
+        The structure of the Hamiltonian and the values of constant matrix
+        elements are computed only once, such that only value functions have
+        to be evaluated.  Moreover, when evaluating with ``params``, only the
+        value functions whose parameters differ from the previous call are
+        evaluated again.  If `cache_hamiltonian` is false, nothing is kept
+        and all value functions are evaluated.
+
+        Returns ``(ham, norb)``, where ``ham`` is a `scipy.sparse.coo_matrix`
+        and ``norb`` contains the number of orbitals of each site.
+        """
+        if args and params:
+            raise TypeError("'args' and 'params' are mutually exclusive.")
+        if not self._cache_hamiltonian:
+            cache = _HamiltonianCache(self, args, params)
+            return cache.matrix(), cache.norb
+        cache = self._ham_cache
+        if cache is None or not cache.update(self, args, params):
+            cache = self._ham_cache = _HamiltonianCache(self, args, params)
+        return cache.matrix(), cache.norb
+
     def site(self, i):
         warnings.warn("The function ``site`` will disappear after Kwant 1.1.  "
                       "Use ``sites`` instead.", KwantDeprecationWarning,
@@ -1849,8 +2334,132 @@ class InfiniteSystem(system.InfiniteSystem):
     domain (FD) with hoppings to neighboring cells, sites in the FD with no
     hoppings to neighboring cells, and sites in FD+1 attached to the FD by
     hoppings. Each of these three subsequences is individually sorted.
+
+    If `cache_size` is set to a positive number, the results of `modes` and
+    `selfenergy` are cached, keyed on the energy, the positional arguments and
+    the values of those parameters that the value functions of the system
+    actually take.  Parameters that are only used elsewhere (e.g. in the
+    scattering region) thus do not cause the lead to be solved again.  The
+    arrays of cached results are shared between calls and are hence made
+    read-only.  See `cache_size`, `cache_info` and `clear_cache`.
+
+    Caching is only done when the Hamiltonian is constant, or when it is
+    evaluated with ``params`` and all value functions take parameters.  Value
+    functions must then not depend on anything else (e.g. global variables or
+    random numbers) than their arguments, which is why the cache is disabled
+    by default.
     """
 
+    @property
+    def cache_size(self):
+        """Maximal number of cached results of `modes` and `selfenergy`.
+
+        Setting it to 0 disables the cache.  Defaults to 0.
+        """
+        return self._cache.maxsize
+
+    @cache_size.setter
+    def cache_size(self, size):
+        self._cache.resize(size)
+
+    def cache_info(self):
+        """Return statistics of the cache of `modes` and `selfenergy`.
+
+        Returns
+        -------
+        info : namedtuple
+            With the fields ``hits``, ``misses``, ``maxsize`` and
+            ``currsize``, like that of `functools.lru_cache`.
+        """
+        return self._cache.info()
+
+    def clear_cache(self):
+        """Empty the cache of `modes` and `selfenergy`, reset statistics."""
+        self._cache.clear()
+
+    def _parameter_names(self):
+        """Return the names of the parameters that the system depends on.
+
+        ``None`` is returned if any function takes arbitrary keyword arguments.
+        """
+        infos = list(self._ham_param_map.values())
+        operators = (self._cons_law or ()) + tuple(self._symmetries)
+        infos.extend(op._onsite_params_info for op in operators
+                     if op is not None)
+        names = set()
+        for param_names, takes_kwargs in infos:
+            if takes_kwargs:
+                return None
+            names.update(param_names)
+        return names
+
+    def _cache_key(self, what, energy, args, params):
+        """Return the key of the cache, or None if it cannot be cached."""
+        if not self._cache.maxsize:
+            return None
+        if self._ham_param_map and not params:
+            # Value functions used without 'params' often depend on global
+            # state that we cannot track.
+            return None
+        if any(not names and not takes_kwargs
+               for names, takes_kwargs in self._ham_param_map.values()):
+            # Value functions without parameters may be random.
+            return None
+        if params:
+            names = self._parameter_names()
+            if names is None:
+                names = params.keys()
+            elif not names.issubset(params):
+                # Let the computation raise the appropriate error.
+                return None
+            params = tuple(sorted((name, params[name]) for name in names))
+        else:
+            params = ()
+        try:
+            return (what, _hashable(energy),
+                    tuple(_hashable(arg) for arg in args),
+                    tuple((name, _hashable(value)) for name, value in params))
+        except TypeError:
+            return None
+
+    def _cached(self, key, compute):
+        """Return ``compute()``, cached with read-only arrays unless `key`
+        is ``None``."""
+        if key is None:
+            return self._cache.get(key, compute)
+        return self._cache.get(key, lambda: _read_only(compute()))
+
+    def modes(self, energy=0, args=(), *, params=None, method='dense',
+              evanescent_cutoff=10, threads=1):
+        """Return mode decomposition of the lead
+
+        See documentation of `~kwant.physics.PropagatingModes` and
+        `~kwant.physics.StabilizedModes` for the return format details.
+        The result is cached, see the notes of `InfiniteSystem`.  `method`,
+        `evanescent_cutoff` and `threads` are passed to `~kwant.physics.modes`.
+        """
+        what = 'modes'
+        if method != 'dense':
+            what = (what, method, evanescent_cutoff)
+        key = self._cache_key(what, energy, args, params)
+        modes = super().modes
+        return self._cached(key, lambda: modes(
+            energy, args, params=params, method=method,
+            evanescent_cutoff=evanescent_cutoff, threads=threads))
+
+    def selfenergy(self, energy=0, args=(), *, params=None):
+        """Return self-energy of a lead.
+
+        The returned matrix has the shape (s, s), where s is
+        ``sum(len(self.hamiltonian(i, i)) for i in range(self.graph.num_nodes -
+        self.cell_size))``.  The result is cached, see the notes of
+        `InfiniteSystem`.
+        """
+        key = self._cache_key('selfenergy', energy, args, params)
+        selfenergy = super().selfenergy
+        return self._cached(key,
+                            lambda: selfenergy(energy, args, params=params))
+
     def hamiltonian(self, i, j, *args, params=None):
         if args and params:
             raise TypeError("'args' and 'params' are mutually exclusive.")
@@ -1860,6 +2469,9 @@ class InfiniteSystem(system.InfiniteSystem):
             value = self.onsite_hamiltonians[i]
             if callable(value):
                 site = self.symmetry.to_fd(self.sites[i])
+                vectorized = _is_vectorized(value)
+                if vectorized:
+                    site = _site_array(site)
                 if params:
                     param_names, takes_kwargs = self._ham_param_map[value]
                     if not takes_kwargs:
@@ -1873,6 +2485,8 @@ class InfiniteSystem(system.InfiniteSystem):
                         value = value(site, *args)
                     except Exception as exc:
                         _raise_user_error(exc, value)
+                if vectorized:
+                    value = _unstacked(value)
         else:
             edge_id = self.graph.first_edge_id(i, j)
             value = self.hoppings[edge_id]
@@ -1884,6 +2498,9 @@ class InfiniteSystem(system.InfiniteSystem):
             if callable(value):
                 sites = self.sites
                 site_i, site_j = self.symmetry.to_fd(sites[i], sites[j])
+                vectorized = _is_vectorized(value)
+                if vectorized:
+                    site_i, site_j = _site_array(site_i), _site_array(site_j)
                 if params:
                     param_names, takes_kwargs = self._ham_param_map[value]
                     if not takes_kwargs:
@@ -1897,6 +2514,8 @@ class InfiniteSystem(system.InfiniteSystem):
                         value = value(site_i, site_j, *args)
                     except Exception as exc:
                         _raise_user_error(exc, value)
+                if vectorized:
+                    value = _unstacked(value)
             if conj:
                 value = herm_conj(value)
         return value
@@ -7,14 +7,17 @@
 # the file AUTHORS.rst at the top-level directory of this distribution and at
 # http://kwant-project.org/authors.
 
-__all__ = ['SpectralDensity']
+__all__ = ['SpectralDensity', 'Conductivity', 'evolve']
 
 import warnings
+import multiprocessing
+from functools import partial
 
 import numpy as np
 import scipy
 import scipy.sparse.linalg as sla
 import scipy.fftpack as fft
+from scipy.special import jv, expit
 
 from . import system
 from ._common import ensure_rng
@@ -63,17 +66,45 @@ class SpectralDensity:
         If not provided, random phase vectors are used.
         The default random vectors are optimal for most cases, see the
         discussions in [1]_ and [2]_.
-    bounds : pair of floats, optional
+    bounds : pair of floats, or string, optional
         Lower and upper bounds for the eigenvalue spectrum of the system.
-        If not provided, they are computed.
+        If not provided, they are computed from the extremal eigenvalues.
+        The bounds may also be estimated more cheaply: with 'gershgorin'
+        from the Gershgorin discs of the Hamiltonian (strict, but possibly
+        loose bounds), with 'lanczos' from a short Lanczos run that finds
+        both extremal eigenvalues at once, or with 'fast', which clips the
+        Lanczos estimate to the Gershgorin bounds.  Lanczos estimates are
+        verified with a short Chebyshev recursion, and the extremal
+        eigenvalues are computed if the estimate misses part of the
+        spectrum.  To avoid estimating the bounds again for the same
+        Hamiltonian, pass the ``bounds`` attribute of a previous instance.
     epsilon : float, default: 0.05
         Parameter to ensure that the rescaled spectrum lies in the
         interval ``(-1, 1)``; required for stability.
     rng : seed, or random number generator, optional
-        Random number generator used by ``vector_factory``.
+        Random number generator used by ``vector_factory``, and for the
+        starting vector of the Lanczos estimate of the bounds.
         If not provided, numpy's rng will be used; if it is an Integer,
         it will be used to seed numpy's rng, and if it is a random
         number generator, this is the one used.
+    processes : integer, default: 1
+        Number of worker processes among which the random vectors are
+        distributed.  The Hamiltonian is placed in shared memory, and the
+        ``operator`` must be picklable.
+    checkpoint : file or string, optional
+        A file written by `save_checkpoint`.  The moments, random vectors,
+        and spectral bounds are then taken from it instead of being
+        calculated, and ``num_rand_vecs``, ``num_moments``,
+        ``num_sampling_points``, ``bounds``, and ``epsilon`` are ignored.
+        The Hamiltonian and ``operator`` must be the same as when the
+        checkpoint was saved.
+    precision : 'double' or 'single', default: 'double'
+        Floating point precision of the Chebyshev recursion.  Single
+        precision halves the memory traffic and is suited for exploratory
+        calculations: with a few hundred moments, the errors of the moments
+        are of the order of ``1e-7`` times the zeroth moment, far below the
+        stochastic error for typical numbers of random vectors.  Scalar
+        products are accumulated in double precision.
 
     Notes
     -----
@@ -84,6 +115,14 @@ class SpectralDensity:
     will be arrays of the length of the system, that is, local
     densities.
 
+    Real Hamiltonians are detected and applied in real arithmetic, to the
+    real and imaginary parts of the random vectors, which gives the same
+    results as complex arithmetic for a fraction of the cost.
+
+    Long calculations can be resumed after an interruption by saving
+    the state with `save_checkpoint`, e.g. after each call to
+    `increase_accuracy`, and passing the file as ``checkpoint``.
+
     .. [1] `Rev. Mod. Phys., Vol. 78, No. 1 (2006)
        <https://arxiv.org/abs/cond-mat/0504627>`_.
     .. [2] `Phys. Rev. E 69, 057701 (2004)
@@ -130,38 +169,55 @@ class SpectralDensity:
         the range of the spectrum.
     densities : array of floats
         Spectral density of the ``operator`` evaluated at the energies.
+    bounds : pair of floats
+        Lower and upper bounds of the spectrum of the Hamiltonian, as used
+        for its rescaling.
     """
 
     def __init__(self, ham, params=None, operator=None,
                  num_rand_vecs=10, num_moments=100, num_sampling_points=None,
-                 vector_factory=None, bounds=None, epsilon=0.05, rng=None):
+                 vector_factory=None, bounds=None, epsilon=0.05, rng=None,
+                 processes=1, checkpoint=None, precision='double'):
         rng = ensure_rng(rng)
         # self.epsilon ensures that the rescaled Hamiltonian has a
         # spectrum strictly in the interval (-1,1).
         self.epsilon = epsilon
 
         # Normalize the format of 'ham'
-        if isinstance(ham, system.System):
-            ham = ham.hamiltonian_submatrix(params=params, sparse=True)
-        try:
-            ham = scipy.sparse.csr_matrix(ham)
-        except Exception:
-            raise ValueError("'ham' is neither a matrix nor a Kwant system.")
+        ham = _normalize_hamiltonian(ham, params)
 
-        # Normalize 'operator' to a common format.
+        if precision not in ('double', 'single'):
+            raise ValueError("'precision' must be 'double' or 'single'.")
+        self.precision = precision
+
+        # Normalize 'operator' to a common format.  '_expectation' evaluates
+        # the operator between corresponding columns of two blocks of
+        # vectors.
         if operator is None:
             self.operator = None
+            self._expectation = None
         elif isinstance(operator, _LocalOperator):
             self.operator = operator.bind(params=params)
+            # Evaluate all matrix elements with sparse products instead of
+            # calling the operator for every vector and moment.
+            self._expectation = _LocalExpectation(self.operator)
         elif callable(operator):
             self.operator = operator
+            self._expectation = partial(_callable_expectation, operator)
         elif hasattr(operator, 'dot'):
             operator = scipy.sparse.csr_matrix(operator)
+            if self.precision == 'single':
+                operator = _single_precision(operator)
             self.operator = lambda bra, ket: np.vdot(bra, operator.dot(ket))
+            self._expectation = partial(_matrix_expectation, operator)
         else:
             raise ValueError('Parameter `operator` has no `.dot` '
                              'attribute and is not callable.')
 
+        self.processes = int(processes)
+        if self.processes < 1:
+            raise ValueError('processes must be a positive integer.')
+
         self.num_moments = num_moments
         # Default number of sampling points
         if num_sampling_points is None:
@@ -174,24 +230,36 @@ class SpectralDensity:
 
         self._vector_factory = vector_factory or \
             (lambda n: np.exp(2j * np.pi * rng.random_sample(n)))
-        # store this vector for reproducibility
-        self._v0 = self._vector_factory(ham.shape[0])
-        self._rand_vect_list = []
-        # Hamiltonian rescaled as in Eq. (24)
-        self.ham, (self._a, self._b) = _rescale(ham, epsilon=self.epsilon,
-                                                v0=self._v0, bounds=bounds)
+        if checkpoint is not None:
+            self._load_checkpoint(checkpoint, ham.shape[0])
+            self.ham = _rescale(ham, self.epsilon, None, None,
+                                scale=(self._a, self._b))[0]
+        else:
+            # store this vector for reproducibility
+            self._v0 = self._vector_factory(ham.shape[0])
+            # Hamiltonian rescaled as in Eq. (24)
+            self.ham, (self._a, self._b) = _rescale(
+                ham, epsilon=self.epsilon, v0=self._v0, bounds=bounds,
+                rng=rng)
+        if self.precision == 'single':
+            self.ham = _single_precision(self.ham)
+
+        if checkpoint is None:
+            self._rand_vect_list = []
+            for r in range(num_rand_vecs):
+                self._rand_vect_list.append(
+                    self._vector_factory(self.ham.shape[0]))
+            # The last two vectors of the Chebyshev recursion, as blocks
+            # with one column per random vector.
+            self._last_two_alphas = None
+            self._moments_list = []
+
+            self.num_rand_vecs = 0 # new random vectors will be used
+            self._update_moments_list(self.num_moments, num_rand_vecs)
+            #update the number of random vectors
+            self.num_rand_vecs = num_rand_vecs
         self.bounds = (self._b - self._a, self._b + self._a)
 
-        for r in range(num_rand_vecs):
-            self._rand_vect_list.append(self._vector_factory(self.ham.shape[0]))
-        self._last_two_alphas = [0.] * num_rand_vecs
-        self._moments_list = [0.] * num_rand_vecs
-
-        self.num_rand_vecs = 0 # new random vectors will be used
-        self._update_moments_list(self.num_moments, num_rand_vecs)
-        #update the number of random vectors
-        self.num_rand_vecs = num_rand_vecs
-
         # sum moments of all random vectors
         moments = np.sum(np.asarray(self._moments_list).real, axis=0)
         # divide by the number of random vectors
@@ -320,8 +388,6 @@ class SpectralDensity:
         new_rand_vect = num_rand_vecs - self.num_rand_vecs
         for r in range(new_rand_vect):
             self._rand_vect_list.append(self._vector_factory(self.ham.shape[0]))
-        self._moments_list.extend([0.] * new_rand_vect)
-        self._last_two_alphas.extend([0.] * new_rand_vect)
         self._update_moments_list(self.num_moments, num_rand_vecs)
         self.num_rand_vecs = num_rand_vecs
 
@@ -399,63 +465,583 @@ class SpectralDensity:
                    ("Only 'num_moments' *or* 'num_rand_vecs' may be updated "
                     "at a time.")
 
-        for r in range(r_start, n_rand):
-            alpha_zero = self._rand_vect_list[r]
-
-            one_moment = [0.] * n_moments
-            if new_rand_vect > 0:
-                alpha = alpha_zero
-                alpha_next = self.ham.matvec(alpha)
-                if self.operator is None:
-                    one_moment[0] = np.vdot(alpha_zero, alpha_zero)
-                    one_moment[1] = np.vdot(alpha_zero, alpha_next)
-                else:
-                    one_moment[0] = self.operator(alpha_zero, alpha_zero)
-                    one_moment[1] = self.operator(alpha_zero, alpha_next)
-
-            if new_moments > 0:
-                (alpha, alpha_next) = self._last_two_alphas[r]
-                one_moment[0:self.num_moments] = self._moments_list[r]
-            # Iteration over the moments
-            # Two cases can occur, depicted in Eq. (28) and in Eq. (29),
-            # respectively.
-            # ----
-            # In the first case, self.operator is None and we can use
-            # Eqs. (34) and (35) to obtain the density of states, with
-            # two moments ``one_moment`` for every new alpha.
-            # ----
-            # In the second case, the operator is not None and a matrix
-            # multiplication should be used.
-            if self.operator is None:
-                for n in range(m_start//2, n_moments//2):
-                    alpha_save = alpha_next
-                    alpha_next = 2 * self.ham.matvec(alpha_next) - alpha
-                    alpha = alpha_save
-                    # Following Eqs. (34) and (35)
-                    one_moment[2*n] = (2 * np.vdot(alpha, alpha)
-                                       - one_moment[0])
-                    one_moment[2*n+1] = (2 * np.vdot(alpha_next, alpha)
-                                         - one_moment[1])
-                if n_moments % 2:
-                    # odd moment
-                    one_moment[n_moments - 1] = (2 * np.vdot(alpha_next, alpha_next)
-                                                 - one_moment[0])
-            else:
-                for n in range(m_start, n_moments):
-                    alpha_save = alpha_next
-                    alpha_next = 2 * self.ham.matvec(alpha_next) - alpha
-                    alpha = alpha_save
-                    one_moment[n] = self.operator(alpha_zero, alpha_next)
+        alpha_zero = np.ascontiguousarray(
+            np.transpose(self._rand_vect_list[r_start:n_rand]))
+        if self.precision == 'single':
+            alpha_zero = _single_precision(alpha_zero)
+        if new_moments > 0:
+            moments = np.swapaxes(self._moments_list[r_start:n_rand], 0, 1)
+            last_two_alphas = self._last_two_alphas
+        else:
+            moments = last_two_alphas = None
+
+        processes = min(self.processes, alpha_zero.shape[1])
+        if processes > 1:
+            # Distribute the random vectors among the worker processes.
+            chunks = np.array_split(np.arange(alpha_zero.shape[1]),
+                                    processes)
+            tasks = []
+            for cols in chunks:
+                tasks.append((self._expectation, alpha_zero[:, cols],
+                              n_moments,
+                              None if moments is None else moments[:, cols],
+                              None if last_two_alphas is None else
+                              [alpha[:, cols] for alpha in last_two_alphas]))
+            with multiprocessing.Pool(processes, _init_worker,
+                                      _shared_csr(self.ham)) as pool:
+                results = pool.map(_worker_moments, tasks)
+            moments = np.concatenate([m for m, _ in results], axis=1)
+            alphas = [np.concatenate(a, axis=1)
+                      for a in zip(*(a for _, a in results))]
+        else:
+            moments, alphas = _chebyshev_moments(
+                self.ham, self._expectation, alpha_zero, n_moments,
+                moments, last_two_alphas)
+
+        if new_rand_vect > 0 and r_start > 0:
+            alphas = [np.concatenate([old, new], axis=1) for old, new in
+                      zip(self._last_two_alphas, alphas)]
+        self._last_two_alphas = tuple(alphas)
+        self._moments_list[r_start:n_rand] = list(np.swapaxes(moments, 0, 1))
+
+    def save_checkpoint(self, file):
+        """Save the state of the calculation to a file.
+
+        The Chebyshev moments, the random vectors, and the last two vectors
+        of the Chebyshev recursion are saved, such that the calculation can
+        be continued with `increase_accuracy` after passing the file as
+        ``checkpoint`` to a new `SpectralDensity`.
+
+        Parameters
+        ----------
+        file : file or string
+            File or file name to which the data is written, in the ``.npz``
+            format of NumPy.
+        """
+        np.savez(file, moments=np.asarray(self._moments_list),
+                 rand_vecs=np.asarray(self._rand_vect_list),
+                 last_two_alphas=np.asarray(self._last_two_alphas),
+                 num_sampling_points=self.num_sampling_points,
+                 epsilon=self.epsilon, scale=(self._a, self._b))
+
+    def _load_checkpoint(self, file, size):
+        """Restore the state saved by `save_checkpoint`."""
+        with np.load(file) as data:
+            rand_vecs = data['rand_vecs']
+            if rand_vecs.shape[1] != size:
+                raise ValueError('The checkpoint belongs to a Hamiltonian '
+                                 'of a different size.')
+            self._rand_vect_list = list(rand_vecs)
+            self._moments_list = list(data['moments'])
+            self._last_two_alphas = tuple(data['last_two_alphas'])
+            self.num_sampling_points = int(data['num_sampling_points'])
+            self.epsilon = float(data['epsilon'])
+            self._a, self._b = data['scale']
+        self.num_rand_vecs = len(self._rand_vect_list)
+        self.num_moments = len(self._moments_list[0])
+
+
+class Conductivity:
+    """Calculate a conductivity tensor element with the Kubo-Bastin formula.
+
+    The conductivity :math:`σ_{αβ}(μ, T)` is obtained from a double
+    Chebyshev expansion of the Kubo-Bastin formula, following [3]_.  The
+    traces are estimated with random vectors, and the matrix
+    :math:`μ_{mn} = \\mathrm{Tr}[v_α T_m(H) v_β T_n(H)]` of moments is
+    calculated once, such that the conductivity can be evaluated for many
+    chemical potentials and temperatures.
+
+    Parameters
+    ----------
+    ham : `~kwant.system.FiniteSystem` or matrix Hamiltonian
+        If a system is passed, it should contain no leads.
+    params : dict, optional
+        Additional parameters to pass to the Hamiltonian.
+    alpha, beta : 'x', 'y', 'z', or matrix, default: 'x'
+        Direction of the current and of the electric field.  A direction
+        selects the velocity operator :math:`v = i [H, x]`.  A matrix is used
+        as the velocity operator itself, which allows e.g. for periodic
+        boundary conditions.
+    positions : array of floats, optional
+        The positions of all orbitals, with shape ``(N, dim)``.  Only needed
+        if `ham` is not a system and `alpha` or `beta` are directions.
+    num_rand_vecs : integer, default: 10
+        Number of random vectors for the KPM method.
+    num_moments : integer, default: 100
+        Number of moments, order of the KPM expansion.
+    num_sampling_points : integer, optional
+        Number of points in the energy integral.  If not provided,
+        ``2*num_moments`` will be used.
+    vector_factory, bounds, epsilon, rng
+        See `SpectralDensity`.
+    chunk_size : integer, optional
+        Number of Chebyshev vectors per random vector that are kept in
+        memory.  The memory needed is about ``chunk_size`` times the size of
+        the block of random vectors.  The Chebyshev recursion of the right
+        vectors is repeated for each chunk, so the calculation costs
+        ``1 + ceil(num_moments / chunk_size)`` recursions of ``num_moments``
+        steps, instead of 2 when all vectors are kept.  If not provided, as
+        many vectors as fit into 256 MB are kept, at most ``num_moments``.
+
+    Notes
+    -----
+    The result is not divided by the volume of the system, and it is given
+    in units where :math:`e = ħ = 1`, such that the conductance quantum
+    :math:`e^2/h` equals :math:`1/2π`.
+
+    .. [3] `Phys. Rev. Lett. 114, 116602 (2015)
+       <https://arxiv.org/abs/1410.8140>`_.
+
+    Attributes
+    ----------
+    moments : 2D array of complex
+        The Chebyshev moments :math:`μ_{mn}` of the rescaled Hamiltonian,
+        without kernel.
+    """
 
-            self._last_two_alphas[r] = (alpha, alpha_next)
-            self._moments_list[r] = one_moment[:]
+    def __init__(self, ham, params=None, alpha='x', beta='x', positions=None,
+                 num_rand_vecs=10, num_moments=100, num_sampling_points=None,
+                 vector_factory=None, bounds=None, epsilon=0.05, rng=None,
+                 chunk_size=None):
+        rng = ensure_rng(rng)
+        if isinstance(ham, system.System):
+            if positions is None:
+                syst = ham
+                ham, norbs, _ = syst.hamiltonian_submatrix(
+                    params=params, sparse=True, return_norb=True)
+                positions = np.repeat(
+                    [syst.pos(i) for i in range(syst.graph.num_nodes)],
+                    norbs, axis=0)
+        ham = _normalize_hamiltonian(ham, params)
+
+        self.num_moments = num_moments
+        if num_sampling_points is None:
+            num_sampling_points = 2 * num_moments
+        self.num_sampling_points = num_sampling_points
+        self.num_rand_vecs = num_rand_vecs
+        self.epsilon = epsilon
+
+        velocities = [_velocity(ham, v, positions) for v in (alpha, beta)]
+
+        vector_factory = vector_factory or \
+            (lambda n: np.exp(2j * np.pi * rng.random_sample(n)))
+        v0 = vector_factory(ham.shape[0])
+        rescaled_ham, (self._a, self._b) = _rescale(
+            ham, epsilon=epsilon, v0=v0, bounds=bounds, rng=rng)
+        self.bounds = (self._b - self._a, self._b + self._a)
+
+        alpha_zero = np.ascontiguousarray(np.transpose(
+            [vector_factory(ham.shape[0]) for r in range(num_rand_vecs)]))
+        if chunk_size is None:
+            chunk_size = _chunk_memory // (alpha_zero.size * 16)
+        chunk_size = max(1, min(chunk_size, num_moments))
+        self.moments = _correlation_moments(
+            rescaled_ham, velocities[0], velocities[1], alpha_zero,
+            num_moments, chunk_size) / num_rand_vecs
+
+    def __call__(self, mu=0, temperature=0):
+        """Return the conductivity.
+
+        Parameters
+        ----------
+        mu : float or array of floats, default: 0
+            Chemical potential.
+        temperature : float, default: 0
+            Temperature, in units of energy.
+
+        Returns
+        -------
+        float or array of floats, with the shape of ``mu``.
+        """
+        mu = np.asarray(mu, dtype=float)
+        n_moments = self.num_moments
+        k = np.arange(self.num_sampling_points)
+        x = np.cos(np.pi * (k + 0.5) / self.num_sampling_points)
+        sqrt = np.sqrt(1 - x**2)
+        n = np.arange(n_moments)
+        # Chebyshev polynomials and the factors of Eq. (6) of [3], at all
+        # sampling points.
+        theta = np.arccos(x)[:, None]
+        t_n = np.cos(n * theta)
+        a_n = (x[:, None] - 1j * n * sqrt[:, None]) * np.exp(1j * n * theta)
+        b_n = (x[:, None] + 1j * n * sqrt[:, None]) * np.exp(-1j * n * theta)
+
+        g = _jackson_kernel(n_moments)
+        g[0] /= 2
+        moments = self.moments * np.outer(g, g)
+        # sum_nm moments[n, m] (a_n T_m + b_m T_n)
+        integrand = (np.sum(a_n.dot(moments) * t_n, axis=1) +
+                     np.sum(t_n.dot(moments) * b_n, axis=1)).real
+
+        energies = x * self._a + self._b
+        shape = mu.shape
+        mu = mu.reshape(-1, 1)
+        if temperature:
+            occupation = expit((mu - energies) / temperature)
+        else:
+            occupation = (energies < mu).astype(float)
+        # Gauss-Chebyshev quadrature of the integral over x, whose weight
+        # 1 / sqrt(1 - x^2) is compensated.
+        weights = np.pi / self.num_sampling_points / sqrt**3
+        result = 4 / (np.pi * self._a**2) * occupation.dot(weights * integrand)
+        return result.reshape(shape)
+
+
+def evolve(ham, vectors, times, params=None, bounds=None, epsilon=0.05,
+           tol=1e-12, rng=None):
+    """Evolve vectors in time with a Chebyshev expansion.
+
+    The time evolution operator :math:`\\exp(-iHt)` is expanded in Chebyshev
+    polynomials of the rescaled Hamiltonian, as in [1]_, and applied to the
+    vectors.  The vectors are propagated from one time to the next, and only
+    the states at the current time are kept in memory.
+
+    Parameters
+    ----------
+    ham : `~kwant.system.FiniteSystem` or matrix Hamiltonian
+        If a system is passed, it should contain no leads.
+    vectors : 1D or 2D array
+        The initial state at time 0, or several initial states as the
+        columns of a 2D array.  All of them are evolved together.
+    times : sequence of floats
+        The times at which the states are returned.
+    params : dict, optional
+        Additional parameters to pass to the Hamiltonian.
+    bounds, epsilon
+        See `SpectralDensity`.
+    tol : float, default: 1e-12
+        The expansion is truncated when its coefficients become smaller
+        than `tol`.
+    rng : seed, or random number generator, optional
+        Random number generator for the starting vector of the Lanczos
+        estimate of the bounds.  See `SpectralDensity`.
+
+    Yields
+    ------
+    states : array of complex
+        The states at each of `times`, with the shape of `vectors`.
+
+    Examples
+    --------
+    >>> for psi in kwant.kpm.evolve(fsyst, psi_0, np.linspace(0, 10, 11)):
+    ...     density.append(abs(psi)**2)
+    """
+    ham = _normalize_hamiltonian(ham, params)
+    vectors = np.asarray(vectors)
+    shape = vectors.shape
+    state = np.array(vectors.reshape(shape[0], -1), dtype=complex)
+    ham, (a, b) = _rescale(ham, epsilon=epsilon, v0=state[:, 0],
+                           bounds=bounds, rng=rng)
+
+    time = 0
+    for next_time in times:
+        dt = next_time - time
+        if dt:
+            # exp(-iHt) = exp(-ibt) sum_n (2 - delta_n0) (-i)^n J_n(at) T_n
+            coefs = _bessel_coefficients(a * dt, tol)
+            coefs *= np.exp(-1j * b * dt)
+            state = _chebyshev_sum(ham, state, coefs)
+            time = next_time
+        yield state.reshape(shape)
 
 
 # ### Auxiliary functions
 
 
-def _rescale(ham, epsilon, v0, bounds):
-    """Rescale a Hamiltonian and return a LinearOperator
+def _chebyshev_moments(ham, expectation, alpha_zero, n_moments,
+                       moments=None, last_two_alphas=None):
+    """Calculate the Chebyshev moments of a block of random vectors.
+
+    The random vectors are the columns of `alpha_zero`.  They are advanced
+    together, so that the Hamiltonian is applied with a single sparse
+    matrix-matrix product per moment.  If `expectation` is None, the moments
+    of the density of states are calculated.
+
+    If `moments` and `last_two_alphas`, the result of a previous call, are
+    given, the recursion is continued from there.
+
+    Returns
+    -------
+    moments : array
+        The moments, with one column per random vector.
+    last_two_alphas : pair of arrays
+        The last two vectors of the Chebyshev recursion.
+    """
+    one_moment = [None] * n_moments
+    if moments is None:
+        m_start = 2
+        alpha = alpha_zero
+        alpha_next = _dot(ham, alpha)
+        if expectation is None:
+            one_moment[0] = _column_vdot(alpha_zero, alpha_zero)
+            one_moment[1] = _column_vdot(alpha_zero, alpha_next)
+        else:
+            one_moment[0] = expectation(alpha_zero, alpha_zero)
+            one_moment[1] = expectation(alpha_zero, alpha_next)
+    else:
+        m_start = len(moments)
+        one_moment[:m_start] = moments
+        alpha, alpha_next = last_two_alphas
+
+    # Iteration over the moments
+    # Two cases can occur, depicted in Eq. (28) and in Eq. (29),
+    # respectively.
+    # ----
+    # In the first case, expectation is None and we can use
+    # Eqs. (34) and (35) to obtain the density of states, with
+    # two moments ``one_moment`` for every new alpha.
+    # ----
+    # In the second case, the operator is not None and a matrix
+    # multiplication should be used.
+    if expectation is None:
+        for n in range(m_start//2, n_moments//2):
+            alpha, alpha_next = alpha_next, _chebyshev_step(
+                ham, alpha_next, alpha)
+            # Following Eqs. (34) and (35)
+            one_moment[2*n] = (2 * _column_vdot(alpha, alpha)
+                               - one_moment[0])
+            one_moment[2*n+1] = (2 * _column_vdot(alpha_next, alpha)
+                                 - one_moment[1])
+        if n_moments % 2:
+            # odd moment
+            one_moment[n_moments - 1] = (
+                2 * _column_vdot(alpha_next, alpha_next) - one_moment[0])
+    else:
+        for n in range(m_start, n_moments):
+            alpha, alpha_next = alpha_next, _chebyshev_step(
+                ham, alpha_next, alpha)
+            one_moment[n] = expectation(alpha_zero, alpha_next)
+
+    return np.array(one_moment), (alpha, alpha_next)
+
+
+# State of a worker process that calculates moments.  It is set once by
+# `_init_worker`.
+_worker_ham = None
+
+
+def _shared_array(array):
+    """Return a copy of `array` in shared memory."""
+    shared = multiprocessing.RawArray('b', array.nbytes)
+    np.frombuffer(shared, array.dtype)[:] = array
+    return shared, array.dtype.str
+
+
+def _shared_csr(matrix):
+    """Return the arguments for `_init_worker` that share a CSR matrix."""
+    return (matrix.shape, _shared_array(matrix.data),
+            _shared_array(matrix.indices), _shared_array(matrix.indptr))
+
+
+def _init_worker(shape, *arrays):
+    global _worker_ham
+    data, indices, indptr = (np.frombuffer(shared, dtype)
+                             for shared, dtype in arrays)
+    _worker_ham = scipy.sparse.csr_matrix((data, indices, indptr), shape,
+                                          copy=False)
+
+
+def _worker_moments(task):
+    return _chebyshev_moments(_worker_ham, *task)
+
+
+def _matrix_expectation(operator, bra, ket):
+    return _column_vdot(bra, _dot(operator, ket))
+
+
+class _LocalExpectation:
+    """Matrix elements of a `~kwant.operator._LocalOperator` between
+    corresponding columns of two blocks of vectors.
+
+    The operator is represented by the sparse matrices of its
+    ``_sparse_elements`` method.  The conjugated bra, which is the same for
+    all moments, is kept between calls.
+    """
+
+    def __init__(self, operator):
+        self.index, self.matrix, self.reduce = operator._sparse_elements()
+        self.sum = operator.sum
+        self._bra = self._bra_conj = None
+
+    def __call__(self, bra, ket):
+        if bra is not self._bra:
+            self._bra, self._bra_conj = bra, bra[self.index].conj()
+        elements = self.reduce.dot(self._bra_conj * self.matrix.dot(ket))
+        return elements.sum(axis=0) if self.sum else elements.T
+
+    def __getstate__(self):
+        return self.index, self.matrix, self.reduce, self.sum
+
+    def __setstate__(self, state):
+        self.index, self.matrix, self.reduce, self.sum = state
+        self._bra = self._bra_conj = None
+
+
+def _callable_expectation(operator, bra, ket):
+    return np.array([operator(bra[:, i], ket[:, i])
+                     for i in range(bra.shape[1])])
+
+
+def _normalize_hamiltonian(ham, params):
+    """Return the Hamiltonian of a system or a matrix as a CSR matrix.
+
+    Real Hamiltonians are returned as real matrices, even if given with a
+    complex data type, so that they can be applied in real arithmetic.
+    """
+    if isinstance(ham, system.System):
+        ham = ham.hamiltonian_submatrix(params=params, sparse=True)
+    try:
+        ham = scipy.sparse.csr_matrix(ham)
+    except Exception:
+        raise ValueError("'ham' is neither a matrix nor a Kwant system.")
+    if ham.dtype.kind == 'c' and not np.any(ham.data.imag):
+        ham = ham.real.tocsr()
+    return ham
+
+
+def _velocity(ham, direction, positions):
+    """Return the velocity operator i [H, x] along `direction`.
+
+    If `direction` is not one of 'x', 'y' or 'z', it is taken to be the
+    velocity operator itself.
+    """
+    if not isinstance(direction, str):
+        return scipy.sparse.csr_matrix(direction)
+    try:
+        axis = 'xyz'.index(direction)
+    except ValueError:
+        raise ValueError("Direction must be 'x', 'y', 'z' or a matrix.")
+    if positions is None:
+        raise ValueError("The positions of the orbitals are needed to obtain "
+                         "the velocity along a direction.")
+    x = np.asarray(positions, dtype=float)[:, axis]
+    ham = ham.tocoo()
+    return scipy.sparse.csr_matrix(
+        (1j * ham.data * (x[ham.col] - x[ham.row]), (ham.row, ham.col)),
+        shape=ham.shape)
+
+
+def _jackson_kernel(n_moments):
+    """Return the Jackson kernel, Eq. (71) of [1]."""
+    m = np.arange(n_moments)
+    return ((n_moments - m + 1) * np.cos(np.pi * m / (n_moments + 1)) +
+            np.sin(np.pi * m / (n_moments + 1)) /
+            np.tan(np.pi / (n_moments + 1))) / (n_moments + 1)
+
+
+def _chebyshev_vectors(ham, alpha):
+    """Yield the blocks T_n(ham) alpha for n = 0, 1, 2, ..."""
+    yield alpha
+    alpha_next = _dot(ham, alpha)
+    while True:
+        yield alpha_next
+        alpha, alpha_next = alpha_next, _chebyshev_step(ham, alpha_next,
+                                                        alpha)
+
+
+def _chebyshev_sum(ham, alpha, coefs):
+    """Return sum_n coefs[n] T_n(ham) alpha."""
+    result = np.zeros(alpha.shape, dtype=complex)
+    for coef, alpha_n in zip(coefs, _chebyshev_vectors(ham, alpha)):
+        result += coef * alpha_n
+    return result
+
+
+def _bessel_coefficients(x, tol):
+    """Return the Chebyshev coefficients of exp(-ix) on [-1, 1].
+
+    The expansion is truncated where the Bessel functions become smaller
+    than `tol`; this happens quickly once the order exceeds ``abs(x)``.
+    """
+    n = np.arange(int(abs(x) * 1.5) + 30)
+    coefs = jv(n, x)
+    significant = np.nonzero(abs(coefs) > tol)[0]
+    n_terms = significant[-1] + 1 if len(significant) else 1
+    coefs = 2 * (-1j)**n[:n_terms] * coefs[:n_terms]
+    coefs[0] /= 2
+    return coefs
+
+
+# Memory in bytes for the stored Chebyshev vectors of `Conductivity`, when
+# `chunk_size` is not given.
+_chunk_memory = 2**28
+
+
+def _correlation_moments(ham, op_a, op_b, alpha_zero, n_moments, chunk_size):
+    """Return sum_r <r| op_a T_m(ham) op_b T_n(ham) |r> for all m and n.
+
+    The vectors r are the columns of `alpha_zero`.  At most `chunk_size`
+    vectors <r| op_a T_m(ham) are stored at once; the recursion for T_n is
+    repeated for each chunk.
+    """
+    moments = np.empty((n_moments, n_moments), dtype=complex)
+    # <r| op_a T_m(ham) = (T_m(ham) op_a^+ |r>)^+
+    left_vectors = _chebyshev_vectors(ham, op_a.conj().T.dot(alpha_zero))
+    for start in range(0, n_moments, chunk_size):
+        stop = min(start + chunk_size, n_moments)
+        lefts = np.array([next(left_vectors).ravel()
+                          for m in range(start, stop)]).conj()
+        for n, right in zip(range(n_moments),
+                            _chebyshev_vectors(ham, alpha_zero)):
+            moments[start:stop, n] = lefts.dot(op_b.dot(right).ravel())
+    return moments
+
+
+def _column_vdot(bra, ket):
+    """Return the scalar products of corresponding columns of two blocks.
+
+    Only the real parts are computed, since only they enter the spectral
+    density.
+    """
+    dtype = np.result_type(bra, ket)
+    bra, ket = (np.ascontiguousarray(x, dtype) for x in (bra, ket))
+    if dtype.kind == 'c':
+        # Re(x^* y) = Re(x) Re(y) + Im(x) Im(y)
+        real = np.finfo(dtype).dtype
+        products = _column_vdot(bra.view(real), ket.view(real))
+        return products.reshape(-1, 2).sum(1)
+    if dtype == np.float32:
+        # Accumulate partial sums over blocks of rows in double precision,
+        # which keeps the error of the sum independent of the system size.
+        step = 4096
+        return sum(np.einsum('ij,ij->j', bra[i:i+step], ket[i:i+step],
+                             dtype=np.float64)
+                   for i in range(0, len(bra), step))
+    return np.einsum('ij,ij->j', bra, ket)
+
+
+def _dot(matrix, vectors):
+    """Return ``matrix.dot(vectors)``.
+
+    A real sparse matrix is applied to the real and imaginary parts of
+    complex vectors at once, in real arithmetic, instead of being converted
+    to a complex matrix.
+    """
+    if matrix.dtype.kind != 'f' or vectors.dtype.kind != 'c':
+        return matrix.dot(vectors)
+    vectors = np.ascontiguousarray(vectors)
+    real = np.finfo(vectors.dtype).dtype
+    product = matrix.dot(vectors.view(real).reshape(vectors.shape[0], -1))
+    complex_dtype = np.promote_types(product.dtype, np.complex64)
+    return product.view(complex_dtype).reshape(vectors.shape)
+
+
+def _single_precision(array):
+    """Return a single precision copy of a dense or sparse array."""
+    return array.astype(np.complex64 if np.iscomplexobj(array)
+                        else np.float32)
+
+
+def _chebyshev_step(ham, alpha, alpha_prev):
+    """Return the next block of the Chebyshev recursion."""
+    alpha_next = _dot(ham, alpha)
+    alpha_next *= 2
+    alpha_next -= alpha_prev
+    return alpha_next
+
+
+def _rescale(ham, epsilon, v0, bounds, scale=None, rng=None):
+    """Rescale a Hamiltonian and return it as a sparse matrix
 
     Parameters
     ----------
@@ -466,37 +1052,160 @@ def _rescale(ham, epsilon, v0, bounds):
     v0 : random vector, or None
         Used as the initial residual vector for the algorithm that
         finds the lowest and highest eigenvalues.
-    bounds : tuple, or None
+    bounds : tuple, string, or None
         Boundaries of the spectrum. If not provided the maximum and
-        minimum eigenvalues are calculated.
+        minimum eigenvalues are calculated.  If a string, the name of
+        the method used to estimate them, see `_spectral_bounds`.
+    scale : tuple, or None
+        The factors ``(a, b)`` of a previous rescaling.  If provided,
+        they are used instead of the bounds.
+    rng : random number generator, or None
+        Used for the starting vector of the Lanczos estimate of the bounds.
     """
     # Relative tolerance to which to calculate eigenvalues.  Because after
     # rescaling we will add epsilon / 2 to the spectral bounds, we don't need
     # to know the bounds more accurately than epsilon / 2.
     tol = epsilon / 2
+    ham = scipy.sparse.csr_matrix(ham)
 
-    if bounds:
-        lmin, lmax = bounds
+    if scale is not None:
+        a, b = scale
     else:
-        lmax = float(sla.eigsh(ham, k=1, which='LA', return_eigenvectors=False,
-                               tol=tol, v0=v0))
-        lmin = float(sla.eigsh(ham, k=1, which='SA', return_eigenvectors=False,
-                               tol=tol, v0=v0))
+        if bounds is None or isinstance(bounds, str):
+            lmin, lmax = _spectral_bounds(ham, bounds, tol, v0, rng)
+        else:
+            lmin, lmax = bounds
+
+        a = np.abs(lmax-lmin) / (2. - epsilon)
+        b = (lmax+lmin) / 2.
 
-    a = np.abs(lmax-lmin) / (2. - epsilon)
-    b = (lmax+lmin) / 2.
+        if lmax - lmin <= abs(lmax + lmin) * tol / 2:
+            raise ValueError(
+                'The Hamiltonian has a single eigenvalue, it is not possible '
+                'to obtain a spectral density.')
+
+    rescaled_ham = (ham -
+                    b * scipy.sparse.identity(ham.shape[0], format='csr')) / a
 
-    if lmax - lmin <= abs(lmax + lmin) * tol / 2:
-        raise ValueError(
-            'The Hamiltonian has a single eigenvalue, it is not possible to '
-            'obtain a spectral density.')
+    return rescaled_ham.tocsr(), (a, b)
 
-    def rescaled(v):
-        return (ham.dot(v) - b * v) / a
 
-    rescaled_ham = sla.LinearOperator(shape=ham.shape, matvec=rescaled)
+def _spectral_bounds(ham, method, tol, v0, rng=None):
+    """Return the lower and upper bounds of the spectrum of 'ham'.
 
-    return rescaled_ham, (a, b)
+    Parameters
+    ----------
+    ham : CSR matrix
+        Hermitian matrix.
+    method : None, or one of 'gershgorin', 'lanczos', or 'fast'
+        If None, the extremal eigenvalues are calculated with two calls
+        to ``eigsh``.  'gershgorin' gives strict but possibly loose bounds
+        from the Gershgorin discs.  'lanczos' estimates both extremal
+        eigenvalues with a single short Lanczos run.  'fast' combines
+        the two: Lanczos bounds, clipped to the Gershgorin bounds.  The
+        Lanczos estimates are checked with `_check_bounds`, and replaced
+        by the result of ``eigsh`` if the check fails.
+    tol : float
+        Relative tolerance to which the bounds are required.
+    v0 : vector, or None
+        Starting vector of ``eigsh``.
+    rng : seed, or random number generator, optional
+        Random number generator for the starting vector of the Lanczos run.
+    """
+    if method not in (None, 'gershgorin', 'lanczos', 'fast'):
+        raise ValueError("'bounds' must be a pair of floats, None, or one "
+                         "of 'fast', 'lanczos', 'gershgorin'.")
+
+    if method == 'gershgorin':
+        lmin, lmax = _gershgorin_bounds(ham)
+    elif method is not None:
+        # Unlike 'v0', which may e.g. be localized, a random phase vector
+        # overlaps with all the eigenvectors.
+        rng = ensure_rng(rng)
+        start = np.exp(2j * np.pi * rng.random_sample(ham.shape[0]))
+        lmin, lmax = _lanczos_bounds(ham, tol, start)
+        if method == 'fast':
+            gmin, gmax = _gershgorin_bounds(ham)
+            lmin, lmax = max(lmin, gmin), min(lmax, gmax)
+        if not _check_bounds(ham, lmin, lmax, tol, start):
+            # The Lanczos run missed an extremal eigenvalue.
+            method = None
+    if method is None:
+        lmax = float(sla.eigsh(ham, k=1, which='LA',
+                               return_eigenvectors=False, tol=tol, v0=v0))
+        lmin = float(sla.eigsh(ham, k=1, which='SA',
+                               return_eigenvectors=False, tol=tol, v0=v0))
+    return lmin, lmax
+
+
+def _gershgorin_bounds(ham):
+    """Return the union of the Gershgorin discs of a Hermitian CSR matrix."""
+    diagonal = ham.diagonal().real
+    if not ham.nnz:
+        return 0, 0
+    radii = np.add.reduceat(np.abs(ham.data), ham.indptr[:-1])
+    # 'reduceat' returns the next element for empty rows.
+    radii[np.diff(ham.indptr) == 0] = 0
+    radii -= np.abs(diagonal)
+    return np.min(diagonal - radii), np.max(diagonal + radii)
+
+
+def _lanczos_bounds(ham, tol, v0, max_steps=100):
+    """Estimate the extremal eigenvalues of 'ham' with the Lanczos algorithm.
+
+    Both extremes are obtained from a single run.  The Ritz values are
+    widened by their residual norms.  A small residual only guarantees an
+    eigenvalue close to the Ritz value, so an extremal eigenvalue that has
+    a small overlap with `v0` may be missed; see `_check_bounds`.
+    """
+    size = ham.shape[0]
+    vector = v0 / np.linalg.norm(v0)
+    vector_prev = np.zeros_like(vector)
+    alphas, betas = [], []
+    beta = 0
+    for step in range(min(max_steps, size)):
+        w = ham.dot(vector) - beta * vector_prev
+        alpha = np.vdot(vector, w).real
+        w -= alpha * vector
+        beta = np.linalg.norm(w)
+        alphas.append(alpha)
+        betas.append(beta)
+
+        tridiagonal = (np.diag(alphas) + np.diag(betas[:-1], 1)
+                       + np.diag(betas[:-1], -1))
+        ritz_values, ritz_vectors = np.linalg.eigh(tridiagonal)
+        residuals = beta * np.abs(ritz_vectors[-1, [0, -1]])
+        lmin = ritz_values[0] - residuals[0]
+        lmax = ritz_values[-1] + residuals[1]
+        # Stop when the Krylov space is invariant, or when both bounds
+        # are known to the required precision.
+        if max(residuals) <= tol * (lmax - lmin) / 2:
+            break
+        vector_prev, vector = vector, w / beta
+    return lmin, lmax
+
+
+def _check_bounds(ham, lmin, lmax, tol, v0, n_steps=50):
+    """Check that the spectrum of 'ham' lies between 'lmin' and 'lmax'.
+
+    'ham' is rescaled as in `_rescale`, with ``epsilon = 2 * tol``.  If its
+    spectrum lies within [-1, 1], the Chebyshev polynomials T_n(ham) do not
+    increase the norm of any vector.  An eigenvalue outside makes the norm
+    grow exponentially with n, such that a vector with an overlap as small
+    as ~1e-7 with its eigenvector reveals it within `n_steps` steps.
+    """
+    try:
+        ham = _rescale(ham, 2 * tol, None, (lmin, lmax))[0]
+    except ValueError:
+        return False
+    norm = np.linalg.norm(v0) * (1 + 1e-6)
+    alpha, alpha_next = v0, ham.dot(v0)
+    for n in range(n_steps):
+        if np.linalg.norm(alpha_next) > norm:
+            return False
+        alpha, alpha_next = alpha_next, _chebyshev_step(ham, alpha_next,
+                                                        alpha)
+    return True
 
 
 def _calc_fft_moments(moments, n_sampling):
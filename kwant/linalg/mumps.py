@@ -11,7 +11,9 @@
 __all__ = ['MUMPSContext', 'schur_complement', 'AnalysisStatistics',
            'FactorizationStatistics', 'MUMPSError']
 
+import os
 import time
+from contextlib import contextmanager
 import numpy as np
 import scipy.sparse
 import warnings
@@ -72,7 +74,9 @@ error_messages = {
     -10 : "Matrix is numerically singular",
     -11 : "The authors of MUMPS would like to hear about this",
     -12 : "The authors of MUMPS would like to hear about this",
-    -13 : "Not enough memory"
+    -13 : "Not enough memory",
+    -19 : "Maximum allowed working memory (memory_limit) too small",
+    -90 : "Error in out-of-core management"
 }
 
 class MUMPSError(RuntimeError):
@@ -172,6 +176,10 @@ class MUMPSContext:
     factor_stats : `FactorizationStatistics`
         contains MUMPS statistics after a factorization step (i.e.  after a
         call to `factor`)
+    schur : NumPy array or None
+        the Schur complement block computed by `factor`, if the analysis was
+        done with `schur_indices`.  It is overwritten by subsequent
+        factorizations.
 
     """
 
@@ -189,8 +197,10 @@ class MUMPSContext:
         self.dtype = None
         self.verbose = verbose
         self.factored = False
+        self.schur = None
 
-    def analyze(self, a, ordering='auto', overwrite_a=False):
+    def analyze(self, a, ordering='auto', overwrite_a=False,
+                schur_indices=None):
         """Perform analysis step of MUMPS.
 
         In the analyis step, MUMPS figures out a reordering for the matrix and
@@ -213,6 +223,11 @@ class MUMPSContext:
         overwrite_a : True or False
             whether the data in a may be overwritten, which can lead to a small
             performance gain. Default is False.
+        schur_indices : 1d array or None
+            if given, subsequent factorizations compute the Schur complement
+            block of these indices (see `schur_complement`) and store it in
+            `schur`, instead of a factorization that can be used by `solve`.
+            Default is None.
         """
 
         a = a.tocoo()
@@ -238,6 +253,17 @@ class MUMPSContext:
 
         self.mumps_instance.set_assembled_matrix(a.shape[0], row, col, data)
         self.mumps_instance.icntl[7] = orderings[ordering]
+        if schur_indices is None:
+            self.schur = self.schur_indices = None
+            self.mumps_instance.icntl[19] = 0
+        else:
+            self.schur_indices = _make_mumps_index_array(
+                np.asanyarray(schur_indices))
+            n_schur = self.schur_indices.size
+            self.schur = np.empty((n_schur, n_schur), order='C',
+                                  dtype=data.dtype)
+            self.mumps_instance.set_schur(self.schur, self.schur_indices)
+            self.mumps_instance.icntl[19] = 1
         self.mumps_instance.job = 1
         t1 = time.clock()
         self.mumps_instance.call()
@@ -251,7 +277,8 @@ class MUMPSContext:
                                                  t2 - t1)
 
     def factor(self, a, ordering='auto', ooc=False, pivot_tol=0.01,
-               reuse_analysis=False, overwrite_a=False):
+               reuse_analysis=False, overwrite_a=False, ooc_dir=None,
+               memory_limit=None):
         """Perform the LU factorization of the matrix.
 
         This LU factorization can then later be used to solve a linear system
@@ -287,6 +314,16 @@ class MUMPSContext:
         overwrite_a : True or False
             whether the data in a may be overwritten, which can lead to a small
             performance gain. Default is False.
+        ooc_dir : string or None
+            directory in which the factors are stored if ``ooc=True``.  If
+            None, the environment variable ``MUMPS_OOC_TMPDIR`` or the MUMPS
+            default is used.  Default is None.
+        memory_limit : number or None
+            maximal working memory in megabytes that MUMPS may allocate.  If
+            this is not sufficient for the factorization, a `MUMPSError` is
+            raised.  Together with ``ooc=True`` this bounds the memory usage
+            of the factorization.  If None, MUMPS chooses the working memory
+            based on the estimates of the analysis.  Default is None.
         """
         a = a.tocoo()
 
@@ -318,19 +355,23 @@ class MUMPSContext:
             self.analyze(a, ordering=ordering, overwrite_a=overwrite_a)
 
         self.mumps_instance.icntl[22] = 1 if ooc else 0
+        self.mumps_instance.icntl[23] = int(memory_limit or 0)
         self.mumps_instance.job = 2
         self.mumps_instance.cntl[1] = pivot_tol
 
         done = False
         while not done:
             t1 = time.clock()
-            self.mumps_instance.call()
+            with _ooc_tmpdir(ooc_dir if ooc else None):
+                self.mumps_instance.call()
             t2 = time.clock()
 
             # error -8, -9 (not enough allocated memory) is treated
-            # specially, by increasing the memory relaxation parameter
+            # specially, by increasing the memory relaxation parameter, unless
+            # the memory is limited explicitly
             if self.mumps_instance.infog[1] < 0:
-                if self.mumps_instance.infog[1] in (-8, -9):
+                if (self.mumps_instance.infog[1] in (-8, -9) and
+                    not memory_limit):
                     # double the additional memory
                     self.mumps_instance.icntl[14] *= 2
                 else:
@@ -342,6 +383,28 @@ class MUMPSContext:
         self.factor_stats = FactorizationStatistics(self.mumps_instance,
                                                     t2 - t1)
 
+    def free_factors(self):
+        """Free the memory of the factorization, but keep the analysis.
+
+        A subsequent `factor` with ``reuse_analysis=True`` is then still
+        possible.  This requires MUMPS 5.5 or later.
+
+        Returns
+        -------
+
+        freed : True or False
+            whether the factorization was freed.  If False, the installed
+            MUMPS does not support this, and the context is unchanged.
+        """
+        if not self.factored:
+            return True
+        self.mumps_instance.job = -4
+        self.mumps_instance.call()
+        if self.mumps_instance.infog[1] < 0:
+            return False
+        self.factored = False
+        return True
+
     def _solve_sparse(self, b):
         b = b.tocsc()
         x = np.empty((b.shape[0], b.shape[1]),
@@ -411,6 +474,9 @@ class MUMPSContext:
 
         if not self.factored:
             raise RuntimeError("Factorization must be done before solving!")
+        if self.schur is not None:
+            raise RuntimeError("Cannot solve after a factorization with a "
+                               "Schur complement!")
 
         if scipy.sparse.isspmatrix(b):
             return self._solve_sparse(b)
@@ -494,6 +560,9 @@ def schur_complement(a, indices, ordering='auto', ooc=False, pivot_tol=0.01,
     mumps_instance.call()
     t2 = time.clock()
 
+    if mumps_instance.infog[1] < 0:
+        raise MUMPSError(mumps_instance.infog)
+
     if not calc_stats:
         return schur_compl
     else:
@@ -502,6 +571,23 @@ def schur_complement(a, indices, ordering='auto', ooc=False, pivot_tol=0.01,
 
 
 # Some internal helper functions
+@contextmanager
+def _ooc_tmpdir(directory):
+    """Temporarily set the directory used by MUMPS for out-of-core files."""
+    if directory is None:
+        yield
+        return
+    saved = os.environ.get('MUMPS_OOC_TMPDIR')
+    os.environ['MUMPS_OOC_TMPDIR'] = str(directory)
+    try:
+        yield
+    finally:
+        if saved is None:
+            del os.environ['MUMPS_OOC_TMPDIR']
+        else:
+            os.environ['MUMPS_OOC_TMPDIR'] = saved
+
+
 def _make_assembled_from_coo(a, overwrite_a):
     dtype, data = prepare_for_fortran(overwrite_a, a.data)
 
@@ -88,3 +88,17 @@ def test_factor_warning():
     a = sp.identity(10, dtype=complex)
     with pytest.warns(RuntimeWarning):
         MUMPSContext().factor(a, reuse_analysis=True)
+
+
+def test_out_of_core(tmpdir):
+    rand = _Random()
+    a = rand.randmat(20, 20, np.complex128)
+    b = rand.randvec(20, np.complex128)
+
+    ctx = MUMPSContext()
+    ctx.factor(sp.coo_matrix(a), ooc=True, ooc_dir=str(tmpdir))
+    assert_array_almost_equal(np.complex128, np.dot(a, ctx.solve(b)), b)
+
+    mem = ctx.analysis_stats.est_mem_incore
+    ctx.factor(sp.coo_matrix(a), reuse_analysis=True, memory_limit=10 * mem)
+    assert_array_almost_equal(np.complex128, np.dot(a, ctx.solve(b)), b)
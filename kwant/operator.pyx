@@ -16,7 +16,7 @@ import collections
 
 import numpy as np
 import tinyarray as ta
-from scipy.sparse import coo_matrix
+from scipy.sparse import coo_matrix, csr_matrix
 
 from libc cimport math
 
@@ -394,6 +394,23 @@ cdef class BlockSparseMatrix:
         ) = state
 
 
+def _elements_matrices(gint[:] pair_where, gint[:] index, gint[:] indptr,
+                       gint[:] cols, complex[:] data, gint n_where,
+                       gint tot_norbs):
+    """Assemble the matrices returned by `_LocalOperator._sparse_elements`.
+
+    Pair ``p`` combines the element ``pair_where[p]`` of ``where`` with the
+    orbital ``index[p]`` of the bra.  ``indptr``, ``cols`` and ``data`` are
+    the rows of the operator that belong to the pairs, in CSR format.
+    """
+    n_pairs = index.shape[0]
+    matrix = csr_matrix((np.asarray(data), np.asarray(cols),
+                         np.asarray(indptr)), shape=(n_pairs, tot_norbs))
+    reduce = csr_matrix((np.ones(n_pairs), np.asarray(pair_where),
+                         np.arange(n_pairs + 1)), shape=(n_pairs, n_where))
+    return np.asarray(index), matrix, reduce.T.tocsr()
+
+
 ################ Local Observables
 
 # supported operations within the `_operate` method
@@ -435,6 +452,7 @@ cdef class _LocalOperator:
     cdef public object syst, onsite, _onsite_params_info
     cdef public gint[:, :]  where, _site_ranges
     cdef public BlockSparseMatrix _bound_onsite, _bound_hamiltonian
+    cdef public object _bound_elements
 
     @cython.embedsignature
     def __init__(self, syst, onsite, where, *,
@@ -454,9 +472,11 @@ cdef class _LocalOperator:
         self.where = where
         self._bound_onsite = None
         self._bound_hamiltonian = None
+        self._bound_elements = None
 
     @cython.embedsignature
-    def __call__(self, bra, ket=None, args=(), *, params=None):
+    def __call__(self, bra, ket=None, args=(), *, params=None,
+                 sum_vectors=False):
         r"""Return the matrix elements of the operator.
 
         An operator ``A`` can be called like
@@ -482,7 +502,10 @@ cdef class _LocalOperator:
         bra, ket : sequence of complex
             Must have the same length as the number of orbitals
             in the system. If only one is provided, both ``bra``
-            and ``ket`` are taken as equal.
+            and ``ket`` are taken as equal.  2D arrays with one
+            wavefunction per row, such as the scattering states returned
+            by `~kwant.solvers.default.wave_function`, are also accepted;
+            the matrix elements are then computed for all of them at once.
         args : tuple, optional
             The arguments to pass to the system. Used to evaluate
             the ``onsite`` elements and, possibly, the system Hamiltonian.
@@ -490,29 +513,31 @@ cdef class _LocalOperator:
         params : dict, optional
             Dictionary of parameter names and their values. Mutually exclusive
             with 'args'.
+        sum_vectors : bool, default: False
+            If True and ``bra`` and ``ket`` are 2D, then the matrix elements
+            are summed over the wavefunctions, without storing them for each
+            wavefunction separately.  This gives, for instance, the current
+            carried by all the modes of a lead.
 
         Returns
         -------
         `float` if ``check_hermiticity`` is True, and ``ket`` is ``None``,
         otherwise `complex`. If this operator was created with ``sum=True``,
         then a single value is returned, otherwise an array is returned.
+        If ``bra`` and ``ket`` are 2D and ``sum_vectors`` is False, the
+        result has an additional first axis, running over the wavefunctions.
         """
-        if (self._bound_onsite or self._bound_hamiltonian) and (args or params):
-            raise ValueError("Extra arguments are already bound to this "
-                             "operator. You should call this operator "
-                             "providing neither 'args' nor 'params'.")
-        if args and params:
-            raise TypeError("'args' and 'params' are mutually exclusive.")
+        self._check_bound(args, params)
         if bra is None:
             raise TypeError('bra must be an array')
         bra = np.asarray(bra, dtype=complex)
         ket = bra if ket is None else np.asarray(ket, dtype=complex)
         tot_norbs = _get_tot_norbs(self.syst)
-        if bra.shape != (tot_norbs,):
+        if bra.ndim not in (1, 2) or bra.shape[-1] != tot_norbs:
             msg = 'vector is incorrect shape'
             msg = 'bra ' + msg if ket is None else msg
             raise ValueError(msg)
-        elif ket.shape != (tot_norbs,):
+        elif ket.shape != bra.shape:
             raise ValueError('ket vector is incorrect shape')
 
         where = np.asarray(self.where)
@@ -521,13 +546,18 @@ cdef class _LocalOperator:
             # if `where` just contains sites, then we want a strictly 1D array
             where = where.reshape(-1)
 
-        result = np.zeros((self.where.shape[0],), dtype=complex)
-        self._operate(out_data=result, bra=bra, ket=ket, args=args,
+        single = bra.ndim == 1 or sum_vectors
+        result = np.zeros((1 if single else bra.shape[0],
+                           self.where.shape[0]), dtype=complex)
+        self._operate(out_data=result, bra=bra.reshape(-1, tot_norbs),
+                      ket=ket.reshape(-1, tot_norbs), args=args,
                       params=params, op=MAT_ELS)
         # if everything is Hermitian then result is real if bra == ket
         if self.check_hermiticity and bra is ket:
             result = result.real
-        return np.sum(result) if self.sum else result
+        if single:
+            result = result[0]
+        return np.sum(result, axis=-1) if self.sum else result
 
     @cython.embedsignature
     def act(self, ket, args=(), *, params=None):
@@ -540,6 +570,7 @@ cdef class _LocalOperator:
         ----------
         ket : sequence of complex
             Wavefunctions defined over all the orbitals of the system.
+            A 2D array is taken to contain one wavefunction per row.
         args : tuple
             The extra arguments to the Hamiltonian value functions and
             the operator ``onsite`` function. Mutually exclusive with 'params'.
@@ -549,23 +580,18 @@ cdef class _LocalOperator:
 
         Returns
         -------
-        Array of `complex`.
+        Array of `complex`, with the same shape as ``ket``.
         """
-        if (self._bound_onsite or self._bound_hamiltonian) and (args or params):
-            raise ValueError("Extra arguments are already bound to this "
-                             "operator. You should call this operator "
-                             "providing neither 'args' nor 'params'.")
-        if args and params:
-            raise TypeError("'args' and 'params' are mutually exclusive.")
-
+        self._check_bound(args, params)
         if ket is None:
             raise TypeError('ket must be an array')
         ket = np.asarray(ket, dtype=complex)
         tot_norbs = _get_tot_norbs(self.syst)
-        if ket.shape != (tot_norbs,):
+        if ket.ndim not in (1, 2) or ket.shape[-1] != tot_norbs:
             raise ValueError('ket vector is incorrect shape')
-        result = np.zeros((tot_norbs,), dtype=np.complex)
-        self._operate(out_data=result, bra=None, ket=ket, args=args,
+        result = np.zeros(ket.shape, dtype=np.complex)
+        self._operate(out_data=result.reshape(-1, tot_norbs), bra=None,
+                      ket=ket.reshape(-1, tot_norbs), args=args,
                       params=params, op=ACT)
         return result
 
@@ -590,22 +616,99 @@ cdef class _LocalOperator:
         q.check_hermiticity = self.check_hermiticity
         if callable(self.onsite):
             q._bound_onsite = self._eval_onsites(args, params)
-        # NOTE: subclasses should populate `bound_hamiltonian` if needed
+        # NOTE: subclasses should populate `bound_hamiltonian` if needed, and
+        # then `_bound_elements`
         return q
 
-    def _operate(self, complex[:] out_data, complex[:] bra, complex[:] ket,
-                 args, operation op, *, params=None):
+    def _sparse_elements(self, args=(), *, params=None):
+        """Return a sparse representation of the matrix elements.
+
+        Returns a tuple ``(index, matrix, reduce)`` of an integer array and
+        two sparse matrices.  The matrix elements between ``bra`` and ``ket``
+        are ``reduce.dot(bra[index].conj() * matrix.dot(ket))``, before they
+        are summed if ``sum`` is True.  This also holds if ``bra`` and
+        ``ket`` are 2D arrays with one wavefunction per column, such that
+        many matrix elements can be evaluated without calling the operator.
+
+        For a bound operator, the matrices are assembled once by `bind`.
+        """
+        raise NotImplementedError()
+
+    @cython.embedsignature
+    def tocoo(self, args=(), *, params=None, stacked=False):
+        """Convert the operator to coordinate format sparse matrix.
+
+        Parameters
+        ----------
+        args : tuple, optional
+            The arguments to pass to the system. Mutually exclusive with
+            'params'.
+        params : dict, optional
+            Dictionary of parameter names and their values. Mutually exclusive
+            with 'args'.
+        stacked : bool, default: False
+            If False, the matrix acts on a wavefunction like `act`, that is,
+            the contributions of all the elements of ``where`` are summed.
+            If True, the contributions are kept separate, see below.
+
+        Returns
+        -------
+        matrix : `scipy.sparse.coo_matrix`
+            If ``stacked`` is False, the square matrix of the operator.
+            Otherwise, a matrix with one row block per element of ``where``:
+            the rows ``offsets[i]:offsets[i + 1]`` are the nonzero rows of
+            the contribution :math:`Q_{iαβ}` of element ``i``.
+        orbitals : array of int
+            Only returned if ``stacked`` is True.  The orbital :math:`α` of
+            each row of ``matrix``.
+        offsets : array of int
+            Only returned if ``stacked`` is True.  The start of the row block
+            of each element of ``where``, followed by the number of rows.
+
+        Notes
+        -----
+        The stacked form evaluates the matrix elements for many wavefunctions
+        without calling the operator.  With ``bra`` and ``ket`` holding one
+        wavefunction per column, the matrix elements of the elements of
+        ``where`` (as returned with ``sum=False``) are::
+
+            np.add.reduceat(bra[orbitals].conj() * matrix.dot(ket),
+                            offsets[:-1])
+        """
+        index, matrix, reduce = self._sparse_elements(args, params=params)
+        if stacked:
+            return (matrix.tocoo(copy=True), np.array(index),
+                    np.array(reduce.indptr))
+        matrix = matrix.tocoo()
+        norbs = _get_tot_norbs(self.syst)
+        result = coo_matrix((matrix.data, (index[matrix.row], matrix.col)),
+                            shape=(norbs, norbs))
+        result.sum_duplicates()
+        return result
+
+    def _check_bound(self, args, params):
+        if ((self._bound_onsite or self._bound_hamiltonian)
+            and (args or params)):
+            raise ValueError("Extra arguments are already bound to this "
+                             "operator. You should call this operator "
+                             "providing neither 'args' nor 'params'.")
+        if args and params:
+            raise TypeError("'args' and 'params' are mutually exclusive.")
+
+    def _operate(self, complex[:, :] out_data, complex[:, :] bra,
+                 complex[:, :] ket, args, operation op, *, params=None):
         """Do an operation with the operator.
 
         Parameters
         ----------
         out_data : ndarray
             Output array, zero on entry. On exit should contain the required
-            data.  What this means depends on the value of `op`, as does the
-            length of the array.
+            data, one row per wavefunction.  What this means depends on the
+            value of `op`, as does the length of the rows.  If it has a single
+            row, the results for all the wavefunctions are summed.
         bra, ket : ndarray
-            Wavefunctions defined over all the orbitals of the system.
-            If `op` is `ACT` then `bra` is None.
+            Wavefunctions defined over all the orbitals of the system, one
+            per row.  If `op` is `ACT` then `bra` is None.
         args : tuple
             The extra arguments to the Hamiltonian value functions and
             the operator ``onsite`` function. Mutually exclusive with 'params'.
@@ -660,14 +763,16 @@ cdef class _LocalOperator:
             (self.check_hermiticity, self.sum),
             (self.syst, self.onsite, self._onsite_params_info),
             tuple(map(np.asarray, (self.where, self._site_ranges))),
-            (self._bound_onsite, self._bound_hamiltonian),
+            (self._bound_onsite, self._bound_hamiltonian,
+             self._bound_elements),
         )
 
     def __setstate__(self, state):
         ((self.check_hermiticity, self.sum),
          (self.syst, self.onsite, self._onsite_params_info),
          (self.where, self._site_ranges),
-         (self._bound_onsite, self._bound_hamiltonian),
+         (self._bound_onsite, self._bound_hamiltonian,
+          self._bound_elements),
         ) = state
 
 
@@ -715,10 +820,21 @@ cdef class Density(_LocalOperator):
         super().__init__(syst, onsite, where,
                          check_hermiticity=check_hermiticity, sum=sum)
 
+    @cython.embedsignature
+    def bind(self, args=(), *, params=None):
+        """Bind the given arguments to this operator.
+
+        Returns a copy of this operator that does not need to be passed extra
+        arguments when subsequently called or when using the ``act`` method.
+        """
+        q = super().bind(args, params=params)
+        q._bound_elements = q._sparse_elements()
+        return q
+
     @cython.boundscheck(False)
     @cython.wraparound(False)
-    def _operate(self, complex[:] out_data, complex[:] bra, complex[:] ket,
-                 args, operation op, *, params=None):
+    def _operate(self, complex[:, :] out_data, complex[:, :] bra,
+                 complex[:, :] ket, args, operation op, *, params=None):
         matrix = ta.matrix
         cdef int unique_onsite = not callable(self.onsite)
         # prepare onsite matrices
@@ -736,7 +852,9 @@ cdef class Density(_LocalOperator):
 
         # loop-local variables
         cdef gint a, a_s, a_norbs
-        cdef gint i, j, w
+        cdef gint i, j, w, v, r
+        cdef gint n_vecs = ket.shape[0]
+        cdef int sum_vecs = out_data.shape[0] < n_vecs
         cdef complex tmp, bra_conj
         ### loop over sites
         for w in range(self.where.shape[0]):
@@ -746,30 +864,87 @@ cdef class Density(_LocalOperator):
             ### get the next onsite matrix, if necessary
             if not unique_onsite:
                 M_a = M_a_blocks.get(w)
-            ### do the actual calculation
-            if op == MAT_ELS:
-                tmp = 0
-                for i in range(a_norbs):
-                    for j in range(a_norbs):
-                        tmp += (bra[a_s + i].conjugate() *
-                                M_a[i * a_norbs + j] * ket[a_s + j])
-                out_data[w] = tmp
-            elif op == ACT:
-                for i in range(a_norbs):
+            ### do the actual calculation for all wavefunctions
+            for v in range(n_vecs):
+                r = 0 if sum_vecs else v
+                if op == MAT_ELS:
                     tmp = 0
-                    for j in range(a_norbs):
-                        tmp += M_a[i * a_norbs + j] * ket[a_s + j]
-                    out_data[a_s + i] = out_data[a_s + i] + tmp
+                    for i in range(a_norbs):
+                        for j in range(a_norbs):
+                            tmp += (bra[v, a_s + i].conjugate() *
+                                    M_a[i * a_norbs + j] * ket[v, a_s + j])
+                    out_data[r, w] = out_data[r, w] + tmp
+                elif op == ACT:
+                    for i in range(a_norbs):
+                        tmp = 0
+                        for j in range(a_norbs):
+                            tmp += M_a[i * a_norbs + j] * ket[v, a_s + j]
+                        out_data[r, a_s + i] = out_data[r, a_s + i] + tmp
+
+    @cython.boundscheck(False)
+    @cython.wraparound(False)
+    def _sparse_elements(self, args=(), *, params=None):
+        self._check_bound(args, params)
+        if self._bound_elements is not None:
+            return self._bound_elements
+        cdef int unique_onsite = not callable(self.onsite)
+        cdef complex[:, :] _tmp_mat
+        cdef complex *M_a = NULL
+        cdef BlockSparseMatrix M_a_blocks
+
+        if unique_onsite:
+            _tmp_mat = self.onsite
+            M_a = <complex*> &_tmp_mat[0, 0]
+        elif self._bound_onsite:
+            M_a_blocks = self._bound_onsite
+        else:
+            M_a_blocks = self._eval_onsites(args, params)
+
+        cdef gint[:, :] offsets, norbs
+        offsets, norbs = _get_all_orbs(self.where, self._site_ranges)
+        cdef gint n_pairs = np.sum(norbs[:, 0])
+        cdef gint[:] pair_where = np.empty(n_pairs, gint_dtype)
+        cdef gint[:] index = np.empty(n_pairs, gint_dtype)
+        cdef gint[:] indptr = np.empty(n_pairs + 1, gint_dtype)
+        cdef gint nnz = np.sum(np.square(norbs[:, 0]))
+        cdef gint[:] cols = np.empty(nnz, gint_dtype)
+        cdef complex[:] data = np.empty(nnz, complex)
+
+        cdef gint a_s, a_norbs, i, j, w, p = 0, k = 0
+        for w in range(self.where.shape[0]):
+            a_s = offsets[w, 0]
+            a_norbs = norbs[w, 0]
+            if not unique_onsite:
+                M_a = M_a_blocks.get(w)
+            for i in range(a_norbs):
+                pair_where[p] = w
+                index[p] = a_s + i
+                indptr[p] = k
+                p += 1
+                for j in range(a_norbs):
+                    cols[k] = a_s + j
+                    data[k] = M_a[i * a_norbs + j]
+                    k += 1
+        indptr[p] = k
+        return _elements_matrices(pair_where, index, indptr, cols, data,
+                                  self.where.shape[0],
+                                  _get_tot_norbs(self.syst))
 
     @cython.boundscheck(False)
     @cython.wraparound(False)
     @cython.cdivision(True)
     @cython.embedsignature
-    def tocoo(self, args=(), *, params=None):
-        """Convert the operator to coordinate format sparse matrix."""
+    def tocoo(self, args=(), *, params=None, stacked=False):
+        """Convert the operator to coordinate format sparse matrix.
+
+        See `_LocalOperator.tocoo` for the meaning of ``stacked``.
+        """
         cdef int blk, blk_size, n_blocks, n, k = 0
         cdef int [:, :] offsets, shapes
         cdef int [:] row, col
+        if stacked:
+            return _LocalOperator.tocoo(self, args, params=params,
+                                        stacked=True)
         if self._bound_onsite and (args or params):
            raise ValueError("Extra arguments are already bound to this "
                             "operator. You should call this operator "
@@ -868,12 +1043,92 @@ cdef class Current(_LocalOperator):
         """
         q = super().bind(args, params=params)
         q._bound_hamiltonian = self._eval_hamiltonian(args, params)
+        q._bound_elements = q._sparse_elements()
         return q
 
     @cython.boundscheck(False)
     @cython.wraparound(False)
-    def _operate(self, complex[:] out_data, complex[:] bra, complex[:] ket,
-                 args, operation op, *, params=None):
+    def _sparse_elements(self, args=(), *, params=None):
+        self._check_bound(args, params)
+        if self._bound_elements is not None:
+            return self._bound_elements
+        cdef int unique_onsite = not callable(self.onsite)
+        cdef complex[:, :] _tmp_mat
+        cdef complex *M_a = NULL
+        cdef complex *H_ab = NULL
+        cdef BlockSparseMatrix M_a_blocks, H_ab_blocks
+
+        if unique_onsite:
+            _tmp_mat = self.onsite
+            M_a = <complex*> &_tmp_mat[0, 0]
+        elif self._bound_onsite:
+            M_a_blocks = self._bound_onsite
+        else:
+            M_a_blocks = self._eval_onsites(args, params)
+
+        if self._bound_hamiltonian:
+            H_ab_blocks = self._bound_hamiltonian
+        else:
+            H_ab_blocks = self._eval_hamiltonian(args, params)
+
+        # Each hopping contributes the orbitals of both of its sites to the
+        # bra, and each of them couples to all orbitals of the other site.
+        shapes = np.asarray(H_ab_blocks.block_shapes)
+        cdef gint n_pairs = np.sum(shapes)
+        cdef gint[:] pair_where = np.empty(n_pairs, gint_dtype)
+        cdef gint[:] index = np.empty(n_pairs, gint_dtype)
+        cdef gint[:] indptr = np.empty(n_pairs + 1, gint_dtype)
+        cdef gint nnz = 2 * np.sum(np.prod(shapes, axis=1))
+        cdef gint[:] cols = np.empty(nnz, gint_dtype)
+        cdef complex[:] data = np.empty(nnz, complex)
+
+        cdef gint a_s, a_norbs, b_s, b_norbs
+        cdef gint i, j, k, w, p = 0, n = 0
+        cdef complex tmp
+        for w in range(self.where.shape[0]):
+            a_s = H_ab_blocks.block_offsets[w, 0]
+            b_s = H_ab_blocks.block_offsets[w, 1]
+            a_norbs = H_ab_blocks.block_shapes[w, 0]
+            b_norbs = H_ab_blocks.block_shapes[w, 1]
+            H_ab = H_ab_blocks.get(w)
+            if not unique_onsite:
+                M_a = M_a_blocks.get(w)
+            # bra on site b: i (H_ab^† M_a)
+            for i in range(b_norbs):
+                pair_where[p] = w
+                index[p] = b_s + i
+                indptr[p] = n
+                p += 1
+                for k in range(a_norbs):
+                    tmp = 0
+                    for j in range(a_norbs):
+                        tmp += (H_ab[j * b_norbs + i].conjugate() *
+                                M_a[j * a_norbs + k])
+                    cols[n] = a_s + k
+                    data[n] = 1j * tmp
+                    n += 1
+            # bra on site a: -i (M_a H_ab)
+            for j in range(a_norbs):
+                pair_where[p] = w
+                index[p] = a_s + j
+                indptr[p] = n
+                p += 1
+                for i in range(b_norbs):
+                    tmp = 0
+                    for k in range(a_norbs):
+                        tmp += M_a[j * a_norbs + k] * H_ab[k * b_norbs + i]
+                    cols[n] = b_s + i
+                    data[n] = -1j * tmp
+                    n += 1
+        indptr[p] = n
+        return _elements_matrices(pair_where, index, indptr, cols, data,
+                                  self.where.shape[0],
+                                  _get_tot_norbs(self.syst))
+
+    @cython.boundscheck(False)
+    @cython.wraparound(False)
+    def _operate(self, complex[:, :] out_data, complex[:, :] bra,
+                 complex[:, :] ket, args, operation op, *, params=None):
         # prepare onsite matrices and hamiltonians
         cdef int unique_onsite = not callable(self.onsite)
         cdef complex[:, :] _tmp_mat
@@ -896,7 +1151,9 @@ cdef class Current(_LocalOperator):
 
         # main loop
         cdef gint a, a_s, a_norbs, b, b_s, b_norbs
-        cdef gint i, j, k, w
+        cdef gint i, j, k, w, v, r
+        cdef gint n_vecs = ket.shape[0]
+        cdef int sum_vecs = out_data.shape[0] < n_vecs
         cdef complex tmp
         for w in range(self.where.shape[0]):
             ### get the next hopping's start orbitals and numbers of orbitals
@@ -908,31 +1165,33 @@ cdef class Current(_LocalOperator):
             H_ab = H_ab_blocks.get(w)
             if not unique_onsite:
                 M_a = M_a_blocks.get(w)
-            ### do the actual calculation
-            if op == MAT_ELS:
-                tmp = 0
-                for i in range(b_norbs):
-                    for j in range(a_norbs):
-                        for k in range(a_norbs):
-                            tmp += (bra[b_s + i].conjugate() *
-                                    H_ab[j * b_norbs + i].conjugate() *
-                                    M_a[j * a_norbs + k] * ket[a_s + k]
-                                  - bra[a_s + j].conjugate() *
-                                    M_a[j * a_norbs + k] *
-                                    H_ab[k * b_norbs + i] * ket[b_s + i])
-                out_data[w] = 1j * tmp
-            elif op == ACT:
-                for i in range(b_norbs):
-                    for j in range(a_norbs):
-                        for k in range(a_norbs):
-                            out_data[b_s + i] = (
-                                out_data[b_s + i] +
-                                1j * H_ab[j * b_norbs + i].conjugate() *
-                                M_a[j * a_norbs + k] * ket[a_s + k])
-                            out_data[a_s + j] = (
-                                out_data[a_s + j] -
-                                1j * M_a[j * a_norbs + k] * H_ab[k * b_norbs + i] *
-                                ket[b_s + i])
+            ### do the actual calculation for all wavefunctions
+            for v in range(n_vecs):
+                r = 0 if sum_vecs else v
+                if op == MAT_ELS:
+                    tmp = 0
+                    for i in range(b_norbs):
+                        for j in range(a_norbs):
+                            for k in range(a_norbs):
+                                tmp += (bra[v, b_s + i].conjugate() *
+                                        H_ab[j * b_norbs + i].conjugate() *
+                                        M_a[j * a_norbs + k] * ket[v, a_s + k]
+                                      - bra[v, a_s + j].conjugate() *
+                                        M_a[j * a_norbs + k] *
+                                        H_ab[k * b_norbs + i] * ket[v, b_s + i])
+                    out_data[r, w] = out_data[r, w] + 1j * tmp
+                elif op == ACT:
+                    for i in range(b_norbs):
+                        for j in range(a_norbs):
+                            for k in range(a_norbs):
+                                out_data[r, b_s + i] = (
+                                    out_data[r, b_s + i] +
+                                    1j * H_ab[j * b_norbs + i].conjugate() *
+                                    M_a[j * a_norbs + k] * ket[v, a_s + k])
+                                out_data[r, a_s + j] = (
+                                    out_data[r, a_s + j] -
+                                    1j * M_a[j * a_norbs + k] *
+                                    H_ab[k * b_norbs + i] * ket[v, b_s + i])
 
 
 cdef class Source(_LocalOperator):
@@ -991,12 +1250,75 @@ cdef class Source(_LocalOperator):
         """
         q = super().bind(args, params=params)
         q._bound_hamiltonian = self._eval_hamiltonian(args, params)
+        q._bound_elements = q._sparse_elements()
         return q
 
     @cython.boundscheck(False)
     @cython.wraparound(False)
-    def _operate(self, complex[:] out_data, complex[:] bra, complex[:] ket,
-                 args, operation op, *, params=None):
+    def _sparse_elements(self, args=(), *, params=None):
+        self._check_bound(args, params)
+        if self._bound_elements is not None:
+            return self._bound_elements
+        cdef int unique_onsite = not callable(self.onsite)
+        cdef complex[:, :] _tmp_mat
+        cdef complex *M_a = NULL
+        cdef complex *H_aa = NULL
+        cdef BlockSparseMatrix M_a_blocks, H_aa_blocks
+
+        if unique_onsite:
+            _tmp_mat = self.onsite
+            M_a = <complex*> &_tmp_mat[0, 0]
+        elif self._bound_onsite:
+            M_a_blocks = self._bound_onsite
+        else:
+            M_a_blocks = self._eval_onsites(args, params)
+
+        if self._bound_hamiltonian:
+            H_aa_blocks = self._bound_hamiltonian
+        else:
+            H_aa_blocks = self._eval_hamiltonian(args, params)
+
+        norbs = np.asarray(H_aa_blocks.block_shapes)[:, 0]
+        cdef gint n_pairs = np.sum(norbs)
+        cdef gint[:] pair_where = np.empty(n_pairs, gint_dtype)
+        cdef gint[:] index = np.empty(n_pairs, gint_dtype)
+        cdef gint[:] indptr = np.empty(n_pairs + 1, gint_dtype)
+        cdef gint nnz = np.sum(np.square(norbs))
+        cdef gint[:] cols = np.empty(nnz, gint_dtype)
+        cdef complex[:] data = np.empty(nnz, complex)
+
+        cdef gint a_s, a_norbs, i, j, k, w, p = 0, n = 0
+        cdef complex tmp
+        for w in range(self.where.shape[0]):
+            a_s = H_aa_blocks.block_offsets[w, 0]
+            a_norbs = H_aa_blocks.block_shapes[w, 0]
+            H_aa = H_aa_blocks.get(w)
+            if not unique_onsite:
+                M_a = M_a_blocks.get(w)
+            # i (H_aa^† M_a - M_a H_aa)
+            for i in range(a_norbs):
+                pair_where[p] = w
+                index[p] = a_s + i
+                indptr[p] = n
+                p += 1
+                for k in range(a_norbs):
+                    tmp = 0
+                    for j in range(a_norbs):
+                        tmp += (H_aa[j * a_norbs + i].conjugate() *
+                                M_a[j * a_norbs + k]
+                              - M_a[i * a_norbs + j] * H_aa[j * a_norbs + k])
+                    cols[n] = a_s + k
+                    data[n] = 1j * tmp
+                    n += 1
+        indptr[p] = n
+        return _elements_matrices(pair_where, index, indptr, cols, data,
+                                  self.where.shape[0],
+                                  _get_tot_norbs(self.syst))
+
+    @cython.boundscheck(False)
+    @cython.wraparound(False)
+    def _operate(self, complex[:, :] out_data, complex[:, :] bra,
+                 complex[:, :] ket, args, operation op, *, params=None):
         # prepare onsite matrices and hamiltonians
         cdef int unique_onsite = not callable(self.onsite)
         cdef complex[:, :] _tmp_mat
@@ -1019,7 +1341,9 @@ cdef class Source(_LocalOperator):
 
         # main loop
         cdef gint a, a_s, a_norbs
-        cdef gint i, j, k, w
+        cdef gint i, j, k, w, v, r
+        cdef gint n_vecs = ket.shape[0]
+        cdef int sum_vecs = out_data.shape[0] < n_vecs
         cdef complex tmp, tmp2
         for w in range(self.where.shape[0]):
             ### get the next site, start orbital and number of orbitals
@@ -1031,26 +1355,28 @@ cdef class Source(_LocalOperator):
             H_aa = H_aa_blocks.get(w)
             if not unique_onsite:
                 M_a = M_a_blocks.get(w)
-            ### do the actual calculation
-            if op == MAT_ELS:
-                tmp2 = 0
-                for i in range(a_norbs):
-                    tmp = 0
-                    for j in range(a_norbs):
-                        for k in range(a_norbs):
-                            tmp += (H_aa[j * a_norbs + i].conjugate() *
-                                    M_a[j * a_norbs + k] * ket[a_s + k]
-                                  - M_a[i * a_norbs + j] *
-                                    H_aa[j * a_norbs + k] * ket[a_s + k])
-                    tmp2 += bra[a_s + i].conjugate() * tmp
-                out_data[w] = 1j * tmp2
-            elif op == ACT:
-                for i in range(a_norbs):
-                    tmp = 0
-                    for j in range(a_norbs):
-                        for k in range(a_norbs):
-                            tmp += (H_aa[j * a_norbs + i].conjugate() *
-                                    M_a[j * a_norbs + k] * ket[a_s + k]
-                                  - M_a[i * a_norbs + j] *
-                                    H_aa[j * a_norbs + k] * ket[a_s + k])
-                    out_data[a_s + i] = out_data[a_s + i] + 1j * tmp
+            ### do the actual calculation for all wavefunctions
+            for v in range(n_vecs):
+                r = 0 if sum_vecs else v
+                if op == MAT_ELS:
+                    tmp2 = 0
+                    for i in range(a_norbs):
+                        tmp = 0
+                        for j in range(a_norbs):
+                            for k in range(a_norbs):
+                                tmp += (H_aa[j * a_norbs + i].conjugate() *
+                                        M_a[j * a_norbs + k] * ket[v, a_s + k]
+                                      - M_a[i * a_norbs + j] *
+                                        H_aa[j * a_norbs + k] * ket[v, a_s + k])
+                        tmp2 += bra[v, a_s + i].conjugate() * tmp
+                    out_data[r, w] = out_data[r, w] + 1j * tmp2
+                elif op == ACT:
+                    for i in range(a_norbs):
+                        tmp = 0
+                        for j in range(a_norbs):
+                            for k in range(a_norbs):
+                                tmp += (H_aa[j * a_norbs + i].conjugate() *
+                                        M_a[j * a_norbs + k] * ket[v, a_s + k]
+                                      - M_a[i * a_norbs + j] *
+                                        H_aa[j * a_norbs + k] * ket[v, a_s + k])
+                        out_data[r, a_s + i] = out_data[r, a_s + i] + 1j * tmp
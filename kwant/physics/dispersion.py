@@ -6,11 +6,19 @@
 # the file AUTHORS.rst at the top-level directory of this distribution and at
 # http://kwant-project.org/authors.
 
-import math
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 import numpy as np
+import scipy.sparse as sp
+import scipy.sparse.linalg as spl
 from .. import system
 from .._common import ensure_isinstance
 
+try:
+    from ..linalg import mumps
+except ImportError:
+    mumps = None
+
 __all__ = ['Bands']
 
 
@@ -29,26 +37,57 @@ class Bands:
     params : dict, optional
         Dictionary of parameter names and their values. Mutually exclusive
         with 'args'.
+    threads : int, optional
+        Number of threads among which the momenta are distributed when the
+        bands are computed for many momenta at once.  This is worthwhile for
+        large unit cells.  Defaults to 1.  Has no effect if `sparse` is true.
+    sparse : bool, optional
+        If true, only the `num_bands` bands closest to the energy `sigma` are
+        computed with a sparse shift-invert eigensolver.  This is useful for
+        leads with large unit cells.  Defaults to False.
+    num_bands : int, optional
+        Number of bands computed if `sparse` is true.  Must be smaller than
+        the number of orbitals in the unit cell.  Defaults to 6.
+    sigma : float, optional
+        Energy around which the bands are computed if `sparse` is true.
+        Defaults to 0.
 
     Notes
     -----
     An instance of this class can be called like a function.  Given a momentum
     (currently this must be a scalar as all infinite systems are quasi-1-d), it
     returns a NumPy array containing the eigenenergies of all modes at this
-    momentum
+    momentum.  Given an array of momenta, the Bloch Hamiltonians at all of
+    them are diagonalized together and the result has an additional last
+    axis enumerating the bands.
+
+    In sparse mode, the Bloch Hamiltonians are assembled on a sparsity
+    pattern that is fixed in advance, such that the analysis of the sparse LU
+    decomposition (the fill-reducing ordering) is done once and reused for
+    all momenta.  MUMPS is used if it is available, otherwise SciPy's SuperLU.
 
     Examples
     --------
     >>> bands = kwant.physics.Bands(some_syst)
     >>> momenta = numpy.linspace(-numpy.pi, numpy.pi, 101)
-    >>> energies = [bands(k) for k in momenta]
+    >>> energies = bands(momenta)
     >>> pyplot.plot(momenta, energies)
     >>> pyplot.show()
     """
 
-    def __init__(self, sys, args=(), *, params=None):
+    def __init__(self, sys, args=(), *, params=None, threads=1,
+                 sparse=False, num_bands=6, sigma=0):
         syst = sys
         ensure_isinstance(syst, system.InfiniteSystem)
+        threads = int(threads)
+        if threads < 1:
+            raise ValueError("threads must be a positive integer.")
+        self.threads = threads
+        self.sparse = sparse
+        if sparse:
+            self._init_sparse(syst, args, params, num_bands, sigma)
+            return
+
         self.ham = syst.cell_hamiltonian(args, params=params)
         if not np.allclose(self.ham, self.ham.T.conj()):
             raise ValueError('The cell Hamiltonian is not Hermitian.')
@@ -57,9 +96,274 @@ class Bands:
         self.hop[:, : hop.shape[1]] = hop
         self.hop[:, hop.shape[1]:] = 0
 
-    def __call__(self, k):
+    def _init_sparse(self, syst, args, params, num_bands, sigma):
+        ham = syst.cell_hamiltonian(args, sparse=True, params=params).tocoo()
+        n = ham.shape[0]
+        if len(ham.data) and abs(ham - ham.T.conj()).max() > 1e-8:
+            raise ValueError('The cell Hamiltonian is not Hermitian.')
+        num_bands = int(num_bands)
+        if not 0 < num_bands < n:
+            raise ValueError("num_bands must be positive and smaller than "
+                             "the number of orbitals in the unit cell.")
+        hop = syst.inter_cell_hopping(args, sparse=True,
+                                      params=params).tocoo()
+        self.ham = ham
+        self.hop = sp.coo_matrix((hop.data, (hop.row, hop.col)),
+                                 shape=(n, n), dtype=complex)
+        self.num_bands = num_bands
+        self.sigma = sigma
+
+        # The sparsity pattern of the Bloch Hamiltonians includes the full
+        # diagonal (for the shift).  `self._index` maps the entries of the
+        # cell Hamiltonian, the hopping, its conjugate and the diagonal to the
+        # positions in the data array of the pattern.
+        hop = self.hop
+        diag = np.arange(n)
+        rows = np.concatenate([ham.row, hop.row, hop.col, diag])
+        cols = np.concatenate([ham.col, hop.col, hop.row, diag])
+        keys, index = np.unique(rows.astype(np.int64) * n + cols,
+                                return_inverse=True)
+        bounds = np.cumsum([len(ham.data), len(hop.data), len(hop.data)])
+        self._index = np.split(index, bounds)
+        self._pattern = (keys // n, keys % n)
+        self._factorization = None
+
+    def _bloch_matrix(self, k, shift=0):
+        """Return ``H(k) - shift`` as a COO matrix on the fixed pattern."""
+        ham_index, hop_index, hop_h_index, diag_index = self._index
+        data = np.zeros(len(self._pattern[0]), complex)
+        np.add.at(data, ham_index, self.ham.data)
+        hop = self.hop.data * np.exp(-1j * k)
+        np.add.at(data, hop_index, hop)
+        np.add.at(data, hop_h_index, hop.conj())
+        data[diag_index] -= shift
+        return sp.coo_matrix((data, self._pattern), shape=self.ham.shape)
+
+    def __call__(self, k, derivative_order=0, return_eigenvectors=False):
+        """Calculate the band energies at momentum `k`.
+
+        Parameters
+        ----------
+        k : float or array of floats
+            The momentum or momenta.
+        derivative_order : {0, 1}
+            If 1, the band velocities :math:`dE/dk` are returned as well.
+        return_eigenvectors : bool
+            If true, the eigenvectors are returned as well.
+
+        Returns
+        -------
+        energies : NumPy array of shape ``np.shape(k) + (n,)``
+            The energies of the ``n`` bands in ascending order.
+        velocities : NumPy array of shape ``np.shape(k) + (n,)``
+            Only returned if ``derivative_order == 1``.
+        eigenvectors : NumPy array of shape ``np.shape(k) + (n, n)``
+            Only returned if `return_eigenvectors` is true.  The column
+            ``eigenvectors[..., :, i]`` belongs to ``energies[..., i]``.
+
+        Notes
+        -----
+        The velocities of degenerate bands are those of the eigenvectors that
+        diagonalize the velocity operator within the degenerate subspace.
+        """
+        if derivative_order not in (0, 1):
+            raise ValueError("derivative_order must be 0 or 1.")
+        k = np.asarray(k, float)
+        shape = k.shape
+        k = k.reshape(-1)
+
+        chunks = [k]
+        if self.threads > 1 and len(k) > 1 and not self.sparse:
+            chunks = np.array_split(k, min(self.threads, len(k)))
+        if len(chunks) > 1:
+            # The batched LAPACK calls of NumPy release the GIL.
+            with ThreadPoolExecutor(len(chunks)) as executor:
+                results = list(executor.map(
+                    partial(self._solve, derivative_order=derivative_order,
+                            return_eigenvectors=return_eigenvectors),
+                    chunks))
+            results = [np.concatenate(r) for r in zip(*results)]
+        else:
+            results = self._solve(k, derivative_order, return_eigenvectors)
+
+        results = [r.reshape(shape + r.shape[1:]) for r in results]
+        if len(results) == 1:
+            return results[0]
+        return tuple(results)
+
+    def sample(self, k_min=-np.pi, k_max=np.pi, tol=1e-3, initial_points=17,
+               max_points=1000):
+        """Sample the bands on an adaptively refined grid of momenta.
+
+        Starting from a uniform grid, intervals are bisected where linear
+        interpolation between the neighboring momenta deviates from the
+        computed energies by more than `tol`.  This concentrates the momenta
+        around band extrema, crossings and anticrossings.
+
+        Parameters
+        ----------
+        k_min, k_max : float
+            The interval of momenta.  Defaults to the Brillouin zone.
+        tol : float
+            Absolute tolerance for the energies of the linear interpolation
+            between the returned momenta.
+        initial_points : int
+            Number of points of the initial uniform grid.  Features of the
+            bands that are much narrower than its spacing may be missed.
+        max_points : int
+            Maximal number of momenta at which the bands are computed.
+
+        Returns
+        -------
+        momenta : NumPy array of shape ``(m,)``
+            The sorted momenta.
+        energies : NumPy array of shape ``(m, n)``
+            The energies of the bands at `momenta`.
+        """
+        initial_points = int(initial_points)
+        if initial_points < 3:
+            raise ValueError("initial_points must be at least 3.")
+        if max_points < initial_points:
+            raise ValueError("max_points must not be smaller than "
+                             "initial_points.")
+        momenta = np.linspace(k_min, k_max, initial_points)
+        energies = self(momenta)
+        min_width = 1e-10 * abs(k_max - k_min)
+
+        while len(momenta) < max_points and energies.shape[1]:
+            # Deviation of the energies at the inner momenta from the linear
+            # interpolation between their neighbors.
+            widths = np.diff(momenta)
+            left, right = widths[:-1], widths[1:]
+            interpolated = ((energies[:-2] * right[:, np.newaxis] +
+                             energies[2:] * left[:, np.newaxis]) /
+                            (left + right)[:, np.newaxis])
+            error = np.max(abs(energies[1:-1] - interpolated), axis=1)
+
+            # Bisect both intervals next to momenta with a too large error.
+            interval_error = np.zeros(len(momenta) - 1)
+            interval_error[:-1] = error
+            interval_error[1:] = np.maximum(interval_error[1:], error)
+            refine = np.flatnonzero((interval_error > tol) &
+                                    (widths > min_width))
+            if not len(refine):
+                break
+            # Refine the intervals with the largest errors first.
+            budget = max_points - len(momenta)
+            if len(refine) > budget:
+                order = np.argsort(interval_error[refine])[::-1]
+                refine = np.sort(refine[order[:budget]])
+
+            new_momenta = momenta[refine] + 0.5 * widths[refine]
+            new_energies = self(new_momenta)
+            position = np.searchsorted(momenta, new_momenta)
+            momenta = np.insert(momenta, position, new_momenta)
+            energies = np.insert(energies, position, new_energies, axis=0)
+
+        return momenta, energies
+
+    def _solve(self, k, derivative_order, return_eigenvectors):
+        """Diagonalize the Bloch Hamiltonians for the 1D array of momenta `k`.
+
+        Returns a list with the energies and, if requested, the velocities and
+        the eigenvectors.
+        """
+        if self.sparse:
+            return self._solve_sparse(k, derivative_order, return_eigenvectors)
+
         # Note: Equation to solve is
         #       (V^\dagger e^{ik} + H + V e^{-ik}) \psi = E \psi
-        mat = self.hop * complex(math.cos(k), -math.sin(k))
-        mat += mat.conjugate().transpose() + self.ham
-        return np.sort(np.linalg.eigvalsh(mat).real)
+        phase = np.exp(-1j * k)[:, np.newaxis, np.newaxis]
+        hop = self.hop * phase
+        mat = hop + hop.conj().swapaxes(1, 2) + self.ham
+        if not (derivative_order or return_eigenvectors):
+            return [np.linalg.eigvalsh(mat)]
+
+        energies, vecs = np.linalg.eigh(mat)
+        result = [energies]
+        if derivative_order:
+            # dH/dk = -i V e^{-ik} + h.c.
+            dhop = -1j * hop
+            dmat = dhop + dhop.conj().swapaxes(1, 2)
+            vel_ops = np.matmul(vecs.conj().swapaxes(1, 2),
+                                np.matmul(dmat, vecs))
+            velocities = np.diagonal(vel_ops, axis1=1, axis2=2).real.copy()
+            _lift_degeneracies(energies, vecs, velocities, vel_ops)
+            result.append(velocities)
+        if return_eigenvectors:
+            result.append(vecs)
+        return result
+
+
+    def _solve_sparse(self, k, derivative_order, return_eigenvectors):
+        n, num_bands = self.ham.shape[0], self.num_bands
+        energies = np.empty((len(k), num_bands))
+        vecs = np.empty((len(k), n, num_bands), complex)
+        vel_ops = np.empty((len(k), num_bands, num_bands), complex)
+        for i, q in enumerate(k):
+            solve = self._factorized(self._bloch_matrix(q, self.sigma))
+            op_inv = spl.LinearOperator((n, n), solve, dtype=complex)
+            e, v = spl.eigsh(self._bloch_matrix(q).tocsr(), num_bands,
+                             sigma=self.sigma, OPinv=op_inv)
+            order = np.argsort(e)
+            energies[i], vecs[i] = e[order], v[:, order]
+            if derivative_order:
+                # dH/dk = -i V e^{-ik} + h.c.
+                dhop = self.hop * (-1j * np.exp(-1j * q))
+                dv = dhop.dot(vecs[i]) + dhop.T.conj().dot(vecs[i])
+                vel_ops[i] = np.dot(vecs[i].T.conj(), dv)
+
+        result = [energies]
+        if derivative_order:
+            velocities = np.diagonal(vel_ops, axis1=1, axis2=2).real.copy()
+            _lift_degeneracies(energies, vecs, velocities, vel_ops)
+            result.append(velocities)
+        if return_eigenvectors:
+            result.append(vecs)
+        return result
+
+    def _factorized(self, a):
+        """Return a function that solves the linear system with matrix `a`.
+
+        `a` must have the fixed sparsity pattern of the Bloch Hamiltonians.
+        The ordering of the first factorization is reused for all subsequent
+        ones.
+        """
+        if mumps is not None:
+            reuse = self._factorization is not None
+            if not reuse:
+                self._factorization = mumps.MUMPSContext()
+            ctx = self._factorization
+            ctx.factor(a, reuse_analysis=reuse)
+            return ctx.solve
+
+        a = a.tocsc()
+        if self._factorization is None:
+            lu = spl.splu(a)
+            self._factorization = lu.perm_c
+            return lu.solve
+        # Apply the column ordering of the first factorization.
+        perm_c = self._factorization
+        inv_perm = np.empty_like(perm_c)
+        inv_perm[perm_c] = np.arange(len(perm_c))
+        lu = spl.splu(a[:, inv_perm], permc_spec='NATURAL')
+        return lambda b: lu.solve(b)[perm_c]
+
+
+def _lift_degeneracies(energies, vecs, velocities, vel_ops):
+    """Diagonalize the velocity operators within degenerate subspaces.
+
+    `velocities` and `vecs` are updated in place.  `vel_ops` contains the
+    velocity operators in the basis of the eigenvectors.
+    """
+    scale = max(1, np.max(np.abs(energies))) if energies.size else 1
+    degenerate = np.diff(energies, axis=1) < 1e-8 * scale
+    for i in np.flatnonzero(np.any(degenerate, axis=1)):
+        # Boundaries of the groups of degenerate eigenvalues.
+        bounds = np.r_[0, np.flatnonzero(~degenerate[i]) + 1, len(energies[i])]
+        for start, stop in zip(bounds[:-1], bounds[1:]):
+            if stop - start < 2:
+                continue
+            v, rot = np.linalg.eigh(vel_ops[i, start:stop, start:stop])
+            velocities[i, start:stop] = v
+            vecs[i, :, start:stop] = np.dot(vecs[i, :, start:stop], rot)
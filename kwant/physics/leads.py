@@ -12,13 +12,16 @@ from collections import namedtuple
 
 import warnings
 from itertools import combinations_with_replacement
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
 import numpy.linalg as npl
 import scipy.linalg as la
 from .. import linalg as kla
 from scipy.linalg import block_diag
 from scipy.sparse import (identity as sp_identity, hstack as sp_hstack,
-                          csr_matrix)
+                          csr_matrix, issparse)
+import scipy.sparse.linalg as spl
+from scipy.sparse.csgraph import connected_components
 
 dot = np.dot
 
@@ -104,6 +107,13 @@ def nonzero_symm_projection(matrix):
     return np.linalg.norm(matrix) > 0.5
 
 
+def _allclose(a, b):
+    """Like `numpy.allclose`, but also works for sparse matrices."""
+    if issparse(a) or issparse(b):
+        return np.allclose(abs(a - b).max(), 0)
+    return np.allclose(a, b)
+
+
 def group_halves(arr_list):
     """Split and rearrange a list of arrays.
 
@@ -920,6 +930,200 @@ def compute_block_modes(h_cell, h_hop, tol, stabilization,
     return (wave_functions, momenta, velocities, vecs, vecslmbdainv, v)
 
 
+# Number of eigenvalues computed per shift by the sparse mode solver.
+_SPARSE_NEV = 32
+# Blocks with fewer orbitals are solved with the dense algorithm, which was
+# faster for all the leads of fewer than about 500 orbitals that we measured.
+_SPARSE_MIN_SIZE = 512
+
+
+def _sparse_eigenpairs(h_cell, h_hop, cutoff, tol):
+    """Find the translation eigenpairs in the annulus ``1 <= |ev| <= cutoff``.
+
+    The eigenproblem is the one of the regular case of `setup_linsys`, i.e.
+    of ``(ev h_hop + h_cell + h_hop^dagger / ev) psi = 0``, linearized in the
+    basis ``(psi_n, h_hop^dagger psi_(n+1) / s)`` with ``s^2`` the norm of
+    `h_hop`.  It is solved by shift-invert Arnoldi iteration, which only
+    needs a sparse LU decomposition of ``h_cell + sigma h_hop + h_hop^dagger /
+    sigma`` for each shift `sigma`.  The annulus is divided into regions
+    (sectors of annuli) until each of them lies within the disc around a
+    shift that contains all the eigenvalues found with that shift.
+    Eigenvalues with ``|ev| < 1`` that are found on the way are also
+    returned.
+
+    Returns
+    -------
+    ev : numpy array
+        Eigenvalues, degenerate ones are repeated.
+    vecs : numpy array
+        Orthonormal bases of the eigenspaces.
+    """
+    n = h_cell.shape[0]
+    h_hop_dagger = h_hop.T.conj().tocsr()
+    s2 = spl.norm(h_hop)
+    nev = min(_SPARSE_NEV, 2 * n - 2)
+    eps = np.finfo(float).eps * tol
+    v0 = np.random.RandomState(0).randn(2 * n).astype(complex)
+
+    def eigenpairs(sigma):
+        while True:
+            try:
+                lu = spl.splu((h_cell + sigma * h_hop +
+                               h_hop_dagger / sigma).tocsc())
+                break
+            except RuntimeError:
+                # The shift is an eigenvalue.
+                sigma *= 1 + 1e-8j
+
+        def matvec(y):
+            y = y.ravel()
+            y1, y2 = y[:n], y[n:]
+            x1 = lu.solve(s2 / sigma * y2 - h_hop.dot(y1))
+            x2 = (h_hop_dagger.dot(x1) / s2 - y2) / sigma
+            return np.r_[x1, x2]
+
+        op = spl.LinearOperator((2 * n, 2 * n), matvec=matvec, dtype=complex)
+        try:
+            theta, vecs = spl.eigs(op, nev, which='LM', v0=v0)
+            radius = np.max(abs(1 / theta))
+        except spl.ArpackNoConvergence as error:
+            # The converged eigenpairs are valid, but not necessarily
+            # the ones closest to the shift.
+            theta, vecs = error.eigenvalues, error.eigenvectors
+            radius = 0
+        return sigma, sigma + 1 / theta, vecs, radius * (1 - 1e-8)
+
+    # Regions of the annulus as (angle_min, angle_max, |ev|_min, |ev|_max).
+    # The inner boundary is slightly inside the unit circle to not miss
+    # propagating modes due to rounding.
+    regions = [(pi * i / 4, pi * (i + 1) / 4, 1 - eps, cutoff)
+               for i in range(8)]
+    discs, evs, vecs = [], [], []
+
+    def max_distance(region, sigma):
+        """Maximal distance between a point of `region` and `sigma`."""
+        phi_min, phi_max, r_min, r_max = region
+        phi = [phi_min, phi_max]
+        # On an arc, the distance is also maximal opposite to `sigma`.
+        opposite = (np.angle(sigma) + pi - phi_min) % (2 * pi) + phi_min
+        if opposite < phi_max:
+            phi.append(opposite)
+        z = np.multiply.outer([r_min, r_max], np.exp(1j * np.array(phi)))
+        return np.max(abs(z - sigma))
+
+    def covered(region):
+        return any(max_distance(region, sigma) < radius
+                   for sigma, radius in discs)
+
+    while regions:
+        region = regions.pop()
+        if covered(region):
+            continue
+        phi_min, phi_max, r_min, r_max = region
+        if phi_max - phi_min < 1e-6:
+            raise RuntimeError("Could not resolve the eigenvalues of the "
+                               "translation operator.")
+        phi, r = (phi_min + phi_max) / 2, sqrt(r_min * r_max)
+        sigma, ev, vec, radius = eigenpairs(r * np.exp(1j * phi))
+        discs.append((sigma, radius))
+        evs.append(ev)
+        vecs.append(vec)
+        if covered(region):
+            continue
+        # Split the region along its longer side.
+        if r * (phi_max - phi_min) > r_max - r_min:
+            regions.append((phi_min, phi, r_min, r_max))
+            regions.append((phi, phi_max, r_min, r_max))
+        else:
+            regions.append((phi_min, phi_max, r_min, r))
+            regions.append((phi_min, phi_max, r, r_max))
+
+    # Eigenpairs found with several shifts are merged.  Numerically equal
+    # eigenvalues are treated as degenerate.
+    evs, vecs = np.concatenate(evs), np.hstack(vecs)
+    equal = abs(evs[:, None] - evs) < eps * np.maximum(1, abs(evs))
+    num_clusters, labels = connected_components(csr_matrix(equal),
+                                                directed=False)
+    result_evs, result_vecs = [], []
+    for cluster in range(num_clusters):
+        select = np.flatnonzero(labels == cluster)
+        if len(select) == 1:
+            result_evs.append(evs[select])
+            result_vecs.append(vecs[:, select])
+            continue
+        u, sv = la.svd(vecs[:, select], full_matrices=False)[:2]
+        rank = np.sum(sv > 1e-6 * sv[0])
+        result_evs.append(np.full(rank, np.mean(evs[select])))
+        result_vecs.append(u[:, :rank])
+    return np.concatenate(result_evs), np.hstack(result_vecs)
+
+
+def compute_sparse_block_modes(h_cell, h_hop, tol, evanescent_cutoff,
+                               time_reversal, particle_hole, chiral):
+    """Calculate modes corresponding to a single projector with sparse
+    linear algebra.
+
+    Only the propagating modes and the evanescent modes that decay by less
+    than a factor `evanescent_cutoff` per unit cell are computed.  The
+    faster decaying modes are treated as decaying infinitely fast: they are
+    represented by the complement of the computed ones and do not
+    contribute to the self-energy.  The stabilized modes are written in an
+    orthonormal basis of the subspace spanned by the computed modes, so
+    their size is set by the number of those modes, not by the size of the
+    unit cell.
+
+    Returns the same data as `compute_block_modes`.
+    """
+    n = h_cell.shape[0]
+    if n < max(_SPARSE_MIN_SIZE, 2 * _SPARSE_NEV):
+        # The dense algorithm is faster and exact for small blocks.
+        h_cell, h_hop = (m.toarray() if issparse(m) else m
+                         for m in (h_cell, h_hop))
+        return compute_block_modes(h_cell, h_hop, tol, None, time_reversal,
+                                   particle_hole, chiral)
+
+    h_cell, h_hop = csr_matrix(h_cell), csr_matrix(h_hop)
+    s = sqrt(spl.norm(h_hop))
+
+    def extract(psi, lmbdainv):
+        return psi[:n] / s
+
+    ev, vecs = _sparse_eigenpairs(h_cell, h_hop, evanescent_cutoff, tol)
+    eps = np.finfo(float).eps * tol
+    propselect = abs(abs(ev) - 1) < eps
+    evanselect = (abs(ev) > 1 + eps) & (abs(ev) <= evanescent_cutoff)
+
+    prop_vecs, real_space_data = make_proper_modes(
+        ev[propselect], vecs[:, propselect], extract, tol, particle_hole,
+        time_reversal, chiral)
+    nmodes = prop_vecs.shape[1] // 2
+    evan_vecs = vecs[:, evanselect]
+    if evan_vecs.shape[1]:
+        evan_vecs = la.qr(evan_vecs, mode='economic')[0]
+
+    vecs = np.c_[prop_vecs[n:], evan_vecs[n:]]
+    vecslmbdainv = np.c_[prop_vecs[:n], evan_vecs[:n]]
+    if not vecs.shape[1]:
+        # All the modes decay too fast.
+        empty = np.zeros((0, 0))
+        return (real_space_data.wave_functions, real_space_data.momenta,
+                real_space_data.velocities, empty, empty, np.zeros((n, 0)))
+
+    # Orthonormal basis of the subspace spanned by the modes, in which the
+    # outgoing and evanescent modes are completed by infinitely fast
+    # decaying ones.
+    basis = la.orth(np.c_[vecs, vecslmbdainv])
+    vecs = dot(basis.T.conj(), vecs)
+    vecslmbdainv = dot(basis.T.conj(), vecslmbdainv)
+    u = la.svd(vecslmbdainv[:, nmodes:])[0]
+    complement = u[:, vecslmbdainv.shape[1] - nmodes:]
+    vecs = np.c_[vecs, np.zeros_like(complement)]
+    vecslmbdainv = np.c_[vecslmbdainv, complement]
+
+    return (real_space_data.wave_functions, real_space_data.momenta,
+            real_space_data.velocities, vecs, vecslmbdainv, s * basis)
+
+
 def transform_modes(modes_data, unitary=None, time_reversal=None,
                     particle_hole=None, chiral=None):
     """Transform the modes data for a given block of the Hamiltonian using a
@@ -994,7 +1198,8 @@ def transform_modes(modes_data, unitary=None, time_reversal=None,
 
 def modes(h_cell, h_hop, tol=1e6, stabilization=None, *,
           discrete_symmetry=None, projectors=None, time_reversal=None,
-          particle_hole=None, chiral=None):
+          particle_hole=None, chiral=None, method='dense',
+          evanescent_cutoff=10, threads=1, reuse_blocks=True):
     """Compute the eigendecomposition of a translation operator of a lead.
 
     Parameters
@@ -1029,6 +1234,26 @@ def modes(h_cell, h_hop, tol=1e6, stabilization=None, *,
     projectors : an iterable of sparse or dense matrices
         Projectors that block diagonalize the Hamiltonian in accordance
         with a conservation law.
+    method : 'dense' or 'sparse'
+        With 'dense', the full eigenproblem of the translation operator is
+        solved.  With 'sparse', only the propagating modes and the slowest
+        decaying evanescent modes are computed by shift-invert Arnoldi
+        iteration, which only needs sparse LU decompositions of matrices of
+        the size of `h_cell`.  This can be faster for leads with large unit
+        cells, but the result is approximate, see the notes below.  `h_cell` and `h_hop` may
+        then be sparse matrices, and `h_hop` must be square and invertible.
+        `stabilization` is not supported.
+    evanescent_cutoff : float
+        With ``method='sparse'``, evanescent modes whose amplitude decreases
+        by more than this factor from one unit cell to the next are
+        neglected.
+    threads : int
+        Number of threads among which the conservation law blocks are
+        distributed.
+    reuse_blocks : bool
+        If true, the modes of blocks that are identical or related by a
+        discrete symmetry to an already computed block are obtained from the
+        modes of that block instead of being computed again.
 
     Returns
     -------
@@ -1054,15 +1279,39 @@ def modes(h_cell, h_hop, tol=1e6, stabilization=None, *,
     This function uses the most stable and efficient algorithm for calculating
     the mode decomposition that the Kwant authors are aware about. Its details
     are to be published.
+
+    With ``method='sparse'``, the evanescent modes that decay faster than
+    `evanescent_cutoff` are treated as if they decayed infinitely fast, so
+    that they do not contribute to the self-energy.  The error this
+    introduces decreases with increasing cutoff.  The stabilized modes are
+    then expressed in an orthonormal basis of the subspace spanned by the
+    computed modes, and ``sqrt_hop`` contains this basis.  Their size is
+    hence set by the number of computed modes instead of the size of the
+    unit cell.  Conservation law blocks smaller than 512 orbitals are always
+    solved with the dense algorithm.
+
+    The cost of ``method='sparse'`` grows with the number of modes whose
+    eigenvalues lie within `evanescent_cutoff`, while that of the dense
+    algorithm grows with the cube of the size of the unit cell.  The sparse
+    method is therefore only faster for large unit cells with comparatively
+    few such modes and a small cutoff, e.g. the leads of three-dimensional
+    systems close to a band edge with ``evanescent_cutoff=2``.  For wide
+    two-dimensional leads, which have many propagating modes, or for large
+    cutoffs, the dense algorithm is faster.
     """
     if discrete_symmetry is not None:
         projectors, time_reversal, particle_hole, chiral = discrete_symmetry
+    if method not in ('dense', 'sparse'):
+        raise ValueError("Unknown method: {0!r}".format(method))
+    threads = int(threads)
+    if threads < 1:
+        raise ValueError("threads must be a positive integer.")
     n, m = h_hop.shape
 
     if h_cell.shape != (n, n):
         raise ValueError("Incompatible matrix sizes for h_cell and h_hop.")
 
-    if not complex_any(h_hop):
+    if not (h_hop.count_nonzero() if issparse(h_hop) else complex_any(h_hop)):
         wf = np.zeros((n, 0))
         v = np.zeros((m, 0))
         m = np.zeros((0, 0))
@@ -1070,11 +1319,22 @@ def modes(h_cell, h_hop, tol=1e6, stabilization=None, *,
         return (PropagatingModes(wf, vec, vec), StabilizedModes(m, m, 0, v))
 
     ham = h_cell
-    # Avoid the trouble of dealing with non-square hopping matrices.
-    # TODO: How to avoid this while not doing a lot of book-keeping?
-    hop = np.empty_like(ham, dtype=h_hop.dtype)
-    hop[:, :m] = h_hop
-    hop[:, m:] = 0
+    if method == 'sparse':
+        if m != n:
+            raise ValueError("method='sparse' requires a square and "
+                             "invertible h_hop.")
+        if stabilization is not None:
+            raise ValueError("method='sparse' does not support "
+                             "stabilization.")
+        if evanescent_cutoff <= 1:
+            raise ValueError("evanescent_cutoff must be larger than 1.")
+        ham, hop = csr_matrix(h_cell), csr_matrix(h_hop)
+    else:
+        # Avoid the trouble of dealing with non-square hopping matrices.
+        # TODO: How to avoid this while not doing a lot of book-keeping?
+        hop = np.empty_like(ham, dtype=h_hop.dtype)
+        hop[:, :m] = h_hop
+        hop[:, m:] = 0
 
     # Provide default values to not deal with special cases.
     if projectors is None:
@@ -1113,10 +1373,15 @@ def modes(h_cell, h_hop, tol=1e6, stabilization=None, *,
     phs = basis_change(particle_hole, True)
     sls = basis_change(chiral)
 
-    # Check that the Hamiltonian has the conservation law
-    block_modes = len(projectors) * [None]
+    # Decide which blocks are computed and which ones are obtained from
+    # another block through a symmetry or because they are identical.
+    planned = len(projectors) * [False]
+    computed = []
+    derived = []
     numbers_coords = combinations_with_replacement(enumerate(indices), 2)
     for (i, x), (j, y) in numbers_coords:
+        if planned[j]:
+            continue
         h = ham_cons[x, y]
         t = hop_cons[x, y]
         # Symmetries that project from block x to block y
@@ -1124,27 +1389,43 @@ def modes(h_cell, h_hop, tol=1e6, stabilization=None, *,
         symmetries = [(symm if nonzero_symm_projection(symm) else None) for
                       symm in symmetries]
         if i == j:
-            if block_modes[i] is not None:
-                continue
             # We did not compute this block yet.
-            block_modes[i] = compute_block_modes(h, t, tol, stabilization,
-                                                 *symmetries)
-        else:
-            if block_modes[j] is not None:
-                # Modes in the block already computed.
+            computed.append((i, h, t, symmetries))
+            planned[i] = True
+        elif reuse_blocks:
+            if ham_cons[x, x].shape != ham_cons[y, y].shape:
                 continue
-            x, y = tuple(np.mgrid[x, x]), tuple(np.mgrid[y, y])
-
-            if ham_cons[x].shape != ham_cons[y].shape:
-                continue
-            if (np.allclose(ham_cons[x], ham_cons[y]) and
-                np.allclose(hop_cons[x], hop_cons[y])):
+            if (_allclose(ham_cons[x, x], ham_cons[y, y]) and
+                _allclose(hop_cons[x, x], hop_cons[y, y])):
                 unitary = sp_identity(h.shape[0])
             else:
                 unitary = None
             if any(op is not None for op in symmetries + [unitary]):
-                block_modes[j] = transform_modes(block_modes[i], unitary,
-                                                 *symmetries)
+                derived.append((j, i, unitary, symmetries))
+                planned[j] = True
+
+    def compute(block):
+        i, h, t, symmetries = block
+        if method == 'sparse':
+            return compute_sparse_block_modes(h, t, tol, evanescent_cutoff,
+                                              *symmetries)
+        return compute_block_modes(h, t, tol, stabilization, *symmetries)
+
+    block_modes = len(projectors) * [None]
+    threads = min(threads, len(computed))
+    if threads > 1:
+        # LAPACK releases the GIL, so the blocks are solved concurrently.
+        with ThreadPoolExecutor(threads) as executor:
+            results = list(executor.map(compute, computed))
+    else:
+        results = map(compute, computed)
+    for (i, *_), result in zip(computed, results):
+        block_modes[i] = result
+    # A block is always derived from one that precedes it in `derived` or
+    # was computed.
+    for j, i, unitary, symmetries in derived:
+        block_modes[j] = transform_modes(block_modes[i], unitary, *symmetries)
+
     (wave_functions, momenta, velocities,
      vecs, vecslmbdainv, sqrt_hops) = zip(*block_modes)
 
@@ -9,6 +9,7 @@
 from numpy.testing import assert_array_almost_equal, assert_almost_equal
 from pytest import raises
 
+import numpy as np
 import kwant
 from math import pi, cos, sin
 
@@ -46,3 +47,117 @@ def test_raise_nonhermitian():
     syst[lat(0), lat(1)] = complex(cos(0.2), sin(0.2))
     syst = syst.finalized()
     raises(ValueError, kwant.physics.Bands, syst)
+
+
+def test_vectorized(N=7):
+    syst = kwant.Builder(kwant.TranslationalSymmetry((-1, 0)))
+    lat = kwant.lattice.square()
+    syst[(lat(0, y) for y in range(3))] = lambda site: 0.3 * site.pos[1]
+    syst[lat.neighbors()] = -1
+    syst[lat(0, 0), lat(0, 2)] = 0.2j
+    syst = syst.finalized()
+
+    momenta = np.linspace(-pi, pi, N)
+    for threads in [1, 3]:
+        bands = kwant.physics.Bands(syst, threads=threads)
+        energies = bands(momenta)
+        assert energies.shape == (N, 3)
+        assert_array_almost_equal(energies, [bands(k) for k in momenta])
+        assert bands(momenta.reshape(-1, 1)).shape == (N, 1, 3)
+
+        energies2, velocities, vecs = bands(momenta, derivative_order=1,
+                                            return_eigenvectors=True)
+        assert_array_almost_equal(energies2, energies)
+        assert vecs.shape == (N, 3, 3)
+        for k, e, v in zip(momenta, energies, vecs):
+            mat = bands.hop * np.exp(-1j * k)
+            mat = mat + mat.conj().T + bands.ham
+            assert_array_almost_equal(mat.dot(v), v * e)
+
+        # Compare the velocities with finite differences.
+        dk = 1e-6
+        assert_array_almost_equal(
+            velocities, (bands(momenta + dk) - bands(momenta - dk)) / (2 * dk),
+            decimal=5)
+
+    raises(ValueError, bands, 0, derivative_order=2)
+
+
+def test_degenerate_velocities():
+    # Two decoupled chains whose bands cross at k = pi/2 with opposite
+    # velocities.
+    syst = kwant.Builder(kwant.TranslationalSymmetry((-1, 0)))
+    lat = kwant.lattice.square()
+    syst[(lat(0, y) for y in range(2))] = 0
+    syst[lat(1, 0), lat(0, 0)] = -1
+    syst[lat(1, 1), lat(0, 1)] = 1
+    bands = kwant.physics.Bands(syst.finalized())
+    energies, velocities = bands([pi / 2], derivative_order=1)
+    assert_array_almost_equal(energies, [[0, 0]])
+    assert_array_almost_equal(velocities, [[-2, 2]])
+
+
+def test_sparse():
+    W = 20
+    syst = kwant.Builder(kwant.TranslationalSymmetry((-1, 0)))
+    lat = kwant.lattice.square(norbs=1)
+    syst[(lat(0, y) for y in range(W))] = lambda site: 0.1 * site.pos[1]
+    syst[lat.neighbors()] = -1
+    syst[lat(1, 0), lat(0, 1)] = 0.3j
+    syst = syst.finalized()
+
+    momenta = np.linspace(-pi, pi, 5)
+    sigma, num_bands = 0.5, 4
+    dense = kwant.physics.Bands(syst)
+    sparse = kwant.physics.Bands(syst, sparse=True, num_bands=num_bands,
+                                 sigma=sigma)
+    energies, velocities, vecs = sparse(momenta, derivative_order=1,
+                                        return_eigenvectors=True)
+    assert energies.shape == velocities.shape == (5, num_bands)
+    assert vecs.shape == (5, W, num_bands)
+    dense_energies, dense_velocities = dense(momenta, derivative_order=1)
+    for e, v, de, dv in zip(energies, velocities, dense_energies,
+                            dense_velocities):
+        closest = np.sort(np.argsort(abs(de - sigma))[:num_bands])
+        assert_array_almost_equal(e, de[closest])
+        assert_array_almost_equal(v, dv[closest])
+    assert_array_almost_equal(sparse(0.3), sparse([0.3])[0])
+
+    raises(ValueError, kwant.physics.Bands, syst, sparse=True, num_bands=W)
+
+    syst = kwant.Builder(kwant.TranslationalSymmetry((-1,)))
+    lat = kwant.lattice.chain()
+    syst[(lat(0))] = 1j
+    syst[lat(0), lat(1)] = 1
+    raises(ValueError, kwant.physics.Bands, syst.finalized(), sparse=True)
+
+
+def test_sample():
+    # Two bands with anticrossings of width 2 * delta at k = +-pi / 2.
+    delta = 0.01
+    syst = kwant.Builder(kwant.TranslationalSymmetry((-1, 0)))
+    lat = kwant.lattice.square()
+    syst[(lat(0, y) for y in range(2))] = 0
+    syst[lat(1, 0), lat(0, 0)] = -1
+    syst[lat(1, 1), lat(0, 1)] = 1
+    syst[lat(0, 0), lat(0, 1)] = delta
+    bands = kwant.physics.Bands(syst.finalized())
+
+    tol = 1e-3
+    momenta, energies = bands.sample(tol=tol, max_points=400)
+    assert np.all(np.diff(momenta) > 0)
+    assert momenta[0] == -pi and momenta[-1] == pi
+    assert_array_almost_equal(energies, bands(momenta))
+    assert len(momenta) < 400
+
+    # The linear interpolation is accurate on a fine grid...
+    fine = np.linspace(-pi, pi, 10001)
+    interpolated = np.array([np.interp(fine, momenta, e)
+                             for e in energies.T]).T
+    assert np.max(abs(interpolated - bands(fine))) < 10 * tol
+    # ...and the grid is finest at the anticrossings.
+    finest = momenta[np.argmin(np.diff(momenta))]
+    assert abs(abs(finest) - pi / 2) < 0.1
+
+    assert len(bands.sample(max_points=20)[0]) == 20
+    raises(ValueError, bands.sample, initial_points=2)
@@ -9,6 +9,7 @@
 
 import numpy as np
 from numpy.testing import assert_almost_equal
+from pytest import raises
 import scipy.linalg as la
 from scipy import sparse
 from kwant.physics import leads
@@ -1004,6 +1005,45 @@ def test_block_relations_cons_PHS():
                 assert_almost_equal(P_mat.dot(modes2.conj())[:, perm], vecs_sign*modes3)
 
 
+
+def test_block_threads_and_reuse():
+    # Four blocks: two identical ones and two related by particle-hole
+    # symmetry.  Solving them in threads must not change the result, and
+    # recomputing the related blocks must give an equivalent decomposition.
+    n = 8
+    rng = ensure_rng(3)
+    p_mat = np.kron(np.identity(n // 2), kwant.rmt.h_p_matrix['C'])
+    h_cell, h_hop = random_onsite_hop(n, rng=rng)
+    hP_cell = kwant.rmt.gaussian(n, 'C', rng=rng)
+    hP_hop = 10 * kwant.rmt.gaussian(2*n, 'C', rng=rng)[:n, n:]
+    H_cell = la.block_diag(hP_cell, hP_cell, h_cell,
+                           -p_mat.dot(h_cell.conj()).dot(p_mat.T.conj()))
+    H_hop = la.block_diag(hP_hop, hP_hop, h_hop,
+                          -p_mat.dot(h_hop.conj()).dot(p_mat.T.conj()))
+    sx = np.array([[0, 1], [1, 0]])
+    P_mat = la.block_diag(p_mat, p_mat, np.kron(sx, p_mat))
+    projectors = [sparse.csr_matrix(p) for p in np.split(np.eye(4*n), 4, 1)]
+
+    def modes(**kwargs):
+        return kwant.physics.leads.modes(H_cell, H_hop, particle_hole=P_mat,
+                                         projectors=projectors, **kwargs)
+
+    prop, stab = modes()
+    prop_t, stab_t = modes(threads=3)
+    for a, b in [(prop.wave_functions, prop_t.wave_functions),
+                 (prop.momenta, prop_t.momenta), (stab.vecs, stab_t.vecs),
+                 (stab.vecslmbdainv, stab_t.vecslmbdainv)]:
+        assert_almost_equal(a, b)
+
+    prop_r, stab_r = modes(reuse_blocks=False, threads=2)
+    current_conserving(stab_r)
+    assert prop_r.block_nmodes == prop.block_nmodes
+    assert_almost_equal(np.sort(prop_r.momenta), np.sort(prop.momenta))
+    assert_almost_equal(stab_r.selfenergy(), stab.selfenergy())
+
+    raises(ValueError, modes, threads=0)
+
+
 def check_symm_ham(h_cell, h_hop, sym_op, trans_sign, sym):
     """Check that the symmetry operator and Hamiltonian are properly defined"""
     if sym in ['AI', 'AII', 'C', 'D']:
@@ -1158,3 +1198,72 @@ def test_blocks_symm_complex_projectors():
             # If first block is empty, so is the second one.
             else:
                 assert not in_modes[rows1, cols1].size
+
+
+def test_sparse_modes(monkeypatch):
+    # Use the sparse algorithm for the small blocks of this test.
+    monkeypatch.setattr(leads, '_SPARSE_MIN_SIZE', 0)
+    lat = kwant.lattice.general(np.identity(3), norbs=1)
+    rng = ensure_rng(4)
+    W = 8
+
+    lead = kwant.Builder(kwant.TranslationalSymmetry((-1, 0, 0)))
+    for y in range(W):
+        for z in range(W):
+            lead[lat(0, y, z)] = 6 + 0.5 * rng.random_sample()
+            if y:
+                # A magnetic field lifts the degeneracies.
+                lead[lat(0, y, z), lat(0, y - 1, z)] = -np.exp(0.3j * z)
+    lead[kwant.HoppingKind((1, 0, 0), lat)] = -1
+    lead[kwant.HoppingKind((0, 0, 1), lat)] = -1
+    flead = lead.finalized()
+
+    energy = 2
+    prop, stab = flead.modes(energy)
+    # All the evanescent modes are below the cutoff, so the result is exact.
+    prop_s, stab_s = flead.modes(energy, method='sparse',
+                                 evanescent_cutoff=20)
+    assert stab_s.nmodes == stab.nmodes
+    assert_almost_equal(prop_s.momenta, prop.momenta)
+    assert_almost_equal(prop_s.velocities, prop.velocities)
+    assert_almost_equal(stab_s.selfenergy(), stab.selfenergy())
+    # The modes are written in a basis of their span.
+    assert stab_s.vecs.shape[0] == stab_s.sqrt_hop.shape[1]
+
+    # Neglecting evanescent modes leaves the propagating ones intact.
+    prop_s, stab_s = flead.modes(energy, method='sparse',
+                                 evanescent_cutoff=2)
+    assert_almost_equal(prop_s.momenta, prop.momenta)
+    assert stab_s.vecs.shape[0] < W * W
+    error = np.max(abs(stab_s.selfenergy() - stab.selfenergy()))
+    assert 1e-6 < error < np.max(abs(stab.selfenergy()))
+
+    # The solvers accept the modes.
+    syst = kwant.Builder()
+    syst[(lat(x, y, z) for x in range(2) for y in range(W)
+          for z in range(W))] = 6
+    syst[lat.neighbors()] = -1
+    syst.attach_lead(lead)
+    syst.attach_lead(lead.reversed())
+    smatrix = kwant.smatrix(syst.finalized(), energy)
+    # The modes of `flead` are cached.
+    syst.leads[0] = kwant.builder.ModesLead(
+        lambda energy, args, *, params: flead.modes(
+            energy, args, params=params, method='sparse',
+            evanescent_cutoff=20),
+        syst.leads[0].interface)
+    smatrix_s = kwant.smatrix(syst.finalized(), energy)
+    assert_almost_equal(smatrix_s.transmission(1, 0),
+                        smatrix.transmission(1, 0))
+    assert_almost_equal(smatrix_s.transmission(0, 0),
+                        smatrix.transmission(0, 0))
+
+    # Small blocks are solved exactly with the dense algorithm.
+    monkeypatch.undo()
+    stab_s = flead.modes(energy, method='sparse', evanescent_cutoff=3)[1]
+    assert_almost_equal(stab_s.selfenergy(), stab.selfenergy())
+
+    raises(ValueError, leads.modes, np.identity(2), np.ones((2, 1)),
+           method='sparse')
+    raises(ValueError, leads.modes, np.identity(2), np.identity(2),
+           method='dense sparse')
@@ -1644,7 +1644,7 @@ def bands(sys, args=(), momenta=65, file=None, show=True, dpi=None,
         momenta = np.linspace(-np.pi, np.pi, momenta)
 
     bands = physics.Bands(syst, args, params=params)
-    energies = [bands(k) for k in momenta]
+    energies = bands(momenta)
 
     if ax is None:
         fig = Figure()
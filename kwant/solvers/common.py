@@ -55,6 +55,12 @@ class SparseSolver(metaclass=abc.ABCMeta):
       kept_vars covers all entries in the solution). This should be not too big
       too avoid excessive memory usage, but for some solvers not too small for
       performance reasons.
+
+    A derived class that recycles the objects returned by `_factorized` (for
+    example to reuse a symbolic factorization) must also override
+    `_keep_factorized` and `_release_factorized`.  A derived class may
+    override `_solve_block` to compute only a block of the solution more
+    efficiently.
     """
 
     @abc.abstractmethod
@@ -74,6 +80,37 @@ class SparseSolver(metaclass=abc.ABCMeta):
         """
         pass
 
+    def _keep_factorized(self, factorized_a):
+        """Signal that `factorized_a` will be used after further calls to
+        `_factorized`.
+
+        Solvers that recycle factorizations must not modify `factorized_a`
+        anymore.  The default implementation does nothing.
+        """
+        pass
+
+    def _release_factorized(self, factorized_a):
+        """Signal that `factorized_a` is not used anymore.
+
+        Solvers that recycle factorizations should free the memory that is
+        not needed for recycling.  The default implementation does nothing.
+        """
+        pass
+
+    def _solve_block(self, a, b, kept_vars):
+        """Solve the linear system `a x = b`, returning ``x[kept_vars]``.
+
+        This is used when only a small block of the solution is needed, as
+        for scattering matrices and Green's functions.  The default
+        implementation factorizes `a` with `_factorized` and solves with
+        `_solve_linear_sys`.
+        """
+        factorized_a = self._factorized(a)
+        try:
+            return self._solve_linear_sys(factorized_a, b, kept_vars)
+        finally:
+            self._release_factorized(factorized_a)
+
     @abc.abstractmethod
     def _solve_linear_sys(self, factorized_a, b, kept_vars):
         """
@@ -96,9 +133,33 @@ class SparseSolver(metaclass=abc.ABCMeta):
         """
         pass
 
+    def _hamiltonian(self, syst, args=(), check_hermiticity=True,
+                     *, params=None):
+        """Evaluate the Hamiltonian of the scattering region.
+
+        Returns
+        -------
+        (ham, norb) : tuple
+            `ham` is the Hamiltonian as a `scipy.sparse.coo_matrix` without
+            duplicate entries, `norb` is an array with the number of orbitals
+            of each site.
+
+        Raises
+        ------
+        ValueError
+            If `check_hermiticity` is true and the Hamiltonian is not
+            Hermitian.
+        """
+        ham, norb = syst.hamiltonian_submatrix(args, sparse=True,
+                                               return_norb=True,
+                                               params=params)[:2]
+        if check_hermiticity and len(ham.data):
+            _check_hermiticity(ham, norb)
+        return ham, norb
+
     def _make_linear_sys(self, sys, in_leads, energy=0, args=(),
                          check_hermiticity=True, realspace=False,
-                         *, params=None):
+                         *, params=None, hamiltonian=None):
         """Make a sparse linear system of equations defining a scattering
         problem.
 
@@ -124,12 +185,16 @@ class SparseSolver(metaclass=abc.ABCMeta):
         params : dict, optional
             Dictionary of parameter names and their values. Mutually exclusive
             with 'args'.
+        hamiltonian : tuple, optional
+            The Hamiltonian of the scattering region as returned by
+            `_hamiltonian`.  If provided, it is used instead of evaluating
+            (and checking) the Hamiltonian again.
 
         Returns
         -------
         (lhs, rhs, indices, num_orb) : LinearSys
-            `lhs` is a scipy.sparse.csc_matrix, containing the left hand side
-            of the system of equations.  `rhs` is a list of matrices with the
+            `lhs` is a sparse matrix in `lhsformat`, containing the left hand
+            side of the system of equations.  `rhs` is a list of matrices with the
             right hand side, with each matrix corresponding to one lead
             mentioned in `in_leads`. `indices` is a list of arrays of variables
             in the system of equations corresponding to the the outgoing modes
@@ -154,34 +219,41 @@ class SparseSolver(metaclass=abc.ABCMeta):
         syst = sys  # ensure consistent naming across function bodies
         ensure_isinstance(syst, system.System)
 
-        splhsmat = getattr(sp, self.lhsformat + '_matrix')
         sprhsmat = getattr(sp, self.rhsformat + '_matrix')
 
         if not syst.lead_interfaces:
             raise ValueError('System contains no leads.')
-        lhs, norb = syst.hamiltonian_submatrix(args, sparse=True,
-                                               return_norb=True,
-                                               params=params)[:2]
-        lhs = getattr(lhs, 'to' + self.lhsformat)()
-        lhs = lhs - energy * sp.identity(lhs.shape[0], format=self.lhsformat)
-        num_orb = lhs.shape[0]
-
-        if check_hermiticity and len(lhs.data):
-            rtol = 1e-13
-            atol = 1e-300
-            tol = rtol * np.max(np.abs(lhs.data)) + atol
-            if np.any(np.abs((lhs - lhs.T.conj()).data) > tol):
-                raise ValueError('System Hamiltonian is not Hermitian. '
-                                 'Use option `check_hermiticity=False` '
-                                 'if this is intentional.')
+        if hamiltonian is None:
+            hamiltonian = self._hamiltonian(syst, args, check_hermiticity,
+                                            params=params)
+        ham, norb = hamiltonian
+        num_orb = ham.shape[0]
 
         offsets = np.empty(norb.shape[0] + 1, int)
         offsets[0] = 0
         offsets[1 :] = np.cumsum(norb)
 
+        # The lhs is assembled from COO triplets that are collected in a single
+        # pass over the scattering region and the leads and are only turned
+        # into a sparse matrix at the end.  The energy is subtracted from the
+        # existing diagonal entries of the Hamiltonian; new entries are only
+        # added where the diagonal is not yet occupied.
+        on_diag = ham.row == ham.col
+        ham_data = ham.data.copy()
+        ham_data[on_diag] -= energy
+        rows, cols, data = [ham.row], [ham.col], [ham_data]
+        if energy != 0:
+            empty_diag = np.ones(num_orb, bool)
+            empty_diag[ham.row[on_diag]] = False
+            empty_diag = np.flatnonzero(empty_diag)
+            rows.append(empty_diag)
+            cols.append(empty_diag)
+            data.append(np.full(len(empty_diag), -energy, complex))
+
         # Process the leads, generate the eigenvector matrices and lambda
-        # vectors. Then create blocks of the linear system and add them
-        # step by step.
+        # vectors. Then add the blocks of the linear system.  `size` is the
+        # number of variables of the linear system so far.
+        size = num_orb
         indices = []
         rhs = []
         lead_info = []
@@ -199,14 +271,13 @@ class SparseSolver(metaclass=abc.ABCMeta):
                     rhs.append(None)
                     continue
 
-                indices.append(np.arange(lhs.shape[0], lhs.shape[0] + nprop))
+                indices.append(np.arange(size, size + nprop))
 
                 u_out, ulinv_out = u[:, nprop:], ulinv[:, nprop:]
                 u_in, ulinv_in = u[:, :nprop], ulinv[:, :nprop]
 
-                # Construct a matrix of 1's that translates the
-                # inter-cell hopping to a proper hopping
-                # from the system to the lead.
+                # The orbitals of the scattering region to which the lead
+                # is attached.
                 iface_orbs = np.r_[tuple(slice(offsets[i], offsets[i + 1])
                                         for i in interface)]
 
@@ -217,33 +288,36 @@ class SparseSolver(metaclass=abc.ABCMeta):
                            'incompatible with its interface dimension.')
                     raise ValueError(msg.format(leadnum))
 
-                coords = np.r_[[np.arange(len(iface_orbs))], [iface_orbs]]
-                transf = sp.csc_matrix((np.ones(len(iface_orbs)), coords),
-                                       shape=(iface_orbs.size, lhs.shape[0]))
-
+                # The lead adds the rows and columns `lead_vars` to the lhs.
+                lead_vars = np.arange(size, size + ulinv_out.shape[0])
                 if svd_v is not None:
-                    v_sp = sp.csc_matrix(svd_v.T.conj()) * transf
-                    vdaguout_sp = (transf.T *
-                                   sp.csc_matrix(np.dot(svd_v, u_out)))
-                    lead_mat = - ulinv_out
+                    v = svd_v.T.conj()
+                    vdaguout = np.dot(svd_v, u_out)
                 else:
-                    v_sp = transf
-                    vdaguout_sp = transf.T * sp.csc_matrix(u_out)
-                    lead_mat = - ulinv_out
-
-                lhs = sp.bmat([[lhs, vdaguout_sp], [v_sp, lead_mat]],
-                              format=self.lhsformat)
+                    v = np.identity(len(iface_orbs))
+                    vdaguout = u_out
+                for block, block_rows, block_cols in (
+                        (vdaguout, iface_orbs, lead_vars),
+                        (v, lead_vars, iface_orbs),
+                        (-ulinv_out, lead_vars, lead_vars)):
+                    r, c, d = _block_coo(block, block_rows, block_cols)
+                    rows.append(r)
+                    cols.append(c)
+                    data.append(d)
+                size += len(lead_vars)
 
                 if leadnum in in_leads and nprop > 0:
                     if svd_v is not None:
-                        vdaguin_sp = transf.T * sp.csc_matrix(
-                            -np.dot(svd_v, u_in))
+                        vdaguin = -np.dot(svd_v, u_in)
                     else:
-                        vdaguin_sp = transf.T * sp.csc_matrix(-u_in)
-
+                        vdaguin = -u_in
+                    in_modes = np.arange(nprop)
+                    blocks = [_block_coo(vdaguin, iface_orbs, in_modes),
+                              _block_coo(ulinv_in, lead_vars, in_modes)]
                     # defer formation of the real matrix until the proper
                     # system size is known
-                    rhs.append((vdaguin_sp, ulinv_in))
+                    rhs.append((nprop,) + tuple(map(np.concatenate,
+                                                    zip(*blocks))))
                 else:
                     rhs.append(None)
             else:
@@ -258,39 +332,32 @@ class SparseSolver(metaclass=abc.ABCMeta):
                            'sites for which it is defined.')
                     raise ValueError(msg.format(leadnum))
 
-                y, x = np.meshgrid(coords, coords)
-                sig_sparse = splhsmat((sigma.flat, [x.flat, y.flat]),
-                                      lhs.shape)
-                lhs = lhs + sig_sparse  # __iadd__ is not implemented in v0.7
+                r, c, d = _block_coo(sigma, coords, coords)
+                rows.append(r)
+                cols.append(c)
+                data.append(d)
                 indices.append(coords)
                 if leadnum in in_leads:
                     # defer formation of true rhs until the proper system
                     # size is known
-                    rhs.append((coords,))
+                    l = coords.shape[0]
+                    rhs.append((l, coords, np.arange(l), -np.ones(l)))
 
-        # Resize the right-hand sides to be compatible with the full lhs
+        lhs = sp.coo_matrix((np.concatenate(data),
+                             (np.concatenate(rows), np.concatenate(cols))),
+                            shape=(size, size))
+        # Duplicate entries (from self-energies) are summed by the conversion
+        # to a compressed format, and by the solvers that take COO matrices.
+        lhs = lhs.asformat(self.lhsformat)
+
+        # Form the right-hand sides now that the size of the lhs is known.
         for i, mats in enumerate(rhs):
             if isinstance(mats, tuple):
-                if len(mats) == 1:
-                    # self-energy lead
-                    l = mats[0].shape[0]
-                    rhs[i] = sprhsmat((-np.ones(l), [mats[0], np.arange(l)]),
-                                      shape=(lhs.shape[0], l))
-                else:
-                    # lead with modes
-                    zero_rows = (lhs.shape[0] - mats[0].shape[0] -
-                                 mats[1].shape[0])
-
-                    if zero_rows:
-                        zero_mat = sprhsmat((zero_rows, mats[0].shape[1]))
-                        bmat = [[mats[0]], [mats[1]], [zero_mat]]
-                    else:
-                        bmat = [[mats[0]], [mats[1]]]
-
-                    rhs[i] = sp.bmat(bmat, format=self.rhsformat)
+                ncols, r, c, d = mats
+                rhs[i] = sprhsmat((d, (r, c)), shape=(size, ncols))
             elif mats is None:
                 # A lead with no rhs.
-                rhs[i] = np.zeros((lhs.shape[0], 0))
+                rhs[i] = np.zeros((size, 0))
             else:
                 raise RuntimeError('Unknown right-hand side format')
 
@@ -349,44 +416,10 @@ class SparseSolver(metaclass=abc.ABCMeta):
 
         syst = sys  # ensure consistent naming across function bodies
         ensure_isinstance(syst, system.System)
+        out_leads, in_leads = _lead_lists(syst, out_leads, in_leads)
 
-        n = len(syst.lead_interfaces)
-        if in_leads is None:
-            in_leads = list(range(n))
-        else:
-            in_leads = list(in_leads)
-        if out_leads is None:
-            out_leads = list(range(n))
-        else:
-            out_leads = list(out_leads)
-        if (np.any(np.diff(in_leads) <= 0) or np.any(np.diff(out_leads) <= 0)):
-            raise ValueError("Lead lists must be sorted and "
-                             "with unique entries.")
-        if len(in_leads) == 0 or len(out_leads) == 0:
-            raise ValueError("No output is requested.")
-
-        linsys, lead_info = self._make_linear_sys(syst, in_leads, energy, args,
-                                                  check_hermiticity, False,
-                                                  params=params)
-
-        kept_vars = np.concatenate([coords for i, coords in
-                                    enumerate(linsys.indices) if i in
-                                    out_leads])
-
-        # Do not perform factorization if no calculation is to be done.
-        len_rhs = sum(i.shape[1] for i in linsys.rhs)
-        len_kv = len(kept_vars)
-        if not(len_rhs and len_kv):
-            return SMatrix(np.zeros((len_kv, len_rhs)), lead_info,
-                           out_leads, in_leads, check_hermiticity)
-
-        # See comment about zero-shaped sparse matrices at the top of common.py.
-        rhs = sp.bmat([[i for i in linsys.rhs if i.shape[1]]],
-                      format=self.rhsformat)
-        flhs = self._factorized(linsys.lhs)
-        data = self._solve_linear_sys(flhs, rhs, kept_vars)
-
-        return SMatrix(data, lead_info, out_leads, in_leads, check_hermiticity)
+        return self._block_result(syst, energy, args, out_leads, in_leads,
+                                  check_hermiticity, False, params)
 
     def greens_function(self, sys, energy=0, args=(),
                         out_leads=None, in_leads=None, check_hermiticity=True,
@@ -444,25 +477,22 @@ class SparseSolver(metaclass=abc.ABCMeta):
 
         syst = sys  # ensure consistent naming across function bodies
         ensure_isinstance(syst, system.System)
+        out_leads, in_leads = _lead_lists(syst, out_leads, in_leads)
 
-        n = len(syst.lead_interfaces)
-        if in_leads is None:
-            in_leads = list(range(n))
-        else:
-            in_leads = list(in_leads)
-        if out_leads is None:
-            out_leads = list(range(n))
-        else:
-            out_leads = list(out_leads)
-        if (np.any(np.diff(in_leads) <= 0) or np.any(np.diff(out_leads) <= 0)):
-            raise ValueError("Lead lists must be sorted and "
-                             "with unique entries.")
-        if len(in_leads) == 0 or len(out_leads) == 0:
-            raise ValueError("No output is requested.")
+        return self._block_result(syst, energy, args, out_leads, in_leads,
+                                  check_hermiticity, True, params)
 
+    def _block_result(self, syst, energy, args, out_leads, in_leads,
+                      check_hermiticity, realspace, params, hamiltonian=None):
+        """Compute a `SMatrix` or, if `realspace` is true, a `GreensFunction`.
+
+        The lead lists must have been validated by `_lead_lists`.
+        """
+        result_type = GreensFunction if realspace else SMatrix
         linsys, lead_info = self._make_linear_sys(syst, in_leads, energy, args,
-                                                  check_hermiticity, True,
-                                                  params=params)
+                                                  check_hermiticity, realspace,
+                                                  params=params,
+                                                  hamiltonian=hamiltonian)
 
         kept_vars = np.concatenate([coords for i, coords in
                                     enumerate(linsys.indices) if i in
@@ -472,17 +502,16 @@ class SparseSolver(metaclass=abc.ABCMeta):
         len_rhs = sum(i.shape[1] for i in linsys.rhs)
         len_kv = len(kept_vars)
         if not(len_rhs and len_kv):
-            return GreensFunction(np.zeros((len_kv, len_rhs)), lead_info,
-                                  out_leads, in_leads, check_hermiticity)
+            return result_type(np.zeros((len_kv, len_rhs)), lead_info,
+                               out_leads, in_leads, check_hermiticity)
 
         # See comment about zero-shaped sparse matrices at the top of common.py.
         rhs = sp.bmat([[i for i in linsys.rhs if i.shape[1]]],
                       format=self.rhsformat)
-        flhs = self._factorized(linsys.lhs)
-        data = self._solve_linear_sys(flhs, rhs, kept_vars)
+        data = self._solve_block(linsys.lhs, rhs, kept_vars)
 
-        return GreensFunction(data, lead_info, out_leads, in_leads,
-                              check_hermiticity)
+        return result_type(data, lead_info, out_leads, in_leads,
+                           check_hermiticity)
 
     def ldos(self, sys, energy=0, args=(), check_hermiticity=True,
              *, params=None):
@@ -514,19 +543,16 @@ class SparseSolver(metaclass=abc.ABCMeta):
 
         syst = sys  # ensure consistent naming across function bodies
         ensure_isinstance(syst, system.System)
-        if not check_hermiticity:
-            raise NotImplementedError("ldos for non-Hermitian Hamiltonians "
-                                      "is not implemented yet.")
+        _check_ldos_possible(syst, check_hermiticity)
 
-        for lead in syst.leads:
-            if not hasattr(lead, 'modes') and hasattr(lead, 'selfenergy'):
-                # TODO: fix this
-                raise NotImplementedError("ldos for leads with only "
-                                          "self-energy is not implemented yet.")
+        return self._ldos(syst, energy, args, check_hermiticity, params)
 
+    def _ldos(self, syst, energy, args, check_hermiticity, params,
+              hamiltonian=None):
         linsys = self._make_linear_sys(syst, range(len(syst.leads)), energy,
                                        args, check_hermiticity,
-                                       params=params)[0]
+                                       params=params,
+                                       hamiltonian=hamiltonian)[0]
 
         ldos = np.zeros(linsys.num_orb, float)
 
@@ -539,14 +565,172 @@ class SparseSolver(metaclass=abc.ABCMeta):
         # See comment about zero-shaped sparse matrices at the top of common.py.
         rhs = sp.bmat([[i for i in linsys.rhs if i.shape[1]]],
                       format=self.rhsformat)
-        for j in range(0, rhs.shape[1], self.nrhs):
-            jend = min(j + self.nrhs, rhs.shape[1])
-            psi = self._solve_linear_sys(factored, rhs[:, j:jend],
-                                         slice(linsys.num_orb))
-            ldos += np.sum(np.square(abs(psi)), axis=1)
+        try:
+            for j in range(0, rhs.shape[1], self.nrhs):
+                jend = min(j + self.nrhs, rhs.shape[1])
+                psi = self._solve_linear_sys(factored, rhs[:, j:jend],
+                                             slice(linsys.num_orb))
+                ldos += np.sum(np.square(abs(psi)), axis=1)
+        finally:
+            self._release_factorized(factored)
 
         return ldos * (0.5 / np.pi)
 
+    def smatrix_sweep(self, sys, energies, args=(),
+                      out_leads=None, in_leads=None, check_hermiticity=True,
+                      *, params=None):
+        """
+        Compute the scattering matrix of a system for a sequence of energies.
+
+        This is equivalent to calling `smatrix` for each energy, but the
+        Hamiltonian of the scattering region is only evaluated (and checked
+        for hermiticity) once.  Solvers that support it additionally reuse the
+        analysis of the sparse linear system between energies.
+
+        Parameters
+        ----------
+        sys : `kwant.system.FiniteSystem`
+            Low level system, containing the leads and the Hamiltonian of a
+            scattering region.
+        energies : sequence of numbers
+            Excitation energies at which to solve the scattering problem.
+        args : tuple, defaults to empty
+            Positional arguments to pass to the ``hamiltonian`` method.
+            Mutually exclusive with 'params'.
+        out_leads : sequence of integers or ``None``
+            Numbers of leads where current or wave function is extracted.  None
+            is interpreted as all leads. Default is ``None`` and means "all
+            leads".
+        in_leads : sequence of integers or ``None``
+            Numbers of leads in which current or wave function is injected.
+            None is interpreted as all leads. Default is ``None`` and means
+            "all leads".
+        check_hermiticity : ``bool``
+            Check if the Hamiltonian matrices are Hermitian.
+            Enables deduction of missing transmission coefficients.
+        params : dict, optional
+            Dictionary of parameter names and their values. Mutually exclusive
+            with 'args'.
+
+        Returns
+        -------
+        output : iterator of `~kwant.solvers.common.SMatrix`
+            The scattering matrices, one for each energy, in the order of
+            `energies`.  They are computed lazily, as the iterator is consumed.
+
+        Notes
+        -----
+        The value functions of the scattering region must not depend on the
+        energy.  The lead Hamiltonians are evaluated anew for each energy.
+
+        Examples
+        --------
+        >>> energies = np.linspace(0, 1, 101)
+        >>> transmissions = [s.transmission(1, 0) for s in
+        ...                  kwant.solvers.default.smatrix_sweep(syst, energies)]
+        """
+        syst = sys  # ensure consistent naming across function bodies
+        ensure_isinstance(syst, system.System)
+        out_leads, in_leads = _lead_lists(syst, out_leads, in_leads)
+        ham = self._hamiltonian(syst, args, check_hermiticity, params=params)
+
+        return (self._block_result(syst, energy, args, out_leads, in_leads,
+                                   check_hermiticity, False, params, ham)
+                for energy in energies)
+
+    def greens_function_sweep(self, sys, energies, args=(),
+                              out_leads=None, in_leads=None,
+                              check_hermiticity=True, *, params=None):
+        """
+        Compute the retarded Green's function of the system between its leads
+        for a sequence of energies.
+
+        This is equivalent to calling `greens_function` for each energy, but
+        the Hamiltonian of the scattering region is only evaluated once.  See
+        `smatrix_sweep` for details.
+
+        Parameters
+        ----------
+        sys : `kwant.system.FiniteSystem`
+            Low level system, containing the leads and the Hamiltonian of a
+            scattering region.
+        energies : sequence of numbers
+            Excitation energies at which to solve the scattering problem.
+        args : tuple, defaults to empty
+            Positional arguments to pass to the ``hamiltonian`` method.
+            Mutually exclusive with 'params'.
+        out_leads : sequence of integers or ``None``
+            Numbers of leads where current or wave function is extracted.  None
+            is interpreted as all leads. Default is ``None`` and means "all
+            leads".
+        in_leads : sequence of integers or ``None``
+            Numbers of leads in which current or wave function is injected.
+            None is interpreted as all leads. Default is ``None`` and means
+            "all leads".
+        check_hermiticity : ``bool``
+            Check if the Hamiltonian matrices are Hermitian.
+            Enables deduction of missing transmission coefficients.
+        params : dict, optional
+            Dictionary of parameter names and their values. Mutually exclusive
+            with 'args'.
+
+        Returns
+        -------
+        output : iterator of `~kwant.solvers.common.GreensFunction`
+            The Green's functions, one for each energy, in the order of
+            `energies`.  They are computed lazily, as the iterator is consumed.
+        """
+        syst = sys  # ensure consistent naming across function bodies
+        ensure_isinstance(syst, system.System)
+        out_leads, in_leads = _lead_lists(syst, out_leads, in_leads)
+        ham = self._hamiltonian(syst, args, check_hermiticity, params=params)
+
+        return (self._block_result(syst, energy, args, out_leads, in_leads,
+                                   check_hermiticity, True, params, ham)
+                for energy in energies)
+
+    def ldos_sweep(self, sys, energies, args=(), check_hermiticity=True,
+                   *, params=None):
+        """
+        Calculate the local density of states of a system for a sequence of
+        energies.
+
+        This is equivalent to calling `ldos` for each energy, but the
+        Hamiltonian of the scattering region is only evaluated once.  See
+        `smatrix_sweep` for details.
+
+        Parameters
+        ----------
+        sys : `kwant.system.FiniteSystem`
+            Low level system, containing the leads and the Hamiltonian of the
+            scattering region.
+        energies : sequence of numbers
+            Excitation energies at which to solve the scattering problem.
+        args : tuple of arguments, or empty tuple
+            Positional arguments to pass to the function(s) which
+            evaluate the hamiltonian matrix elements.  Mutually exclusive
+            with 'params'.
+        check_hermiticity : ``bool``
+            Check if the Hamiltonian matrices are Hermitian.
+        params : dict, optional
+            Dictionary of parameter names and their values. Mutually exclusive
+            with 'args'.
+
+        Returns
+        -------
+        ldos : iterator of NumPy arrays
+            Local density of states at each orbital of the system, one array
+            for each energy.  Use ``np.array(list(ldos))`` to obtain an array
+            of shape ``(len(energies), num_orbitals)``.
+        """
+        syst = sys  # ensure consistent naming across function bodies
+        ensure_isinstance(syst, system.System)
+        _check_ldos_possible(syst, check_hermiticity)
+        ham = self._hamiltonian(syst, args, check_hermiticity, params=params)
+
+        return (self._ldos(syst, energy, args, check_hermiticity, params, ham)
+                for energy in energies)
+
     def wave_function(self, sys, energy=0, args=(), check_hermiticity=True,
                       *, params=None):
         """
@@ -587,6 +771,78 @@ class SparseSolver(metaclass=abc.ABCMeta):
         return WaveFunction(self, sys, energy, args, check_hermiticity, params)
 
 
+def _block_coo(block, rows, cols):
+    """Return the COO triplets of the nonzero entries of a dense block.
+
+    `rows` and `cols` are the indices of the rows and columns of the block in
+    the full matrix.
+    """
+    i, j = np.nonzero(block)
+    return rows[i], cols[j], block[i, j]
+
+
+def _check_hermiticity(ham, norb):
+    """Raise a ValueError if the Hamiltonian `ham` is not Hermitian.
+
+    `ham` is a COO matrix without duplicate entries as returned by
+    `hamiltonian_submatrix`.  The latter always fills in the hopping blocks
+    from the Hermitian conjugate of their counterparts, such that it suffices
+    to check the onsite blocks (of the sizes given by `norb`).  This is done
+    by pairing their entries directly instead of forming a transposed copy of
+    the matrix.
+    """
+    rtol = 1e-13
+    atol = 1e-300
+    tol = rtol * np.max(np.abs(ham.data)) + atol
+
+    site = np.repeat(np.arange(len(norb)), norb)
+    onsite = site[ham.row] == site[ham.col]
+    row, col, data = ham.row[onsite], ham.col[onsite], ham.data[onsite]
+    n = ham.shape[0]
+    keys = row.astype(np.int64) * n + col
+    transposed = col.astype(np.int64) * n + row
+    order = np.argsort(keys)
+    partner = order[np.minimum(np.searchsorted(keys, transposed, sorter=order),
+                               len(keys) - 1)]
+    partner_data = np.where(keys[partner] == transposed,
+                            data[partner].conj(), 0)
+    if np.any(np.abs(data - partner_data) > tol):
+        raise ValueError('System Hamiltonian is not Hermitian. '
+                         'Use option `check_hermiticity=False` '
+                         'if this is intentional.')
+
+
+def _lead_lists(syst, out_leads, in_leads):
+    """Return validated lists of output and input leads."""
+    n = len(syst.lead_interfaces)
+    if in_leads is None:
+        in_leads = list(range(n))
+    else:
+        in_leads = list(in_leads)
+    if out_leads is None:
+        out_leads = list(range(n))
+    else:
+        out_leads = list(out_leads)
+    if (np.any(np.diff(in_leads) <= 0) or np.any(np.diff(out_leads) <= 0)):
+        raise ValueError("Lead lists must be sorted and "
+                         "with unique entries.")
+    if len(in_leads) == 0 or len(out_leads) == 0:
+        raise ValueError("No output is requested.")
+    return out_leads, in_leads
+
+
+def _check_ldos_possible(syst, check_hermiticity):
+    if not check_hermiticity:
+        raise NotImplementedError("ldos for non-Hermitian Hamiltonians "
+                                  "is not implemented yet.")
+
+    for lead in syst.leads:
+        if not hasattr(lead, 'modes') and hasattr(lead, 'selfenergy'):
+            # TODO: fix this
+            raise NotImplementedError("ldos for leads with only "
+                                      "self-energy is not implemented yet.")
+
+
 class WaveFunction:
     def __init__(self, solver, sys, energy, args, check_hermiticity, params):
         syst = sys  # ensure consistent naming across function bodies
@@ -603,6 +859,7 @@ class WaveFunction:
         self.solve = solver._solve_linear_sys
         self.rhs = linsys.rhs
         self.factorized_h = solver._factorized(linsys.lhs)
+        solver._keep_factorized(self.factorized_h)
         self.num_orb = linsys.num_orb
 
     def __call__(self, lead):
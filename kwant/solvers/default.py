@@ -6,7 +6,8 @@
 # the file AUTHORS.rst at the top-level directory of this distribution and at
 # http://kwant-project.org/authors.
 
-__all__ = ['smatrix', 'ldos', 'wave_function', 'greens_function']
+__all__ = ['smatrix', 'ldos', 'wave_function', 'greens_function',
+           'smatrix_sweep', 'ldos_sweep', 'greens_function_sweep']
 
 # MUMPS usually works best.  Use SciPy as fallback.
 import warnings
@@ -24,3 +25,6 @@ smatrix = hidden_instance.smatrix
 ldos = hidden_instance.ldos
 wave_function = hidden_instance.wave_function
 greens_function = hidden_instance.greens_function
+smatrix_sweep = hidden_instance.smatrix_sweep
+greens_function_sweep = hidden_instance.greens_function_sweep
+ldos_sweep = hidden_instance.ldos_sweep
@@ -6,13 +6,17 @@
 # the file AUTHORS.rst at the top-level directory of this distribution and at
 # http://kwant-project.org/authors.
 
-__all__ = ['smatrix', 'ldos', 'wave_function', 'greens_function', 'options',
-           'Solver']
+__all__ = ['smatrix', 'ldos', 'wave_function', 'greens_function',
+           'smatrix_sweep', 'ldos_sweep', 'greens_function_sweep', 'options',
+           'analyze', 'Solver']
 
 import numpy as np
 from . import common
 from ..linalg import mumps
 
+# Values of INFOG(1) with which MUMPS reports a singular matrix.
+_SINGULAR = (-6, -10)
+
 
 class Solver(common.SparseSolver):
     """Sparse Solver class based on the sparse direct solver MUMPS."""
@@ -22,13 +26,30 @@ class Solver(common.SparseSolver):
 
     def __init__(self):
         self.nrhs = self.ordering = self.sparse_rhs = None
+        self.reuse_analysis = None
+        self.ooc = self.ooc_dir = self.memory_limit = None
+        self.schur_complement = None
+        # Analysis of the last factorized matrix: a tuple (ordering, shape,
+        # row, col, schur_vars, MUMPSContext), or None.  The factors of the
+        # context are freed once the solve is done.
+        self._analysis = None
         self.reset_options()
 
+    def __getstate__(self):
+        # MUMPS contexts cannot be pickled; the analysis is simply redone.
+        state = self.__dict__.copy()
+        state['_analysis'] = None
+        return state
+
     def reset_options(self):
         """Set the options to default values.  Return the old options."""
-        return self.options(nrhs=6, ordering='kwant_decides', sparse_rhs=False)
+        return self.options(nrhs=6, ordering='kwant_decides', sparse_rhs=False,
+                            reuse_analysis=True, ooc=False, ooc_dir='',
+                            memory_limit=0, schur_complement=False)
 
-    def options(self, nrhs=None, ordering=None, sparse_rhs=None):
+    def options(self, nrhs=None, ordering=None, sparse_rhs=None,
+                reuse_analysis=None, ooc=None, ooc_dir=None,
+                memory_limit=None, schur_complement=None):
         """
         Modify some options.  Return the old options.
 
@@ -57,6 +78,44 @@ class Solver(common.SparseSolver):
             MUMPS. Preliminary tests have not shown a significant performance
             increase when this feature is used, but this needs more looking
             into. Default value is False.
+        reuse_analysis : True or False
+            whether to reuse the analysis step of MUMPS (ordering and symbolic
+            factorization) when the sparsity structure of the linear system is
+            the same as in the previous call, as is typically the case when
+            sweeping energies or parameters.  Only the numerical factorization
+            is then performed.  When the structure changes (e.g. the number of
+            lead modes changes), a full analysis is done.  The numerical
+            factorization is freed after each solve, which requires MUMPS 5.5
+            or later; with older versions of MUMPS the analysis is kept only
+            within a single solve.  Default value is True.
+        ooc : True, False or 'auto'
+            whether to use the out-of-core functionality of MUMPS, i.e. to
+            store the factors on disk instead of in memory.  This is slower,
+            but reduces the memory usage considerably for large systems.  If
+            'auto', the out-of-core mode is used only when the estimated
+            memory of an in-core factorization exceeds `memory_limit`.
+            Default value is False.
+        ooc_dir : string
+            directory in which the out-of-core factors are stored.  If empty,
+            the environment variable ``MUMPS_OOC_TMPDIR`` or the MUMPS default
+            is used.  Default value is ''.
+        memory_limit : number
+            maximal working memory in megabytes that MUMPS may use for the
+            factorization.  If the limit is too small, a
+            `~kwant.linalg.mumps.MUMPSError` is raised.  0 means no limit.
+            Default value is 0.
+        schur_complement : True or False
+            whether to compute scattering matrices and Green's functions from
+            the Schur complement of the linear system onto the variables that
+            are coupled to the leads.  MUMPS computes the Schur complement
+            during the factorization, which avoids one solve per injected mode
+            and is much faster when many modes are injected.  The options
+            `reuse_analysis`, `ooc`, `ooc_dir` and `memory_limit` apply as
+            well.  If the part of the system that is not coupled to the leads
+            is singular at the energy in question, the usual solve is used
+            instead.  This option
+            does not affect `wave_function` and `ldos`.  Default value is
+            False.
 
         Returns
         -------
@@ -71,11 +130,32 @@ class Solver(common.SparseSolver):
         >>> saved_options = kwant.solvers.mumps.options(nrhs=12)
         >>> some_code()
         >>> kwant.solvers.mumps.options(**saved_options)
+
+        The memory needed by the factorization can be estimated beforehand
+        with `analyze`, for example to decide whether to go out-of-core:
+
+        >>> stats = kwant.solvers.mumps.analyze(syst, energy)
+        >>> if stats.est_mem_incore > 4000:
+        ...     kwant.solvers.mumps.options(ooc=True, ooc_dir='/scratch')
         """
 
         old_opts = {'nrhs': self.nrhs,
                     'ordering': self.ordering,
-                    'sparse_rhs': self.sparse_rhs}
+                    'sparse_rhs': self.sparse_rhs,
+                    'reuse_analysis': self.reuse_analysis,
+                    'ooc': self.ooc,
+                    'ooc_dir': self.ooc_dir,
+                    'memory_limit': self.memory_limit,
+                    'schur_complement': self.schur_complement}
+
+        if ooc is not None and ooc != 'auto':
+            ooc = bool(ooc)
+        if memory_limit is not None and memory_limit < 0:
+            raise ValueError("memory_limit must not be negative")
+        if (ooc if ooc is not None else self.ooc) == 'auto' and not (
+                memory_limit if memory_limit is not None
+                else self.memory_limit):
+            raise ValueError("ooc='auto' requires a memory_limit")
 
         if nrhs is not None:
             if nrhs < 1 and int(nrhs) != nrhs:
@@ -97,13 +177,133 @@ class Solver(common.SparseSolver):
         if sparse_rhs is not None:
             self.sparse_rhs = bool(sparse_rhs)
 
+        if reuse_analysis is not None:
+            self.reuse_analysis = bool(reuse_analysis)
+            if not self.reuse_analysis:
+                self._analysis = None
+
+        if ooc is not None:
+            self.ooc = ooc
+
+        if ooc_dir is not None:
+            self.ooc_dir = str(ooc_dir)
+
+        if memory_limit is not None:
+            self.memory_limit = memory_limit
+
+        if schur_complement is not None:
+            self.schur_complement = bool(schur_complement)
+
         return old_opts
 
-    def _factorized(self, a):
+    def _analyzed(self, a, schur_vars=None):
+        """Return a MUMPSContext that contains the analysis of `a`.
+
+        If `schur_vars` is given, the factorization computes the Schur
+        complement onto these variables.
+        """
+        analysis = self._analysis
+        if (self.reuse_analysis and analysis is not None and
+            analysis[:2] == (self.ordering, a.shape) and
+            np.array_equal(analysis[2], a.row) and
+            np.array_equal(analysis[3], a.col) and
+            (schur_vars is None if analysis[4] is None
+             else np.array_equal(analysis[4], schur_vars))):
+            return analysis[5]
+
         inst = mumps.MUMPSContext()
-        inst.factor(a, ordering=self.ordering)
+        inst.analyze(a, ordering=self.ordering, schur_indices=schur_vars)
+        if self.reuse_analysis:
+            self._analysis = (self.ordering, a.shape, a.row, a.col,
+                              schur_vars, inst)
+        return inst
+
+    def _factorized(self, a, schur_vars=None):
+        a = a.tocoo()
+        inst = self._analyzed(a, schur_vars)
+        ooc = self.ooc
+        if ooc == 'auto':
+            ooc = inst.analysis_stats.est_mem_incore > self.memory_limit
+        inst.factor(a, ordering=self.ordering, reuse_analysis=True, ooc=ooc,
+                    ooc_dir=self.ooc_dir or None,
+                    memory_limit=self.memory_limit or None)
         return inst
 
+    def _solve_block(self, a, b, kept_vars):
+        if not self.schur_complement:
+            return super()._solve_block(a, b, kept_vars)
+
+        # Only the variables in which the right hand side is nonzero and the
+        # kept ones (both belong to the lead interfaces) take part in the
+        # solve: if `b` vanishes outside of `schur_vars`, then the solution
+        # restricted to `schur_vars` is given by the Schur complement.
+        schur_vars = np.union1d(kept_vars, b.tocoo().row)
+        try:
+            factorized_a = self._factorized(a, schur_vars)
+        except mumps.MUMPSError as error:
+            if error.error not in _SINGULAR:
+                raise
+            # The matrix is singular when restricted to the other variables.
+            return super()._solve_block(a, b, kept_vars)
+        try:
+            sol = np.linalg.solve(factorized_a.schur,
+                                  b.tocsr()[schur_vars].toarray())
+        finally:
+            self._release_factorized(factorized_a)
+        return sol[np.searchsorted(schur_vars, kept_vars)]
+
+    def analyze(self, sys, energy=0, args=(), check_hermiticity=True,
+                realspace=False, *, params=None):
+        """
+        Estimate the resources needed to factorize the linear system.
+
+        Only the analysis phase of MUMPS is performed, so this is much cheaper
+        than a solve.  If `reuse_analysis` is enabled, the analysis is reused
+        by a subsequent solve with the same structure of the linear system.
+
+        Parameters
+        ----------
+        sys : `kwant.system.FiniteSystem`
+            Low level system, containing the leads and the Hamiltonian of a
+            scattering region.
+        energy : number
+            Excitation energy at which to solve the scattering problem.
+        args : tuple, defaults to empty
+            Positional arguments to pass to the ``hamiltonian`` method.
+            Mutually exclusive with 'params'.
+        check_hermiticity : ``bool``
+            Check if the Hamiltonian matrices are Hermitian.
+        realspace : ``bool``
+            Analyze the linear system as set up by `greens_function` (i.e. with
+            lead self-energies) instead of the one of `smatrix`,
+            `wave_function` and `ldos`.
+        params : dict, optional
+            Dictionary of parameter names and their values. Mutually exclusive
+            with 'args'.
+
+        Returns
+        -------
+        stats : `~kwant.linalg.mumps.AnalysisStatistics`
+            The MUMPS estimates, in particular the memory in megabytes needed
+            for an in-core (``est_mem_incore``) and an out-of-core
+            (``est_mem_ooc``) factorization.
+        """
+        linsys = self._make_linear_sys(sys, [], energy, args,
+                                       check_hermiticity, realspace,
+                                       params=params)[0]
+        return self._analyzed(linsys.lhs.tocoo()).analysis_stats
+
+    def _keep_factorized(self, factorized_a):
+        if self._analysis is not None and self._analysis[5] is factorized_a:
+            self._analysis = None
+
+    def _release_factorized(self, factorized_a):
+        # Only the analysis is needed for recycling, but the factors can be
+        # huge.  If MUMPS cannot free them alone, the context is dropped.
+        if self._analysis is not None and self._analysis[5] is factorized_a:
+            if not factorized_a.free_factors():
+                self._analysis = None
+
     def _solve_linear_sys(self, factorized_a, b, kept_vars):
         if b.shape[1] == 0:
             return b[kept_vars]
@@ -126,6 +326,10 @@ default_solver = Solver()
 smatrix = default_solver.smatrix
 greens_function = default_solver.greens_function
 ldos = default_solver.ldos
+smatrix_sweep = default_solver.smatrix_sweep
+greens_function_sweep = default_solver.greens_function_sweep
+ldos_sweep = default_solver.ldos_sweep
 wave_function = default_solver.wave_function
 options = default_solver.options
+analyze = default_solver.analyze
 reset_options = default_solver.reset_options
@@ -0,0 +1,210 @@
+# Copyright 2011-2017 Kwant authors.
+#
+# This file is part of Kwant.  It is subject to the license terms in the file
+# LICENSE.rst found in the top-level directory of this distribution and at
+# http://kwant-project.org/license.  A list of Kwant authors can be found in
+# the file AUTHORS.rst at the top-level directory of this distribution and at
+# http://kwant-project.org/authors.
+
+"""Parallel evaluation of solver functions over many energies/parameters."""
+
+__all__ = ['SweepExecutor', 'sweep']
+
+import os
+import pickle
+import multiprocessing
+from contextlib import contextmanager
+from numbers import Number
+
+try:
+    import threadpoolctl
+except ImportError:
+    threadpoolctl = None
+
+from .. import system
+from .._common import ensure_isinstance
+
+# Environment variables that set the size of the thread pools of the common
+# BLAS/OpenMP implementations.
+_thread_env_vars = ['OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS',
+                    'MKL_NUM_THREADS', 'VECLIB_MAXIMUM_THREADS',
+                    'NUMEXPR_NUM_THREADS']
+
+
+@contextmanager
+def _thread_env(threads):
+    """Temporarily set the BLAS/OpenMP thread environment variables."""
+    if threads is None:
+        yield
+        return
+    saved = {var: os.environ.get(var) for var in _thread_env_vars}
+    try:
+        for var in _thread_env_vars:
+            os.environ[var] = str(threads)
+        yield
+    finally:
+        for var, value in saved.items():
+            if value is None:
+                del os.environ[var]
+            else:
+                os.environ[var] = value
+
+
+# State of a worker process.  It is set once by `_init_worker`.
+_worker_syst = None
+_worker_limits = None
+# The functions unpickled by a worker process, by their pickled form.  Keeping
+# them alive allows solvers to reuse state (e.g. the MUMPS analysis) across
+# chunks and calls of `SweepExecutor.map`.
+_worker_funcs = {}
+
+
+def _init_worker(syst, threads):
+    global _worker_syst, _worker_limits
+    _worker_syst = syst
+    if threads is not None and threadpoolctl is not None:
+        # Libraries that have been loaded before the environment variables
+        # were set (e.g. when the worker was forked) can only be limited at
+        # runtime.
+        _worker_limits = threadpoolctl.threadpool_limits(threads)
+
+
+def _evaluate(task):
+    pickled_func, energy, params = task
+    func = _worker_funcs.get(pickled_func)
+    if func is None:
+        func = _worker_funcs[pickled_func] = pickle.loads(pickled_func)
+    return func(_worker_syst, energy, params=params)
+
+
+def _tasks(func, points):
+    # All the tasks share the same bytes object, which is therefore pickled
+    # only once per chunk.
+    pickled_func = pickle.dumps(func)
+    for point in points:
+        if isinstance(point, Number):
+            energy, params = point, None
+        else:
+            energy, params = point
+        yield pickled_func, energy, params
+
+
+class SweepExecutor:
+    """Evaluate solver functions for many points using a pool of processes.
+
+    The system is transferred to each worker process only once, when the
+    worker is started: with the 'fork' start method it is inherited, otherwise
+    it is pickled once per worker.  Subsequently, only the points and the
+    results are communicated.
+
+    The function passed to `map` is unpickled only once by each worker and
+    then kept, such that it can carry state from one chunk of points to the
+    next, and to later calls of `map` with the same function.  In particular,
+    for the bound methods of a solver (like `kwant.smatrix`), each worker
+    keeps a single copy of the solver, which reuses the MUMPS analysis for
+    all the points that it evaluates.  A function that pickles differently
+    (e.g. because the options of the solver have been changed meanwhile) is
+    treated as a new function.
+
+    Parameters
+    ----------
+    syst : `kwant.system.FiniteSystem`
+        The finalized system that is passed to the solver functions.
+    processes : int, optional
+        Number of worker processes.  Defaults to the number of CPUs.
+    threads : int or ``None``, optional
+        Maximal number of threads that BLAS and OpenMP (used e.g. by MUMPS)
+        may use in each worker process.  The default of 1 avoids
+        oversubscription of the CPUs.  If ``None``, no limit is imposed.
+    start_method : string, optional
+        The `multiprocessing` start method to use for the workers, e.g.
+        'fork', 'forkserver' or 'spawn'.  Defaults to the platform default.
+
+    Notes
+    -----
+    The thread limit is enforced through the usual environment variables
+    (``OMP_NUM_THREADS`` etc.), which are only honored by libraries loaded
+    after the worker has started, i.e. with the 'forkserver' and 'spawn' start
+    methods.  If the package ``threadpoolctl`` is installed, the limit is also
+    imposed at runtime and is then effective with any start method.
+
+    A `SweepExecutor` can be used as a context manager, which shuts the
+    worker processes down on exit.
+
+    Examples
+    --------
+    >>> with SweepExecutor(fsyst, processes=4) as executor:
+    ...     smatrices = list(executor.map(kwant.smatrix, energies))
+    """
+
+    def __init__(self, syst, processes=None, threads=1, start_method=None):
+        ensure_isinstance(syst, system.System)
+        if threads is not None:
+            threads = int(threads)
+            if threads < 1:
+                raise ValueError("threads must be a positive integer "
+                                 "or None.")
+        context = multiprocessing.get_context(start_method)
+        with _thread_env(threads):
+            self._pool = context.Pool(processes, _init_worker,
+                                      (syst, threads))
+
+    def map(self, func, points, chunksize=1):
+        """Evaluate ``func(syst, energy, params=params)`` for each point.
+
+        Parameters
+        ----------
+        func : callable
+            A picklable function, e.g. `kwant.smatrix`, `kwant.ldos`, or a
+            function defined at the top level of a module.  It is called as
+            ``func(syst, energy, params=params)`` and its return value must be
+            picklable.
+        points : iterable
+            Each point is either an energy, or a pair ``(energy, params)``,
+            where ``params`` is a dictionary of parameters or ``None``.
+        chunksize : int, optional
+            Number of points that are sent to a worker at once.  Larger chunks
+            reduce the communication overhead for cheap evaluations.
+
+        Returns
+        -------
+        results : iterator
+            The results of ``func``, in the order of `points`.  They are
+            available as soon as they and all the preceding results have been
+            computed.
+        """
+        return self._pool.imap(_evaluate, _tasks(func, points), chunksize)
+
+    def close(self):
+        """Shut down the worker processes."""
+        self._pool.terminate()
+        self._pool.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def sweep(func, syst, points, processes=None, threads=1, chunksize=1,
+          start_method=None):
+    """Evaluate a solver function for many points in parallel.
+
+    This is a shortcut for ``list(SweepExecutor(syst, ...).map(func, points,
+    chunksize))``.  See `SweepExecutor` for a description of the parameters.
+
+    Returns
+    -------
+    results : list
+        The results of ``func``, in the order of `points`.
+
+    Examples
+    --------
+    >>> energies = np.linspace(0, 1, 1000)
+    >>> smatrices = sweep(kwant.smatrix, fsyst, energies, chunksize=10)
+    >>> points = [(0.5, dict(V=V)) for V in np.linspace(0, 1, 100)]
+    >>> ldoses = sweep(kwant.ldos, fsyst, points)
+    """
+    with SweepExecutor(syst, processes, threads, start_method) as executor:
+        return list(executor.map(func, points, chunksize))
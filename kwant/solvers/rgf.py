@@ -0,0 +1,243 @@
+# Copyright 2011-2017 Kwant authors.
+#
+# This file is part of Kwant.  It is subject to the license terms in the file
+# LICENSE.rst found in the top-level directory of this distribution and at
+# http://kwant-project.org/license.  A list of Kwant authors can be found in
+# the file AUTHORS.rst at the top-level directory of this distribution and at
+# http://kwant-project.org/authors.
+
+"""Recursive Green's function solver."""
+
+__all__ = ['smatrix', 'greens_function', 'ldos', 'wave_function',
+           'smatrix_sweep', 'greens_function_sweep', 'ldos_sweep', 'Solver']
+
+import warnings
+from collections import namedtuple
+import numpy as np
+import scipy.linalg as la
+from scipy.sparse import csgraph
+from . import common
+from ..graph import slicer
+
+# The left hand side of the linear system together with a partition of its
+# variables into slices: a list of arrays of variable indices, such that only
+# variables in the same or in neighboring slices are coupled.
+_SlicedMatrix = namedtuple('_SlicedMatrix', ['matrix', 'slices'])
+
+
+def _site_slices(syst):
+    """Return the number of the slice of each site of `syst`.
+
+    The first slice contains the interface of the first lead, the last slice
+    those of all the other leads.  If no such slicing exists, `None` is
+    returned.
+    """
+    num_sites = syst.graph.num_nodes
+    interfaces = [np.asarray(i, int) for i in syst.lead_interfaces]
+    if len(interfaces) < 2 or not all(len(i) for i in interfaces):
+        return None
+    slices = slicer.slice(syst.graph, interfaces[0],
+                          np.concatenate(interfaces[1:]))
+    site_slice = np.full(num_sites, -1, int)
+    for i, slc in enumerate(slices):
+        site_slice[np.asarray(slc, int)] = i
+    if np.any(site_slice < 0):
+        return None
+    return site_slice
+
+
+def _variable_slices(syst, lhs, norb):
+    """Partition the variables of the linear system `lhs` into slices.
+
+    The variables of the scattering region belong to the slice of their site.
+    The additional variables of each lead belong to the slice of its
+    interface.  If no such partition exists, a `RuntimeWarning` is emitted and
+    all the variables are put into a single slice.
+    """
+    num_orb = np.sum(norb)
+    var_slice = np.empty(lhs.shape[0], int)
+    site_slice = _site_slices(syst)
+    if site_slice is None:
+        return _single_slice(lhs, 'the system needs at least two leads, '
+                             'and the interfaces of the other leads must be '
+                             'separated from that of the first one')
+    var_slice[:num_orb] = np.repeat(site_slice, norb)
+
+    coupled = abs(lhs).tocsr()
+    coupled = coupled + coupled.T
+    if lhs.shape[0] > num_orb:
+        # The lead variables are grouped into connected components (one for
+        # each lead), which inherit the slice of the orbitals they couple to.
+        n_comps, comps = csgraph.connected_components(
+            coupled[num_orb:, num_orb:], directed=False)
+        comp_slice = np.zeros(n_comps, int)
+        lead_orb = coupled[num_orb:, :num_orb].tocoo()
+        comp_slice[comps[lead_orb.row]] = var_slice[lead_orb.col]
+        var_slice[num_orb:] = comp_slice[comps]
+
+    # Verify that only neighboring slices are coupled.
+    coupled = coupled.tocoo()
+    if np.any(abs(var_slice[coupled.row] - var_slice[coupled.col]) > 1):
+        return _single_slice(lhs, 'the leads couple to non-neighboring slices')
+
+    # Number the slices consecutively from zero.
+    _, var_slice = np.unique(var_slice, return_inverse=True)
+    order = np.argsort(var_slice, kind='mergesort')
+    bounds = np.cumsum(np.bincount(var_slice))[:-1]
+    return np.split(order, bounds)
+
+
+def _single_slice(lhs, reason):
+    warnings.warn('The system cannot be sliced ({}), so it is solved as a '
+                  'single dense block of size {}.  Use the default solver '
+                  'instead.'.format(reason, lhs.shape[0]),
+                  RuntimeWarning)
+    return [np.arange(lhs.shape[0])]
+
+
+def _block(a, rows, cols):
+    """Return the dense block of the CSR matrix `a`."""
+    return a[rows][:, cols].toarray()
+
+
+class _BlockTridiagonalLU:
+    """LU decomposition of a block tridiagonal matrix.
+
+    The matrix is given as a `_SlicedMatrix`.  The decomposition is computed
+    slice by slice: Only the factorization of the diagonal blocks of the
+    Schur complements and the off-diagonal blocks are stored.
+    """
+
+    def __init__(self, sliced):
+        a, slices = sliced.matrix.tocsr(), sliced.slices
+        self.shape = a.shape
+        self.slices = slices
+        self.lus, self.lower, self.upper = [], [], []
+        for k, slc in enumerate(slices):
+            diag = _block(a, slc, slc)
+            if k:
+                lower = _block(a, slc, slices[k - 1])
+                diag -= lower.dot(la.lu_solve(self.lus[-1], self.upper[-1]))
+                self.lower.append(lower)
+            if k + 1 < len(slices):
+                self.upper.append(_block(a, slc, slices[k + 1]))
+            self.lus.append(la.lu_factor(diag))
+
+    def solve(self, b):
+        """Solve for the dense right hand side `b`."""
+        slices = self.slices
+        ys = []
+        for k, slc in enumerate(slices):
+            y = b[slc]
+            if k:
+                y = y - self.lower[k - 1].dot(la.lu_solve(self.lus[k - 1],
+                                                          ys[-1]))
+            ys.append(y)
+        x = np.empty(b.shape, complex)
+        for k in reversed(range(len(slices))):
+            y = ys[k]
+            if k + 1 < len(slices):
+                y = y - self.upper[k].dot(x[slices[k + 1]])
+            x[slices[k]] = la.lu_solve(self.lus[k], y)
+        return x
+
+
+class Solver(common.SparseSolver):
+    """Recursive Green's function (RGF) solver.
+
+    The scattering region is cut into slices (using `kwant.graph.slicer`)
+    between the interface of the first lead and those of all other leads,
+    such that only neighboring slices are coupled.  The linear system is then
+    solved by sweeping through the slices.  For quasi one-dimensional systems,
+    the computational cost is proportional to the length, and scattering
+    matrices and Green's functions between leads are computed with memory
+    proportional to the square of the width only.
+
+    RGF is not expected to be faster than the default solver: the sparse
+    direct solvers scale linearly with the length of a wire as well, with a
+    smaller prefactor (see ``benchmarks/rgf_vs_default.py``).  It only pays
+    off when the peak memory matters, i.e. for long wires with a wide cross
+    section, and when only the scattering matrix or the Green's function
+    between leads is needed.  Wave functions and the local density of states
+    require the factorization of all the slices to be kept.
+
+    The slicing requires at least two leads, and fails if leads other than
+    the first one are attached close to the first one.  Then a
+    `RuntimeWarning` is emitted, all the sites are put into a single slice,
+    and the linear system is solved as a dense matrix, which is only feasible
+    for small systems.
+    """
+
+    lhsformat = 'csr'
+    rhsformat = 'csc'
+    nrhs = 32
+
+    def _make_linear_sys(self, sys, in_leads, energy=0, args=(),
+                         check_hermiticity=True, realspace=False,
+                         *, params=None, hamiltonian=None):
+        if hamiltonian is None:
+            hamiltonian = self._hamiltonian(sys, args, check_hermiticity,
+                                            params=params)
+        linsys, lead_info = super()._make_linear_sys(
+            sys, in_leads, energy, args, check_hermiticity, realspace,
+            params=params, hamiltonian=hamiltonian)
+        slices = _variable_slices(sys, linsys.lhs, hamiltonian[1])
+        return (linsys._replace(lhs=_SlicedMatrix(linsys.lhs, slices)),
+                lead_info)
+
+    def _factorized(self, a):
+        return _BlockTridiagonalLU(a)
+
+    def _solve_linear_sys(self, factorized_a, b, kept_vars):
+        if b.shape[1] == 0:
+            return b[kept_vars]
+        return factorized_a.solve(b.toarray())[kept_vars]
+
+    def _solve_block(self, a, b, kept_vars):
+        matrix, slices = a.matrix.tocsr(), a.slices
+        first, last = slices[0], slices[-1]
+        is_end = np.zeros(matrix.shape[0], bool)
+        is_end[first] = is_end[last] = True
+        if not (np.all(is_end[kept_vars]) and np.all(is_end[b.tocoo().row])):
+            return super()._solve_block(a, b, kept_vars)
+
+        # Eliminate the inner slices one by one, starting from the first.
+        # After eliminating the slices up to k - 1, the first slice and slice
+        # k are coupled by `upper` and `lower`, and `diag` and `diag_k` are
+        # the diagonal blocks of the Schur complement.
+        diag = _block(matrix, first, first)
+        if len(slices) > 1:
+            upper = _block(matrix, first, slices[1])
+            lower = _block(matrix, slices[1], first)
+            diag_k = _block(matrix, slices[1], slices[1])
+        for k in range(1, len(slices) - 1):
+            lu = la.lu_factor(diag_k)
+            next_upper = _block(matrix, slices[k], slices[k + 1])
+            next_lower = _block(matrix, slices[k + 1], slices[k])
+            x_lower = la.lu_solve(lu, lower)
+            x_upper = la.lu_solve(lu, next_upper)
+            diag -= upper.dot(x_lower)
+            upper, lower = -upper.dot(x_upper), -next_lower.dot(x_lower)
+            diag_k = (_block(matrix, slices[k + 1], slices[k + 1]) -
+                      next_lower.dot(x_upper))
+
+        if len(slices) > 1:
+            schur = np.bmat([[diag, upper], [lower, diag_k]]).A
+            schur_vars = np.concatenate([first, last])
+        else:
+            schur, schur_vars = diag, first
+        position = np.empty(matrix.shape[0], int)
+        position[schur_vars] = np.arange(len(schur_vars))
+        sol = la.solve(schur, b.tocsr()[schur_vars].toarray())
+        return sol[position[kept_vars]]
+
+
+default_solver = Solver()
+
+smatrix = default_solver.smatrix
+greens_function = default_solver.greens_function
+ldos = default_solver.ldos
+smatrix_sweep = default_solver.smatrix_sweep
+greens_function_sweep = default_solver.greens_function_sweep
+ldos_sweep = default_solver.ldos_sweep
+wave_function = default_solver.wave_function
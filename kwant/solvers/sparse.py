@@ -6,7 +6,8 @@
 # the file AUTHORS.rst at the top-level directory of this distribution and at
 # http://kwant-project.org/authors.
 
-__all__ = ['smatrix', 'greens_function', 'ldos', 'wave_function', 'Solver']
+__all__ = ['smatrix', 'greens_function', 'ldos', 'wave_function',
+           'smatrix_sweep', 'greens_function_sweep', 'ldos_sweep', 'Solver']
 
 import numpy as np
 import scipy.sparse as sp
@@ -111,4 +112,7 @@ default_solver = Solver()
 smatrix = default_solver.smatrix
 greens_function = default_solver.greens_function
 ldos = default_solver.ldos
+smatrix_sweep = default_solver.smatrix_sweep
+greens_function_sweep = default_solver.greens_function_sweep
+ldos_sweep = default_solver.ldos_sweep
 wave_function = default_solver.wave_function
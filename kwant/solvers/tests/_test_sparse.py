@@ -539,3 +539,84 @@ def test_arg_passing(wave_function, ldos, smatrix):
     np.testing.assert_array_equal(
         smatrix(fsyst, args=args).data,
         smatrix(fsyst, params=params).data)
+
+
+def test_sweeps(smatrix, greens_function, ldos,
+                smatrix_sweep, greens_function_sweep, ldos_sweep):
+
+    def onsite(site, V):
+        return 4 + V * site.pos[1]
+
+    W = 3
+    L = 4
+
+    syst = kwant.Builder()
+    syst[(square(i, j) for i in range(L) for j in range(W))] = onsite
+    syst[square.neighbors()] = -1
+
+    lead = kwant.Builder(kwant.TranslationalSymmetry((-1, 0)))
+    lead[(square(0, j) for j in range(W))] = 4
+    lead[square.neighbors()] = -1
+
+    syst.attach_lead(lead)
+    syst.attach_lead(lead.reversed())
+    fsyst = syst.finalized()
+
+    # The number of propagating modes changes within the sweep.
+    energies = [0.5, 1, 1.5, 3, 1]
+    params = dict(V=0.3)
+
+    smats = smatrix_sweep(fsyst, energies, params=params, in_leads=[0])
+    assert not isinstance(smats, list)
+    smats = list(smats)
+    assert len(smats) == len(energies)
+    for energy, s in zip(energies, smats):
+        s2 = smatrix(fsyst, energy, params=params, in_leads=[0])
+        assert_almost_equal(s.data, s2.data)
+        assert s.num_propagating(0) == s2.num_propagating(0)
+
+    for energy, g in zip(energies, greens_function_sweep(fsyst, energies,
+                                                         args=(0.3,))):
+        assert_almost_equal(g.data,
+                            greens_function(fsyst, energy, args=(0.3,)).data)
+
+    ldoses = np.array(list(ldos_sweep(fsyst, energies, params=params)))
+    assert ldoses.shape == (len(energies), L * W)
+    for energy, ld in zip(energies, ldoses):
+        assert_almost_equal(ld, ldos(fsyst, energy, params=params))
+
+    assert list(smatrix_sweep(fsyst, [], params=params)) == []
+
+    # Errors are raised before any energy is requested.
+    raises(ValueError, smatrix_sweep, fsyst, energies, params=params,
+           in_leads=[])
+    syst[square(0, 0)] = 1j
+    fsyst = syst.finalized()
+    raises(ValueError, smatrix_sweep, fsyst, energies, params=params)
+    raises(NotImplementedError, ldos_sweep, fsyst, energies, params=params,
+           check_hermiticity=False)
+
+
+def test_hermiticity_check(smatrix, greens_function):
+    syst = kwant.Builder()
+    lead = kwant.Builder(kwant.TranslationalSymmetry((-1,)))
+    syst[(chain(i) for i in range(3))] = np.array([[1, 1j], [-1j, 2]])
+    syst[chain.neighbors()] = np.array([[-1, 0.2], [0.3j, -1]])
+    lead[chain(0)] = np.identity(2)
+    lead[chain.neighbors()] = -np.identity(2)
+    syst.attach_lead(lead)
+    syst.attach_lead(lead.reversed())
+
+    s = smatrix(syst.finalized(), 0.7)
+    assert_almost_equal(s.data.T.conj().dot(s.data),
+                        np.identity(s.data.shape[0]))
+    greens_function(syst.finalized(), 0.7)
+
+    # Only an onsite block can be non-Hermitian.
+    syst[chain(1)] = np.array([[1, 1], [0, 2]])
+    fsyst = syst.finalized()
+    raises(ValueError, smatrix, fsyst, 0.7)
+    raises(ValueError, greens_function, fsyst, 0.7)
+    smatrix(fsyst, 0.7, check_hermiticity=False)
+    syst[chain(1)] = np.array([[1, 0], [0, 2 + 1e-3j]])
+    raises(ValueError, smatrix, syst.finalized(), 0.7)
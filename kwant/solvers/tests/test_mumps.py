@@ -7,9 +7,13 @@
 # http://kwant-project.org/authors.
 
 import pytest
+import numpy as np
+from numpy.testing import assert_almost_equal
+import kwant
 try:
     from kwant.solvers.mumps import (
-        smatrix, greens_function, ldos, wave_function, options, reset_options)
+        smatrix, greens_function, ldos, wave_function, options, reset_options,
+        smatrix_sweep, greens_function_sweep, ldos_sweep, analyze)
     from . import _test_sparse
     no_mumps = False
 except ImportError:
@@ -22,7 +26,10 @@ opt_list=[{},
           {'nrhs' : 10},
           {'nrhs' : 1, 'ordering' : 'amd'},
           {'nrhs' : 10, 'sparse_rhs' : True},
-          {'nrhs' : 2, 'ordering' : 'amd', 'sparse_rhs' : True}]
+          {'nrhs' : 2, 'ordering' : 'amd', 'sparse_rhs' : True},
+          {'reuse_analysis' : False},
+          {'ooc' : True},
+          {'schur_complement' : True}]
 
 
 def test_output():
@@ -116,3 +123,141 @@ def test_wavefunc_ldos_consistency():
 
 def test_arg_passing():
     _test_sparse.test_arg_passing(wave_function, ldos, smatrix)
+
+
+def test_sweeps():
+    for opts in opt_list:
+        reset_options()
+        options(**opts)
+        _test_sparse.test_sweeps(smatrix, greens_function, ldos,
+                                 smatrix_sweep, greens_function_sweep,
+                                 ldos_sweep)
+
+
+def test_hermiticity_check():
+    for opts in opt_list:
+        reset_options()
+        options(**opts)
+        _test_sparse.test_hermiticity_check(smatrix, greens_function)
+
+
+def test_reuse_analysis():
+    lat = kwant.lattice.square()
+    syst = kwant.Builder()
+    syst[(lat(x, y) for x in range(5) for y in range(3))] = 4
+    syst[lat.neighbors()] = -1
+    lead = kwant.Builder(kwant.TranslationalSymmetry((-1, 0)))
+    lead[(lat(0, y) for y in range(3))] = 4
+    lead[lat.neighbors()] = -1
+    syst.attach_lead(lead)
+    syst.attach_lead(lead.reversed())
+    syst = syst.finalized()
+
+    # The number of modes, and hence the structure of the linear system,
+    # changes between some of these energies.
+    energies = [0.5, 0.6, 1.5, 1.6, 0.7]
+    reset_options()
+    options(reuse_analysis=False)
+    expected = [smatrix(syst, energy).data for energy in energies]
+    expected_wf = wave_function(syst, 0.5)(0)
+
+    options(reuse_analysis=True)
+    for energy, data in zip(energies, expected):
+        assert_almost_equal(smatrix(syst, energy).data, data)
+
+    # The factors are not kept after a solve, only the analysis.
+    solver = kwant.solvers.mumps.default_solver
+    for solve in [smatrix, greens_function, ldos]:
+        solve(syst, 0.5)
+        assert solver._analysis is None or not solver._analysis[5].factored
+
+    # Wave functions keep using their factorization.
+    wf = wave_function(syst, 0.5)
+    smatrix(syst, 0.6)
+    assert wf.factorized_h.factored
+    assert_almost_equal(wf(0), expected_wf)
+    reset_options()
+
+
+def test_out_of_core(tmpdir):
+    lat = kwant.lattice.square()
+    syst = kwant.Builder()
+    syst[(lat(x, y) for x in range(6) for y in range(4))] = 4
+    syst[lat.neighbors()] = -1
+    lead = kwant.Builder(kwant.TranslationalSymmetry((-1, 0)))
+    lead[(lat(0, y) for y in range(4))] = 4
+    lead[lat.neighbors()] = -1
+    syst.attach_lead(lead)
+    syst.attach_lead(lead.reversed())
+    syst = syst.finalized()
+
+    reset_options()
+    expected = smatrix(syst, 1).data
+    stats = analyze(syst, 1)
+    assert stats.est_mem_incore > 0
+    assert stats.est_mem_ooc > 0
+    assert analyze(syst, 1, realspace=True).est_mem_incore > 0
+
+    options(ooc=True, ooc_dir=str(tmpdir))
+    assert_almost_equal(smatrix(syst, 1).data, expected)
+    options(ooc='auto', memory_limit=100 * stats.est_mem_incore)
+    assert_almost_equal(smatrix(syst, 1).data, expected)
+
+    reset_options()
+    with pytest.raises(ValueError):
+        options(ooc='auto')
+    with pytest.raises(ValueError):
+        options(memory_limit=-1)
+    old = options(ooc='auto', memory_limit=10)
+    assert old['ooc'] is False and old['memory_limit'] == 0
+    reset_options()
+
+
+def test_schur_complement(tmpdir):
+    lat = kwant.lattice.square()
+    syst = kwant.Builder()
+    syst[(lat(x, y) for x in range(8) for y in range(5))] = 4
+    syst[lat.neighbors()] = -1
+    lead = kwant.Builder(kwant.TranslationalSymmetry((-1, 0)))
+    lead[(lat(0, y) for y in range(5))] = 4
+    lead[lat.neighbors()] = -1
+    syst.attach_lead(lead)
+    syst.attach_lead(lead.reversed())
+    fsyst = syst.finalized()
+
+    reset_options()
+    expected_s = smatrix(fsyst, 1.5).data
+    expected_g = greens_function(fsyst, 1.5, in_leads=[0]).data
+    options(schur_complement=True)
+    assert_almost_equal(smatrix(fsyst, 1.5).data, expected_s)
+    assert_almost_equal(greens_function(fsyst, 1.5, in_leads=[0]).data,
+                        expected_g)
+
+    # The analysis is reused, and the out-of-core options apply.
+    solver = kwant.solvers.mumps.default_solver
+    smatrix(fsyst, 1.5)
+    analysis = solver._analysis
+    assert_almost_equal(smatrix(fsyst, 1.5).data, expected_s)
+    if analysis is not None:
+        # MUMPS supports freeing the factors alone.
+        assert solver._analysis[5] is analysis[5]
+        assert not analysis[5].factored
+    options(ooc=True, ooc_dir=str(tmpdir))
+    assert_almost_equal(smatrix(fsyst, 1.5).data, expected_s)
+    options(ooc=False)
+
+    # The site in the middle is not coupled to the leads, and singular on its
+    # own at zero energy.
+    chain = kwant.lattice.chain()
+    syst = kwant.Builder()
+    syst[(chain(i) for i in range(3))] = 0
+    syst[chain.neighbors()] = -1
+    lead = kwant.Builder(kwant.TranslationalSymmetry((-1,)))
+    lead[chain(0)] = 0
+    lead[chain.neighbors()] = -1
+    syst.attach_lead(lead)
+    syst.attach_lead(lead.reversed())
+    fsyst = syst.finalized()
+    s = smatrix(fsyst).data
+    reset_options()
+    assert_almost_equal(s, smatrix(fsyst).data)
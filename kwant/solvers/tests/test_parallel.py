@@ -0,0 +1,91 @@
+# Copyright 2011-2017 Kwant authors.
+#
+# This file is part of Kwant.  It is subject to the license terms in the file
+# LICENSE.rst found in the top-level directory of this distribution and at
+# http://kwant-project.org/license.  A list of Kwant authors can be found in
+# the file AUTHORS.rst at the top-level directory of this distribution and at
+# http://kwant-project.org/authors.
+
+import os
+import numpy as np
+from numpy.testing import assert_almost_equal
+from pytest import raises
+import kwant
+from kwant.solvers import sparse
+from kwant.solvers.parallel import SweepExecutor, sweep
+
+
+def onsite(site, V):
+    return 4 + V
+
+
+def transmission(syst, energy, params=None):
+    return kwant.smatrix(syst, energy, params=params).transmission(1, 0)
+
+
+def thread_env(syst, energy, params=None):
+    return os.environ.get('OMP_NUM_THREADS')
+
+
+class Counter:
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self, syst, energy, params=None):
+        self.calls += 1
+        return self.calls
+
+
+def make_system():
+    lat = kwant.lattice.square()
+    syst = kwant.Builder()
+    syst[(lat(x, y) for x in range(4) for y in range(3))] = onsite
+    syst[lat.neighbors()] = -1
+    lead = kwant.Builder(kwant.TranslationalSymmetry((-1, 0)))
+    lead[(lat(0, y) for y in range(3))] = onsite
+    lead[lat.neighbors()] = -1
+    syst.attach_lead(lead)
+    syst.attach_lead(lead.reversed())
+    return syst.finalized()
+
+
+def test_sweep():
+    syst = make_system()
+    energies = np.linspace(0.1, 3, 13)
+    points = [(e, dict(V=V)) for e in energies for V in (0, 0.5)]
+    expected = [transmission(syst, e, p) for e, p in points]
+
+    for chunksize in (1, 5):
+        assert_almost_equal(sweep(transmission, syst, points, processes=2,
+                                  chunksize=chunksize),
+                            expected)
+
+    with SweepExecutor(syst, processes=2, threads=None) as executor:
+        smats = list(executor.map(sparse.smatrix, points[:4], 3))
+        ldoses = list(executor.map(sparse.ldos, points[:4]))
+        # Bare energies are accepted if no parameters are needed.
+        assert list(executor.map(thread_env, [0, 1])) == [
+            os.environ.get('OMP_NUM_THREADS')] * 2
+    for (e, p), s, ld in zip(points, smats, ldoses):
+        assert_almost_equal(s.data, sparse.smatrix(syst, e, params=p).data)
+        assert_almost_equal(ld, sparse.ldos(syst, e, params=p))
+
+    assert sweep(transmission, syst, [], processes=1) == []
+
+    # The function is kept by the worker across chunks and calls of `map`.
+    counter = Counter()
+    with SweepExecutor(syst, processes=1) as executor:
+        assert list(executor.map(counter, range(4))) == [1, 2, 3, 4]
+        assert list(executor.map(counter, range(2), 2)) == [5, 6]
+    assert counter.calls == 0
+
+
+def test_threads():
+    syst = make_system()
+    saved = os.environ.get('OMP_NUM_THREADS')
+    assert sweep(thread_env, syst, [0, 1], processes=1,
+                 threads=2) == ['2', '2']
+    assert os.environ.get('OMP_NUM_THREADS') == saved
+
+    raises(ValueError, SweepExecutor, syst, threads=0)
+    raises(TypeError, SweepExecutor, None)
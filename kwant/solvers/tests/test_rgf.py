@@ -0,0 +1,113 @@
+# Copyright 2011-2017 Kwant authors.
+#
+# This file is part of Kwant.  It is subject to the license terms in the file
+# LICENSE.rst found in the top-level directory of this distribution and at
+# http://kwant-project.org/license.  A list of Kwant authors can be found in
+# the file AUTHORS.rst at the top-level directory of this distribution and at
+# http://kwant-project.org/authors.
+
+import warnings
+import pytest
+import numpy as np
+from numpy.testing import assert_almost_equal
+import kwant
+from kwant.solvers import rgf, sparse
+from kwant.solvers.rgf import smatrix, greens_function, ldos, wave_function
+from kwant.solvers.rgf import (smatrix_sweep, greens_function_sweep,
+                               ldos_sweep)
+from . import _test_sparse
+
+def test_output():
+    _test_sparse.test_output(smatrix)
+
+
+def test_one_lead():
+    # A single lead cannot be sliced, the dense fallback must be reported.
+    with pytest.warns(RuntimeWarning, match='single dense block'):
+        _test_sparse.test_one_lead(smatrix)
+
+
+def test_smatrix_shape():
+    _test_sparse.test_smatrix_shape(smatrix)
+
+
+def test_two_equal_leads():
+    _test_sparse.test_two_equal_leads(smatrix)
+
+
+def test_graph_system():
+    _test_sparse.test_graph_system(smatrix)
+
+
+def test_singular_graph_system():
+    _test_sparse.test_singular_graph_system(smatrix)
+
+
+def test_tricky_singular_hopping():
+    _test_sparse.test_tricky_singular_hopping(smatrix)
+
+
+def test_many_leads():
+    _test_sparse.test_many_leads(greens_function, smatrix)
+
+
+def test_selfenergy():
+    _test_sparse.test_selfenergy(greens_function, smatrix)
+
+
+def test_selfenergy_reflection():
+    _test_sparse.test_selfenergy_reflection(greens_function, smatrix)
+
+
+def test_very_singular_leads():
+    _test_sparse.test_very_singular_leads(smatrix)
+
+
+def test_ldos():
+    _test_sparse.test_ldos(ldos)
+
+
+def test_wavefunc_ldos_consistency():
+    _test_sparse.test_wavefunc_ldos_consistency(wave_function, ldos)
+
+def test_arg_passing():
+    _test_sparse.test_arg_passing(wave_function, ldos, smatrix)
+
+
+def test_sweeps():
+    _test_sparse.test_sweeps(smatrix, greens_function, ldos, smatrix_sweep,
+                             greens_function_sweep, ldos_sweep)
+
+
+def test_hermiticity_check():
+    _test_sparse.test_hermiticity_check(smatrix, greens_function)
+
+
+def test_slicing():
+    W, L = 3, 30
+    lat = kwant.lattice.square(norbs=2)
+    syst = kwant.Builder()
+    syst[(lat(x, y) for x in range(L) for y in range(W))] = \
+        lambda site: np.diag([4 + 0.1 * site.pos[1], 4.5])
+    syst[lat.neighbors()] = np.array([[-1, 0.1j], [0.1j, -1]])
+    lead = kwant.Builder(kwant.TranslationalSymmetry((-1, 0)))
+    lead[(lat(0, y) for y in range(W))] = np.diag([4, 4.5])
+    lead[lat.neighbors()] = np.array([[-1, 0.1j], [0.1j, -1]])
+    syst.attach_lead(lead)
+    syst.attach_lead(lead.reversed())
+    fsyst = syst.finalized()
+
+    with warnings.catch_warnings():
+        warnings.simplefilter('error', RuntimeWarning)
+        linsys = rgf.default_solver._make_linear_sys(fsyst, [0], 1)[0]
+    assert len(linsys.lhs.slices) == L
+
+    for energy in [0.5, 1.2]:
+        assert_almost_equal(rgf.smatrix(fsyst, energy).data,
+                            sparse.smatrix(fsyst, energy).data)
+        assert_almost_equal(rgf.greens_function(fsyst, energy).data,
+                            sparse.greens_function(fsyst, energy).data)
+        assert_almost_equal(rgf.ldos(fsyst, energy),
+                            sparse.ldos(fsyst, energy))
+        assert_almost_equal(rgf.wave_function(fsyst, energy)(1),
+                            sparse.wave_function(fsyst, energy)(1))
@@ -7,6 +7,8 @@
 # http://kwant-project.org/authors.
 
 from  kwant.solvers.sparse import smatrix, greens_function, ldos, wave_function
+from kwant.solvers.sparse import (smatrix_sweep, greens_function_sweep,
+                                  ldos_sweep)
 from . import _test_sparse
 
 def test_output():
@@ -62,3 +64,12 @@ def test_wavefunc_ldos_consistency():
 
 def test_arg_passing():
     _test_sparse.test_arg_passing(wave_function, ldos, smatrix)
+
+
+def test_sweeps():
+    _test_sparse.test_sweeps(smatrix, greens_function, ldos, smatrix_sweep,
+                             greens_function_sweep, ldos_sweep)
+
+
+def test_hermiticity_check():
+    _test_sparse.test_hermiticity_check(smatrix, greens_function)
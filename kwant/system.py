@@ -12,6 +12,7 @@ __all__ = ['System', 'FiniteSystem', 'InfiniteSystem']
 
 import abc
 from copy import copy
+import scipy.sparse as sp
 from . import _system
 
 
@@ -219,15 +220,20 @@ class InfiniteSystem(System, metaclass=abc.ABCMeta):
         return self.hamiltonian_submatrix(args, cell_sites, interface_sites,
                                           sparse=sparse, params=params)
 
-    def modes(self, energy=0, args=(), *, params=None):
+    def modes(self, energy=0, args=(), *, params=None, method='dense',
+              evanescent_cutoff=10, threads=1):
         """Return mode decomposition of the lead
 
         See documentation of `~kwant.physics.PropagatingModes` and
         `~kwant.physics.StabilizedModes` for the return format details.
+        `method`, `evanescent_cutoff` and `threads` are passed to
+        `~kwant.physics.modes`; with ``method='sparse'`` the Hamiltonian is
+        never made dense.
         """
         from . import physics   # Putting this here avoids a circular import.
-        ham = self.cell_hamiltonian(args, params=params)
-        hop = self.inter_cell_hopping(args, params=params)
+        sparse = method == 'sparse'
+        ham = self.cell_hamiltonian(args, sparse=sparse, params=params)
+        hop = self.inter_cell_hopping(args, sparse=sparse, params=params)
         symmetries = self.discrete_symmetry(args, params=params)
         broken = symmetries.validate(ham)
         if broken is not None:
@@ -239,12 +245,18 @@ class InfiniteSystem(System, metaclass=abc.ABCMeta):
         assert len(shape) == 2
         assert shape[0] == shape[1]
         # Subtract energy from the diagonal.
-        ham.flat[::ham.shape[0] + 1] -= energy
+        if sparse:
+            ham = ham - energy * sp.identity(shape[0], format='csr')
+        else:
+            ham.flat[::ham.shape[0] + 1] -= energy
 
         # Particle-hole and chiral symmetries only apply at zero energy.
         if energy:
             symmetries.particle_hole = symmetries.chiral = None
-        return physics.modes(ham, hop, discrete_symmetry=symmetries)
+        return physics.modes(ham, hop, discrete_symmetry=symmetries,
+                             method=method,
+                             evanescent_cutoff=evanescent_cutoff,
+                             threads=threads)
 
     def selfenergy(self, energy=0, args=(), *, params=None):
         """Return self-energy of a lead.
@@ -1073,3 +1073,372 @@ def test_argument_passing():
         fsyst.hamiltonian_submatrix(params=params),
         expected_hamiltonian(**params)
     )
+
+
+def test_vectorized_value_functions():
+    lat = kwant.lattice.honeycomb(norbs=2)
+    a, b = lat.sublattices
+    sigma_z = np.array([[1, 0], [0, -1]])
+
+    def onsite(site, mu, B):
+        return (mu + site.pos[0]) * np.eye(2) + B * sigma_z
+
+    def hopping(site1, site2, t, B):
+        dy = site1.pos[1] - site2.pos[1]
+        return -t * np.eye(2) + 1j * B * dy * sigma_z
+
+    @builder.vectorized
+    def vec_onsite(sites, mu, B):
+        x = sites.positions[:, 0]
+        return ((mu + x)[:, None, None] * np.eye(2) + B * sigma_z)
+
+    @builder.vectorized
+    def vec_hopping(sites1, sites2, t, B):
+        dy = sites1.positions[:, 1] - sites2.positions[:, 1]
+        return -t * np.eye(2) + 1j * B * dy[:, None, None] * sigma_z
+
+    def make_system(onsite, hopping):
+        syst = kwant.Builder()
+        syst[lat.shape(lambda pos: np.linalg.norm(pos) < 4, (0, 0))] = onsite
+        syst[lat.neighbors()] = hopping
+        lead = kwant.Builder(kwant.TranslationalSymmetry(lat.vec((-1, 0))))
+        lead[lat.shape(lambda pos: abs(pos[1]) < 2, (0, 0))] = onsite
+        lead[lat.neighbors()] = hopping
+        syst.attach_lead(lead)
+        syst.attach_lead(lead.reversed())
+        return syst.finalized()
+
+    syst = make_system(onsite, hopping)
+    vec_syst = make_system(vec_onsite, vec_hopping)
+    assert syst.sites == vec_syst.sites
+
+    params = dict(mu=0.3, B=0.2, t=1)
+    args = (0.3, 0.2)
+    ham = syst.hamiltonian_submatrix(params=params)
+    for sparse in (False, True):
+        vec_ham = vec_syst.hamiltonian_submatrix(params=params, sparse=sparse)
+        if sparse:
+            vec_ham = vec_ham.toarray()
+        assert_almost_equal(ham, vec_ham)
+    sites = [0, 3, 5]
+    assert_almost_equal(
+        syst.hamiltonian_submatrix(params=params, to_sites=sites),
+        vec_syst.hamiltonian_submatrix(params=params, to_sites=sites))
+    for i, j in [(0, 0), next(iter(syst.graph))]:
+        assert_almost_equal(syst.hamiltonian(i, j, params=params),
+                            vec_syst.hamiltonian(i, j, params=params))
+
+    # Positional arguments
+    syst = make_system(lambda s, mu, t: mu, lambda s1, s2, mu, t: -t)
+    vec_syst = make_system(
+        builder.vectorized(lambda s, mu, t: np.full(len(s), mu)),
+        builder.vectorized(lambda s1, s2, mu, t: -t))
+    assert_almost_equal(
+        syst.hamiltonian_submatrix(args, sparse=True).toarray(),
+        vec_syst.hamiltonian_submatrix(args, sparse=True).toarray())
+
+    # The leads work as well.
+    syst = make_system(onsite, hopping)
+    vec_syst = make_system(vec_onsite, vec_hopping)
+    assert_almost_equal(
+        kwant.smatrix(syst, 0.5, params=params).data,
+        kwant.smatrix(vec_syst, 0.5, params=params).data)
+
+    # Wrong shapes
+    @builder.vectorized
+    def bad_onsite(sites):
+        return np.zeros((len(sites), 2, 3))
+
+    vec_syst = make_system(bad_onsite, 1)
+    raises(ValueError, vec_syst.hamiltonian_submatrix, sparse=True)
+    vec_syst = make_system(builder.vectorized(lambda s: np.zeros((2, 2))), 1)
+    raises(ValueError, vec_syst.hamiltonian_submatrix, sparse=True)
+    vec_syst = make_system(np.eye(2), builder.vectorized(lambda s1, s2: 1))
+    raises(ValueError, vec_syst.hamiltonian_submatrix, sparse=True)
+
+
+def test_lead_cache():
+    lat = kwant.lattice.square()
+    calls = []
+
+    def onsite(site, mu):
+        calls.append(mu)
+        return 4 - mu
+
+    def hopping(site1, site2, t, phi=0):
+        return -t * np.exp(1j * phi)
+
+    lead = kwant.Builder(kwant.TranslationalSymmetry((-1, 0)))
+    lead[(lat(0, y) for y in range(3))] = onsite
+    lead[lat.neighbors()] = hopping
+    flead = lead.finalized()
+    # The cache is disabled by default.
+    assert flead.cache_info() == (0, 0, 0, 0)
+    params = dict(mu=0.5, t=1, phi=0)
+    assert flead.modes(1, params=params) is not flead.modes(1, params=params)
+    flead.cache_size = 16
+    flead.clear_cache()
+
+    modes = flead.modes(1, params=params)
+    ncalls = len(calls)
+    # Cached results cannot be modified.
+    for array in (modes[0].wave_functions, modes[0].momenta, modes[1].vecs):
+        assert not array.flags.writeable
+    raises(ValueError, modes[0].momenta.__setitem__, 0, 0)
+    # Parameters that are not used by the lead do not matter.
+    assert flead.modes(1, params=dict(params, V=3)) is modes
+    assert flead.modes(1.0, params=dict(params, mu=np.float64(0.5))) is modes
+    assert len(calls) == ncalls
+    assert flead.cache_info() == (2, 1, 16, 1)
+
+    assert flead.modes(1, params=dict(params, phi=0.1)) is not modes
+    selfenergy = flead.selfenergy(1, params=params)
+    assert flead.selfenergy(1, params=params) is selfenergy
+    assert not selfenergy.flags.writeable
+    assert flead.modes(2, params=params) is not modes
+    assert flead.cache_info() == (3, 4, 16, 4)
+
+    # Array parameters are supported.
+    params['t'] = np.ones(1)
+    assert flead.modes(1, params=params) is flead.modes(1, params=params)
+    # Unhashable parameters are not cached.
+    class Unhashable(float):
+        __hash__ = None
+
+    params['mu'] = Unhashable(0.5)
+    assert flead.modes(1, params=params) is not flead.modes(1, params=params)
+    params['t'], params['mu'] = 1, 0.5
+
+    # Positional arguments are not cached for value functions.
+    assert flead.modes(1, (0.5,)) is not flead.modes(1, (0.5,))
+
+    # Missing parameters still raise errors.
+    raises(KeyError, flead.modes, 1, params=dict(mu=0.5))
+
+    flead.cache_size = 1
+    assert flead.cache_info().currsize == 1
+    flead.modes(3, params=params)
+    assert flead.modes(3, params=params) is not modes
+    assert flead.modes(1, params=params) is not modes
+    flead.clear_cache()
+    assert flead.cache_info() == (0, 0, 1, 0)
+    flead.cache_size = 0
+    assert flead.modes(1, params=params) is not flead.modes(1, params=params)
+    assert flead.cache_info() == (0, 2, 0, 0)
+    raises(ValueError, setattr, flead, 'cache_size', -1)
+
+    # Value functions without parameters may be random, they are not cached.
+    rng = np.random.RandomState(1)
+    lead = kwant.Builder(kwant.TranslationalSymmetry((-1, 0)))
+    lead[(lat(0, y) for y in range(3))] = lambda site: 4 + rng.random_sample()
+    lead[lat.neighbors()] = hopping
+    flead = lead.finalized()
+    flead.cache_size = 16
+    selfenergy = flead.selfenergy(1, params=params)
+    assert flead.cache_info().currsize == 0
+    assert np.all(flead.selfenergy(1, params=params) != selfenergy)
+    assert selfenergy.flags.writeable
+
+    # Constant leads are cached, and the cache is used by the solvers.
+    syst = kwant.Builder()
+    syst[(lat(x, y) for x in range(2) for y in range(3))] = 4
+    syst[lat.neighbors()] = -1
+    lead = kwant.Builder(kwant.TranslationalSymmetry((-1, 0)))
+    lead[(lat(0, y) for y in range(3))] = 4
+    lead[lat.neighbors()] = -1
+    syst.attach_lead(lead)
+    fsyst = syst.finalized()
+    flead = fsyst.leads[0]
+    flead.cache_size = 16
+    assert flead.modes(1) is flead.modes(1)
+    s = kwant.smatrix(fsyst, 1)
+    assert s.lead_info[0] is flead.modes(1)[0]
+    assert_almost_equal(s.data, kwant.smatrix(fsyst, 1).data)
+
+    # Caches are pickled empty.
+    cache = pickle.loads(pickle.dumps(flead._cache))
+    assert cache.info() == (0, 0, 16, 0)
+
+
+def test_incremental_hamiltonian():
+    lat = kwant.lattice.general([(1, 0), (0, 1)], [(0, 0), (0.5, 0.5)],
+                                norbs=[1, 2])
+    a, b = lat.sublattices
+    calls = {'onsite_a': 0, 'onsite_b': 0, 'hopping': 0}
+
+    def onsite_a(site, V, salt=0):
+        calls['onsite_a'] += 1
+        return V * site.pos[0] + salt
+
+    def onsite_b(site, B):
+        calls['onsite_b'] += 1
+        return np.array([[1, B], [B, -1]])
+
+    def hopping(site1, site2, t):
+        calls['hopping'] += 1
+        return np.array([[t, 2j * t]])
+
+    @builder.vectorized
+    def vec_hopping(sites1, sites2, t, B):
+        return np.full(len(sites1), t + 1j * B)
+
+    syst = kwant.Builder()
+    syst[(a(x, y) for x in range(4) for y in range(3))] = onsite_a
+    syst[(b(x, y) for x in range(4) for y in range(3))] = onsite_b
+    syst[kwant.builder.HoppingKind((0, 0), a, b)] = hopping
+    syst[kwant.builder.HoppingKind((1, 0), a, a)] = vec_hopping
+    syst[kwant.builder.HoppingKind((0, 1), a, a)] = -1
+    syst[kwant.builder.HoppingKind((1, 0), b, b)] = 0.5 * np.eye(2)
+    syst = syst.finalized()
+    syst.cache_hamiltonian = True
+    all_sites = list(range(syst.graph.num_nodes))
+
+    def check(params, sparse=True):
+        ham = syst.hamiltonian_submatrix(params=params, sparse=sparse)
+        if sparse:
+            assert ham.format == "coo"
+            ham = ham.toarray()
+        saved_calls = calls.copy()
+        expected = syst.hamiltonian_submatrix(params=params,
+                                              to_sites=all_sites,
+                                              from_sites=all_sites)
+        calls.update(saved_calls)
+        assert_almost_equal(ham, expected)
+
+    params = dict(V=1, B=0.5, t=1.5, salt=np.zeros(1), unused=[])
+    check(params)
+    assert calls == {'onsite_a': 12, 'onsite_b': 12, 'hopping': 12}
+    check(params, sparse=False)
+    assert calls == {'onsite_a': 12, 'onsite_b': 12, 'hopping': 12}
+
+    # Only 'onsite_a' takes 'V'.
+    params['V'] = 2
+    check(params)
+    assert calls == {'onsite_a': 24, 'onsite_b': 12, 'hopping': 12}
+    # Arrays are compared by value.
+    params['salt'] = np.ones(1)
+    check(params)
+    params['salt'][0] = 0
+    check(params)
+    assert calls == {'onsite_a': 48, 'onsite_b': 12, 'hopping': 12}
+    # Unhashable parameters are always considered to have changed.
+    class Unhashable(float):
+        __hash__ = None
+
+    params['salt'] = Unhashable(0)
+    check(params)
+    check(params)
+    assert calls == {'onsite_a': 72, 'onsite_b': 12, 'hopping': 12}
+    params['salt'] = 0
+    params['B'] = 0
+    check(params)
+    assert calls == {'onsite_a': 84, 'onsite_b': 24, 'hopping': 12}
+    # Zero entries are not included.
+    ham = syst.hamiltonian_submatrix(params=params, sparse=True)
+    assert np.all(ham.data != 0)
+
+    # Without 'params', all value functions are evaluated every time.
+    ham = syst.hamiltonian_submatrix(params=params)
+    n = calls['onsite_a']
+    raises(TypeError, syst.hamiltonian_submatrix, (1,), params=params)
+    assert calls['onsite_a'] == n
+    args_syst = kwant.Builder()
+    args_syst[a(0, 0)] = lambda site, V: V
+    args_syst[a(1, 0)] = 1
+    args_syst[a(0, 0), a(1, 0)] = 2
+    args_syst = args_syst.finalized()
+    for V in [1, 2, 2]:
+        ham = args_syst.hamiltonian_submatrix((V,))
+        assert_almost_equal(ham, [[V, 2], [2, 1]])
+    assert_almost_equal(
+        args_syst.hamiltonian_submatrix(params=dict(V=3)), [[3, 2], [2, 1]])
+    assert_almost_equal(
+        args_syst.hamiltonian_submatrix((2,)), [[2, 2], [2, 1]])
+
+    # The cache can be disabled, and is not pickled.
+    params['V'] = 3
+    check(params)
+    assert syst._ham_cache is not None
+    assert syst.__getstate__()['_ham_cache'] is None
+    syst.cache_hamiltonian = False
+    assert not syst.cache_hamiltonian and syst._ham_cache is None
+    n = calls['onsite_a']
+    check(params)
+    check(params)
+    assert calls['onsite_a'] == n + 24
+    assert syst._ham_cache is None
+    syst.cache_hamiltonian = True
+
+    # Changing the number of orbitals invalidates the cache, shape mismatches
+    # are detected.
+    syst = kwant.Builder()
+    syst[a(0, 0)] = lambda site, n: np.eye(n)
+    syst[a(1, 0)] = 1
+    syst[a(0, 0), a(1, 0)] = 1
+    syst = syst.finalized()
+    syst.cache_hamiltonian = True
+    all_sites = [0, 1]
+    check(dict(n=1))
+    raises(ValueError, check, dict(n=2))
+    check(dict(n=1))
+    syst = kwant.Builder()
+    syst[a(0, 0)] = lambda site, n: np.ones((n, 1))
+    raises(ValueError, syst.finalized().hamiltonian_submatrix, params=dict(n=2))
+
+    # Errors in value functions
+    def bad(site, x):
+        raise RuntimeError()
+
+    syst = kwant.Builder()
+    syst[a(0, 0)] = bad
+    syst = syst.finalized()
+    raises(kwant.UserCodeError, syst.hamiltonian_submatrix, params=dict(x=1))
+    raises(KeyError, syst.hamiltonian_submatrix, params=dict(y=1))
+
+
+def test_cached_hamiltonian_random_onsite():
+    # Value functions without parameters may draw random numbers, they must
+    # be evaluated again even if the parameters did not change.
+    rng = np.random.RandomState(1)
+    lat = kwant.lattice.chain()
+    syst = kwant.Builder()
+    syst[(lat(x) for x in range(3))] = lambda site: rng.random_sample()
+    syst[lat(3)] = lambda site, t: t
+    syst[lat.neighbors()] = -1
+    syst = syst.finalized()
+    assert not syst.cache_hamiltonian
+
+    params = dict(t=1)
+    for cache in [False, True]:
+        syst.cache_hamiltonian = cache
+        hams = [syst.hamiltonian_submatrix(params=params) for _ in range(3)]
+        for ham in hams[1:]:
+            assert np.all(np.diag(ham)[:3] != np.diag(hams[0])[:3])
+            assert ham[3, 3] == 1
+
+
+def test_cached_hamiltonian_submatrix():
+    lat = kwant.lattice.square()
+    syst = kwant.Builder()
+    syst[(lat(x, y) for x in range(5) for y in range(4))] = 4
+    syst[lat.neighbors()] = -1
+    syst[lat(2, 2)] = lambda site, V: V
+    syst[lat(1, 1), lat(1, 2)] = lambda site1, site2, t: t
+    syst = syst.finalized()
+    syst.cache_hamiltonian = True
+    sites = list(range(syst.graph.num_nodes))
+
+    for params in [dict(V=1, t=2), dict(V=0, t=2), dict(V=0, t=0)]:
+        expected = syst.hamiltonian_submatrix(params=params)
+        for to_sites in [sites, None]:
+            ham = syst.hamiltonian_submatrix(params=params, sparse=True,
+                                             to_sites=to_sites,
+                                             from_sites=to_sites)
+            assert ham.format == 'coo'
+            assert_almost_equal(ham.toarray(), expected)
+            # Zero entries are not stored.
+            assert np.all(ham.data != 0)
+        # The returned matrix is a copy.
+        ham.data[:] = 100
+        assert_almost_equal(syst.hamiltonian_submatrix(params=params),
+                            expected)
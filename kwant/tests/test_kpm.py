@@ -11,10 +11,13 @@ from types import SimpleNamespace
 
 import pytest
 import numpy as np
+import scipy.linalg as la
 import scipy.sparse.linalg as sla
+from scipy.sparse import csr_matrix
 from scipy.integrate import simps
 
 import kwant
+from .. import kpm
 from ..kpm import _rescale
 from .._common import ensure_rng
 
@@ -43,6 +46,10 @@ def assert_allclose_sp(arr1, arr2):
     np.testing.assert_allclose(arr1, arr2, rtol=0., atol=TOL_SP)
 
 
+def assert_allclose_weak(arr1, arr2):
+    np.testing.assert_allclose(arr1, arr2, rtol=0., atol=TOL_WEAK)
+
+
 def make_spectrum(ham, p, operator=None, vector_factory=None, rng=None, params=None):
     """Create an instance of SpectralDensity class."""
     return SpectralDensity(
@@ -248,6 +255,52 @@ def test_bounds():
     # different algorithms are used so these arrays are equal up to TOL_SP
     assert_allclose_sp(sp1.densities, sp2.densities)
 
+def test_bounds_methods():
+    ham = kwant.rmt.gaussian(dim, rng=1)
+    eigvals = np.linalg.eigvalsh(ham)
+    width = eigvals[-1] - eigvals[0]
+    for method in ['gershgorin', 'lanczos', 'fast']:
+        sp = SpectralDensity(ham, bounds=method, rng=1)
+        lmin, lmax = sp.bounds
+        assert lmin < eigvals[0] and eigvals[-1] < lmax
+        if method != 'gershgorin':
+            assert lmax - lmin < 1.1 * width
+        # The spectral density is normalized to 1.
+        assert abs(sp.average() - 1) < 0.01
+    SpectralDensity(ham, rng=1)
+    gershgorin = kpm._gershgorin_bounds(csr_matrix(ham))
+    assert gershgorin[0] <= eigvals[0] and eigvals[-1] <= gershgorin[1]
+
+    # The Lanczos start vector is drawn from 'rng', not from numpy's global
+    # random state.
+    state = np.random.get_state()
+    bounds = [SpectralDensity(ham, bounds='lanczos', rng=2,
+                              vector_factory=lambda n: np.ones(n)).bounds
+              for _ in range(2)]
+    assert bounds[0] == bounds[1]
+    assert np.all(np.random.get_state()[1] == state[1])
+
+    with pytest.raises(ValueError):
+        SpectralDensity(ham, bounds='other')
+
+    # Lanczos runs that miss an extremal eigenvalue, because of a small
+    # overlap with the starting vector, are detected.  With this seed, the
+    # lowest eigenvalue has an overlap of 0.02 with 'v0'.
+    rng = ensure_rng(103)
+    ham = csr_matrix(kwant.rmt.gaussian(dim, rng=rng))
+    eigvals = np.linalg.eigvalsh(ham.toarray())
+    state = rng.get_state()
+    v0 = np.exp(2j * np.pi * rng.random_sample(dim))
+    assert kpm._lanczos_bounds(ham, 0.025, v0)[0] > eigvals[0]
+    assert not kpm._check_bounds(ham, *kpm._lanczos_bounds(ham, 0.025, v0),
+                                 0.025, v0)
+    for method in ['lanczos', 'fast']:
+        # The same start vector is drawn.
+        rng.set_state(state)
+        lmin, lmax = kpm._spectral_bounds(ham, method, 0.025, v0, rng)
+        assert lmin < eigvals[0] and eigvals[-1] < lmax
+
+
 def test_operator_user():
     """Check operator=None gives the same results as operator=np.identity(),
     with the same random vectors.
@@ -579,3 +632,188 @@ def test_rescale():
     test this is that the product gives a complex number in the unit circle."""
     eigvalues, eigvectors = np.linalg.eigh(ham)
     assert np.all(1 - np.abs(np.vdot(eigvectors, rescaled_eigvectors)) < TOL)
+
+
+def test_block_moments():
+    # All random vectors are advanced as one block; compare the moments
+    # with those of the Chebyshev recursion done vector by vector.
+    ham = kwant.rmt.gaussian(dim)
+    op = kwant.rmt.gaussian(dim)
+    for operator in [None, op, lambda bra, ket: np.vdot(bra, op.dot(ket))]:
+        spectrum = make_spectrum(ham, p, operator=operator, rng=1)
+        rescaled_ham = (ham - spectrum._b * np.identity(dim)) / spectrum._a
+        for vector, moments in zip(spectrum._rand_vect_list,
+                                   spectrum._moments_list):
+            alphas = [vector, rescaled_ham.dot(vector)]
+            while len(alphas) < p.num_moments:
+                alphas.append(2 * rescaled_ham.dot(alphas[-1]) - alphas[-2])
+            if operator is None:
+                expected = [np.vdot(vector, alpha) for alpha in alphas]
+            else:
+                expected = [np.vdot(vector, op.dot(alpha)) for alpha in alphas]
+            np.testing.assert_allclose(np.real(moments), np.real(expected),
+                                       atol=1e-8)
+
+
+def test_processes():
+    op = kwant.rmt.gaussian(dim)
+    for operator in [None, op]:
+        serial = make_spectrum(ham, p, operator=operator, rng=1)
+        spectrum = SpectralDensity(ham, operator=operator, rng=1,
+                                   num_moments=p.num_moments,
+                                   num_rand_vecs=p.num_rand_vecs,
+                                   processes=2)
+        assert_allclose(spectrum.densities, serial.densities)
+        serial.increase_accuracy(num_moments=2 * p.num_moments)
+        spectrum.increase_accuracy(num_moments=2 * p.num_moments)
+        assert_allclose(spectrum.densities, serial.densities)
+
+    with pytest.raises(ValueError):
+        SpectralDensity(ham, processes=0)
+
+
+def test_checkpoint(tmpdir):
+    filename = str(tmpdir.join('kpm.npz'))
+    spectrum = make_spectrum(ham, p, rng=1)
+    spectrum.save_checkpoint(filename)
+    restored = SpectralDensity(ham, checkpoint=filename, rng=2)
+    assert restored.num_moments == spectrum.num_moments
+    assert restored.num_rand_vecs == spectrum.num_rand_vecs
+    assert restored.bounds == spectrum.bounds
+    assert np.all(restored.densities == spectrum.densities)
+
+    # Continuing from the checkpoint is the same as continuing directly.
+    spectrum.increase_accuracy(num_moments=2 * p.num_moments)
+    restored.increase_accuracy(num_moments=2 * p.num_moments)
+    assert np.all(restored.densities == spectrum.densities)
+
+    restored.increase_accuracy(num_rand_vecs=2 * p.num_rand_vecs)
+    assert restored.num_rand_vecs == 2 * p.num_rand_vecs
+
+    with pytest.raises(ValueError):
+        SpectralDensity(kwant.rmt.gaussian(dim + 1), checkpoint=filename)
+
+
+def test_local_operator_without_callbacks():
+    syst = make_chain(r=dim)
+    rho = kwant.operator.Density(syst)
+    current = kwant.operator.Current(syst, sum=True)
+    for operator in [rho, current]:
+        # A wrapper hides that the operator is a local operator, such that
+        # it is called for each vector and moment.
+        wrapped = lambda bra, ket, op=operator.bind(): op(bra, ket)
+        fused = make_spectrum(syst, p, operator=operator, rng=1)
+        called = make_spectrum(syst, p, operator=wrapped, rng=1)
+        assert fused.densities.shape == called.densities.shape
+        assert_allclose(fused.densities, called.densities)
+
+
+def test_evolve():
+    ham = kwant.rmt.gaussian(dim, rng=1)
+    rng = ensure_rng(0)
+    vectors = rng.randn(dim, 3) + 1j * rng.randn(dim, 3)
+    times = [0, 0.5, 3, 20, 19]
+    states = list(kwant.kpm.evolve(ham, vectors, times))
+    assert len(states) == len(times)
+    for t, psi in zip(times, states):
+        assert np.allclose(psi, la.expm(-1j * ham * t).dot(vectors))
+
+    psi, = kwant.kpm.evolve(ham, vectors[:, 0], [2])
+    assert psi.shape == (dim,)
+    assert np.allclose(psi, la.expm(-2j * ham).dot(vectors[:, 0]))
+
+
+def _qwz_torus(L, m):
+    """Hamiltonian and velocities of the QWZ model on an L x L torus."""
+    sx = np.array([[0, 1], [1, 0]])
+    sy = np.array([[0, -1j], [1j, 0]])
+    sz = np.array([[1, 0], [0, -1]])
+    cell = lambda x, y: slice(2 * ((x % L) * L + y % L),
+                              2 * ((x % L) * L + y % L) + 2)
+    ham = np.zeros((2 * L**2, 2 * L**2), complex)
+    vx, vy = np.zeros_like(ham), np.zeros_like(ham)
+    for x in range(L):
+        for y in range(L):
+            ham[cell(x, y), cell(x, y)] = m * sz
+            for dx, dy, s in [(1, 0, sx), (0, 1, sy)]:
+                hop = (sz - 1j * s) / 2
+                to, fr = cell(x + dx, y + dy), cell(x, y)
+                for mat, d in [(ham, 1), (vx, -1j * dx), (vy, -1j * dy)]:
+                    mat[to, fr] += d * hop
+                    mat[fr, to] += np.conj(d) * hop.T.conj()
+    return ham, vx, vy
+
+
+def test_conductivity(monkeypatch):
+    L = 8
+    for m, chern in [(1, -1), (-1, 1), (3, 0)]:
+        ham, vx, vy = _qwz_torus(L, m)
+        sigma = kwant.kpm.Conductivity(ham, alpha=vx, beta=vy, rng=0,
+                                       num_moments=200, num_rand_vecs=10,
+                                       chunk_size=64)
+        # Hall conductance in units of e^2/h, in the gap.
+        assert abs(sigma(0) / L**2 * 2 * np.pi - chern) < 0.1
+        assert sigma([0, 0.1]).shape == (2,)
+        assert abs(sigma(0, temperature=0.01) - sigma(0)) < 1e-3
+
+    # Velocities obtained from the positions.
+    syst = make_chain(r=dim)
+    ham = syst.hamiltonian_submatrix()
+    x = np.diag([syst.pos(i)[0] for i in range(dim)])
+    sigma = kwant.kpm.Conductivity(syst, rng=0, bounds=(-2.1, 2.1))
+    sigma_v = kwant.kpm.Conductivity(ham, alpha=1j * (ham.dot(x) - x.dot(ham)),
+                                     beta=1j * (ham.dot(x) - x.dot(ham)),
+                                     rng=0, bounds=(-2.1, 2.1))
+    assert np.allclose(sigma.moments, sigma_v.moments)
+    assert_allclose(sigma(0.3), sigma_v(0.3))
+
+    # The number of kept Chebyshev vectors does not change the moments.  By
+    # default it is limited by the memory.
+    sigma = kwant.kpm.Conductivity(ham, alpha=x, beta=x, rng=0,
+                                   num_moments=20, chunk_size=3)
+    monkeypatch.setattr(kpm, '_chunk_memory', 7 * 16 * dim * 10)
+    sigma_default = kwant.kpm.Conductivity(ham, alpha=x, beta=x, rng=0,
+                                           num_moments=20)
+    assert np.allclose(sigma.moments, sigma_default.moments)
+    monkeypatch.setattr(kpm, '_chunk_memory', 0)
+    sigma_default = kwant.kpm.Conductivity(ham, alpha=x, beta=x, rng=0,
+                                           num_moments=20)
+    assert np.allclose(sigma.moments, sigma_default.moments)
+
+    with pytest.raises(ValueError):
+        kwant.kpm.Conductivity(ham, alpha='x')
+    with pytest.raises(ValueError):
+        kwant.kpm.Conductivity(syst, alpha='w')
+
+
+def test_real_and_single_precision():
+    ham = kwant.rmt.gaussian(dim, rng=1).real
+    op = kwant.rmt.gaussian(dim, rng=2)
+    for operator in [None, op]:
+        # Real Hamiltonians given as complex matrices are applied in real
+        # arithmetic, with the same result.
+        sp = SpectralDensity(ham, operator=operator, rng=1)
+        sp_complex = SpectralDensity(ham + 0j, operator=operator, rng=1)
+        assert sp_complex.ham.dtype == np.float64
+        # Force complex arithmetic.
+        sp_ref = SpectralDensity(ham + 1e-30j * np.eye(dim)[::-1],
+                                 operator=operator, rng=1)
+        assert sp_ref.ham.dtype == np.complex128
+        assert_allclose(sp_complex.densities, sp.densities)
+        assert_allclose(sp_ref.densities, sp.densities)
+
+        sp_single = SpectralDensity(ham, operator=operator, rng=1,
+                                    precision='single')
+        assert sp_single.ham.dtype == np.float32
+        assert_allclose_weak(sp_single.densities, sp.densities)
+        sp_single.increase_accuracy(num_moments=2 * sp_single.num_moments)
+        sp.increase_accuracy(num_moments=2 * sp.num_moments)
+        assert_allclose_weak(sp_single.densities, sp.densities)
+
+    sp_single = SpectralDensity(op, rng=1, precision='single')
+    assert sp_single.ham.dtype == np.complex64
+    assert_allclose_weak(sp_single.densities,
+                         SpectralDensity(op, rng=1).densities)
+
+    with pytest.raises(ValueError):
+        SpectralDensity(ham, precision='half')
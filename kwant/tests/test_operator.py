@@ -45,6 +45,24 @@ def _random_square_system(N, norbs=1):
     return lat, syst
 
 
+def _two_orbital_system(onsite=sigmaz + sigmax):
+    """Return a finalized 3x3 square system with two orbitals per site,
+    its number of orbitals and a random number generator."""
+    lat = kwant.lattice.square(norbs=2)
+    syst = kwant.Builder()
+    syst[(lat(i, j) for i in range(3) for j in range(3))] = onsite
+    syst[lat.neighbors()] = sigma0 + 1j * sigmay
+    fsyst = syst.finalized()
+    return fsyst, 2 * len(fsyst.sites), np.random.RandomState(0)
+
+
+# Operator onsite that takes a parameter, and a value for it.
+def _p_onsite(site, p):
+    return p * sigmaz + sigmay
+
+_p_params = dict(p=0.5)
+
+
 def _perfect_lead(N, norbs=1):
     lat = kwant.lattice.square(norbs=norbs)
     syst = kwant.Builder(kwant.TranslationalSymmetry((-1, 0)))
@@ -409,6 +427,79 @@ def test_tocoo():
     raises(ValueError, op.tocoo, [1])
 
 
+@pytest.mark.parametrize("A", opservables)
+def test_tocoo_act(A):
+    # The Hamiltonian takes the parameter as well.
+    fsyst, N, rng = _two_orbital_system(lambda site, p: p * sigmaz + sigmax)
+    kets = rng.randn(4, N) + 1j * rng.randn(4, N)
+    op = A(fsyst, _p_onsite)
+    matrix = op.tocoo(params=_p_params)
+    assert isinstance(matrix, coo_matrix)
+    assert np.allclose(matrix.dot(kets.T).T, op.act(kets, params=_p_params))
+
+    # The stacked form gives the matrix elements of each element of 'where'.
+    stacked, orbitals, offsets = op.tocoo(params=_p_params, stacked=True)
+    assert isinstance(stacked, coo_matrix)
+    assert stacked.shape == (len(orbitals), N)
+    assert offsets[-1] == len(orbitals)
+    bras = kets[::-1]
+    elements = np.add.reduceat(
+        bras.T[orbitals].conj() * stacked.dot(kets.T), offsets[:-1])
+    assert np.allclose(elements.T, op(bras, kets, params=_p_params))
+    summed = coo_matrix((stacked.data, (orbitals[stacked.row], stacked.col)),
+                        shape=(N, N))
+    assert np.allclose(summed.toarray(), matrix.toarray())
+
+    # The sparse representation is assembled once when binding.
+    bound = op.bind(params=_p_params)
+    assert bound._sparse_elements() is bound._sparse_elements()
+    assert np.allclose(bound.tocoo().toarray(), matrix.toarray())
+    raises(ValueError, bound.tocoo, params=_p_params)
+
+
+@pytest.mark.parametrize("A", opservables)
+def test_sparse_elements(A):
+    fsyst, N, rng = _two_orbital_system()
+    bra = rng.randn(N, 3) + 1j * rng.randn(N, 3)
+    ket = rng.randn(N, 3) + 1j * rng.randn(N, 3)
+    for op in [A(fsyst, sigmax), A(fsyst, _p_onsite).bind(params=_p_params)]:
+        index, matrix, reduce = op._sparse_elements()
+        elements = reduce.dot(bra[index].conj() * matrix.dot(ket))
+        for i in range(bra.shape[1]):
+            assert np.allclose(elements[:, i], op(bra[:, i], ket[:, i]))
+
+    op = A(fsyst, _p_onsite)
+    bound = op.bind(params=_p_params)
+    raises(ValueError, bound._sparse_elements, params=_p_params)
+    assert np.allclose(op._sparse_elements(params=_p_params)[1].toarray(),
+                       bound._sparse_elements()[1].toarray())
+
+
+@pytest.mark.parametrize("A", opservables)
+def test_many_wavefunctions(A):
+    fsyst, N, rng = _two_orbital_system()
+    bras = rng.randn(4, N) + 1j * rng.randn(4, N)
+    kets = rng.randn(4, N) + 1j * rng.randn(4, N)
+    for op in [A(fsyst, sigmax), A(fsyst, _p_onsite).bind(params=_p_params),
+               A(fsyst, sigmax, sum=True)]:
+        elements = [op(bra, ket) for bra, ket in zip(bras, kets)]
+        assert np.allclose(op(bras, kets), elements)
+        assert np.allclose(op(bras, kets, sum_vectors=True),
+                           np.sum(elements, axis=0))
+        expectations = op(kets)
+        assert expectations.dtype == np.float64
+        assert np.allclose(expectations, [op(ket) for ket in kets])
+        assert np.allclose(op(kets, sum_vectors=True),
+                           np.sum(expectations, axis=0))
+        assert np.allclose(op.act(kets), [op.act(ket) for ket in kets])
+
+    op = A(fsyst)
+    raises(ValueError, op, bras, kets[:2])
+    raises(ValueError, op, bras[:, :-1])
+    raises(ValueError, op, bras[None])
+    raises(ValueError, op.act, bras[None])
+
+
 @pytest.mark.parametrize("A", opservables)
 def test_arg_passing(A):
     lat1 = kwant.lattice.chain(norbs=1)